@@ -0,0 +1,195 @@
+"""
+accesscache - local cache of access file derivatives
+
+Access files are a function of the master file's contents and the
+ImageMagick settings used to make them, so they are stored under a key
+made from the master's SHA256, the geometry, the convert options, and
+imaging.CONVERT_VERSION (bump that when the convert pipeline changes).
+Re-running an import or reprocessing a failed batch copies the cached
+file instead of running ImageMagick again.
+
+>>> cache = accesscache.AccessCache('/var/cache/ddr/access', max_bytes=10*1024**3)
+>>> key = cache.key(sha256, config.ACCESS_FILE_GEOMETRY, config.ACCESS_FILE_OPTIONS)
+>>> if not cache.fetch(key, dest_path):
+...     imaging.thumbnail(src_path, dest_path, ...)
+...     cache.store(key, dest_path)
+>>> cache.stats
+{'hits': 0, 'misses': 1, 'stored': 1, 'evicted': 0, 'size': 104857}
+
+Entries are evicted least-recently-used first when the cache grows
+past max_bytes.
+"""
+
+import hashlib
+import os
+import shutil
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from DDR import config
+from DDR import imaging
+from DDR import util
+
+TMP_SUFFIX = '.tmp'
+
+_CACHE = None
+
+
+def _copy(src_path: str, dest_path: str):
+    """Copy file, as a reflink if the filesystem supports it
+
+    Raises FileNotFoundError without touching dest_path if src_path is missing.
+    """
+    with open(src_path, 'rb') as src:
+        with open(dest_path, 'wb') as dest:
+            if not util.reflink(src.fileno(), dest.fileno()):
+                shutil.copyfileobj(src, dest)
+
+def default_cache() -> Optional['AccessCache']:
+    """Returns the AccessCache configured in ddrlocal.cfg, or None if disabled
+
+    @returns: AccessCache or None
+    """
+    global _CACHE
+    if not config.ACCESS_CACHE_DIR:
+        return None
+    if (not _CACHE) or (_CACHE.path != config.ACCESS_CACHE_DIR):
+        _CACHE = AccessCache(
+            config.ACCESS_CACHE_DIR, config.ACCESS_CACHE_MAX_MB * 1024 * 1024
+        )
+    return _CACHE
+
+
+class AccessCache():
+    """Content-addressed cache of access files
+
+    Safe to use from AccessPool worker threads.
+    """
+    path = None
+    max_bytes = None
+
+    def __init__(self, path: str, max_bytes: int):
+        """
+        @param path: str Absolute path to cache directory
+        @param max_bytes: int Evict entries when cache is larger than this
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size = None  # bytes; counted on first store
+        self.counts = {'hits': 0, 'misses': 0, 'stored': 0, 'evicted': 0}
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return "<%s.%s %s>" % (self.__module__, self.__class__.__name__, self.path)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        """Hit/miss/store/evict counts for this process, and cache size"""
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for path,mtime,size in self._entries())
+            stats = dict(self.counts)
+            stats['size'] = self.size
+            return stats
+
+    @staticmethod
+    def key(sha256: str, geometry: str, options: str='',
+            version: int=imaging.CONVERT_VERSION) -> str:
+        """Cache key for a derivative of a master file
+
+        @param sha256: str SHA256 of master file
+        @param geometry: str ImageMagick geometry
+        @param options: str ImageMagick convert options
+        @param version: int imaging.CONVERT_VERSION
+        @returns: str
+        """
+        settings = '|'.join([geometry, options or '', str(version)])
+        return '%s-%s' % (
+            sha256, hashlib.sha1(settings.encode('utf-8')).hexdigest()[:10]
+        )
+
+    def entry_path(self, key: str) -> str:
+        """Absolute path to cache entry (entries are grouped by 2-char prefix)
+        """
+        return os.path.join(
+            self.path, key[:2], key + config.ACCESS_FILE_EXTENSION
+        )
+
+    def fetch(self, key: str, dest_path: str) -> bool:
+        """Copy cached access file to dest_path if present
+
+        @param key: str
+        @param dest_path: str Absolute path
+        @returns: bool True if hit
+        """
+        path = self.entry_path(key)
+        try:
+            _copy(path, dest_path)
+            # mark as recently used
+            os.utime(path)
+        except FileNotFoundError:
+            with self.lock:
+                self.counts['misses'] += 1
+            return False
+        with self.lock:
+            self.counts['hits'] += 1
+        return True
+
+    def store(self, key: str, src_path: str):
+        """Add access file to cache, evicting old entries if necessary
+
+        Entries are written to a temp file and renamed so other processes
+        never see partial files.
+
+        @param key: str
+        @param src_path: str Absolute path to new access file
+        """
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = '%s.%s%s' % (path, threading.get_ident(), TMP_SUFFIX)
+        _copy(src_path, tmp_path)
+        with self.lock:
+            # replacing an entry frees its old size
+            old_size = 0
+            if os.path.exists(path):
+                old_size = os.path.getsize(path)
+            os.replace(tmp_path, path)
+            self.counts['stored'] += 1
+            if self.size is None:
+                self.size = sum(size for p,mtime,size in self._entries())
+            else:
+                self.size += os.path.getsize(path) - old_size
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def _entries(self) -> List[Tuple[str, float, int]]:
+        """(path, mtime, size) for each cache entry"""
+        entries = []
+        if not os.path.exists(self.path):
+            return entries
+        for d in os.scandir(self.path):
+            if not d.is_dir():
+                continue
+            for f in os.scandir(d.path):
+                if f.name.endswith(TMP_SUFFIX) or not f.is_file():
+                    continue
+                st = f.stat()
+                entries.append((f.path, st.st_mtime, st.st_size))
+        return entries
+
+    def _evict(self):
+        """Remove least recently used entries until cache is under max_bytes
+
+        Size is recounted from disk since other processes may share the cache.
+        """
+        entries = sorted(self._entries(), key=lambda entry: entry[1])
+        self.size = sum(size for path,mtime,size in entries)
+        for path,mtime,size in entries:
+            if self.size <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            self.size -= size
+            self.counts['evicted'] += 1
@@ -8,9 +8,12 @@ Import new records
 Register newly added EIDs
 """
 
-import codecs
+import collections
+from concurrent import futures
+from concurrent.futures import ProcessPoolExecutor
 import csv
 from datetime import datetime
+import hashlib
 import json
 import logging
 import os
@@ -20,15 +23,20 @@ import sys
 import traceback
 from typing import Dict
 
+import git
+
 from DDR import config
+from DDR import accesscache
 from DDR import changelog
 from DDR import commands
 from DDR import csvfile
 from DDR import dvcs
+from DDR import fieldexport
 from DDR import fileio
 from DDR import identifier
 from DDR import idservice
 from DDR import ingest
+from DDR import locking
 from DDR import models
 from DDR import modules
 from DDR import util
@@ -39,6 +47,14 @@ COLLECTION_FILES_PREFIX = 'files'
 # TODO get these from ddr-defs/repo_modules/file.py
 FILE_UPDATE_IGNORE_FIELDS = ['sha1', 'sha256', 'md5', 'size']
 
+# journal of imported rows, next to the CSV
+JOURNAL_SUFFIX = '.journal'
+# default location of import plans, next to the CSV
+PLAN_SUFFIX = '.plan'
+
+# objects per export job sent to worker processes
+EXPORT_CHUNK_SIZE = 100
+
 # fields that only appear in File objects
 # TODO get these from ddr-defs/repo_modules/file.py
 FILE_ONLY_FIELDS = [
@@ -46,6 +62,32 @@ FILE_ONLY_FIELDS = [
 ]
 
 
+def _export_class(model):
+    return identifier.class_for_name(
+        identifier.MODEL_CLASSES[model]['module'],
+        identifier.MODEL_CLASSES[model]['class']
+    )
+
+def _export_rows(model, headers, json_paths):
+    """Load objects and convert them to CSV rows (runs in export workers)
+    
+    @param model: str
+    @param headers: list of fieldnames
+    @param json_paths: list of .json files
+    @returns: list of (object_id, row); row is None if object did not load
+    """
+    object_class = _export_class(model)
+    rows = []
+    for json_path in json_paths:
+        i = identifier.Identifier(json_path)
+        obj = object_class.from_identifier(i)
+        if obj:
+            rows.append((i.id, obj.dump_csv(fields=list(headers))))
+        else:
+            rows.append((i.id, None))
+    return rows
+
+
 class Exporter():
     
     @staticmethod
@@ -58,11 +100,15 @@ class Exporter():
             os.makedirs(tmpdir)
 
     @staticmethod
-    def export(json_paths, model, csv_path, required_only=False):
+    def export(json_paths, model, csv_path, required_only=False,
+               workers=config.EXPORT_WORKERS, chunk_size=EXPORT_CHUNK_SIZE):
         """Write the specified objects' data to CSV.
         
         IMPORTANT: All objects in json_paths must have the same set of fields!
         
+        With workers > 1 objects are loaded and converted in a process
+        pool; rows are still written in json_paths order.
+        
         TODO let user specify which fields to write
         TODO confirm that each identifier's class matches object_class
         
@@ -70,11 +116,10 @@ class Exporter():
         @param model: str
         @param csv_path: Absolute path to CSV data file.
         @param required_only: boolean Only required fields.
+        @param workers: int Number of processes to load objects in
+        @param chunk_size: int Number of objects per worker job
         """
-        object_class = identifier.class_for_name(
-            identifier.MODEL_CLASSES[model]['module'],
-            identifier.MODEL_CLASSES[model]['class']
-        )
+        object_class = _export_class(model)
         module = modules.Module(identifier.module_for_name(
             identifier.MODEL_REPO_MODELS[model]['module']
         ))
@@ -94,22 +139,66 @@ class Exporter():
         if 'id' not in headers:
             headers.insert(0, 'id')
         
-        with codecs.open(csv_path, 'wb', 'utf-8') as csvfile:
+        rows = Exporter._exported_rows(
+            model, headers, json_paths, workers, chunk_size
+        )
+        with open(csv_path, 'w', newline='', encoding='utf-8') as csvfile:
             writer = fileio.csv_writer(csvfile)
             # headers in first line
             writer.writerow(headers)
-            for n,json_path in enumerate(json_paths):
-                i = identifier.Identifier(json_path)
-                logging.info('%s/%s - %s' % (n+1, json_paths_len, i.id))
-                obj = object_class.from_identifier(i)
-                if obj:
-                    csv = obj.dump_csv(fields=headers)
-                    try:
-                        writer.writerow(csv)
-                    except UnicodeDecodeError as err:
-                        nicer_unicode_decode_error(headers, obj, csv)
+            for n,(oid,row) in enumerate(rows):
+                logging.info('%s/%s - %s' % (n+1, json_paths_len, oid))
+                if row is None:
+                    continue
+                try:
+                    writer.writerow(row)
+                except UnicodeDecodeError as err:
+                    obj = object_class.from_identifier(
+                        identifier.Identifier(json_paths[n])
+                    )
+                    nicer_unicode_decode_error(headers, obj, row)
         return csv_path
     
+    @staticmethod
+    def _exported_rows(model, headers, json_paths, workers=1,
+                       chunk_size=EXPORT_CHUNK_SIZE, convert=_export_rows):
+        """Yield (object_id, row) for json_paths, in order
+        
+        Chunks of paths are converted in worker processes.  At most
+        workers*2 chunks are in flight so memory use does not grow with
+        the size of the collection.
+        
+        @param model: str
+        @param headers: list of fieldnames
+        @param json_paths: list of .json files
+        @param workers: int
+        @param chunk_size: int
+        @param convert: function(model, headers, json_paths) -> list of rows
+        """
+        chunks = (
+            json_paths[start:start + chunk_size]
+            for start in range(0, len(json_paths), chunk_size)
+        )
+        if workers <= 1:
+            for chunk in chunks:
+                yield from convert(model, headers, chunk)
+            return
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            pending = collections.deque()
+            try:
+                for chunk in chunks:
+                    pending.append(
+                        executor.submit(convert, model, headers, chunk)
+                    )
+                    if len(pending) >= workers * 2:
+                        yield from pending.popleft().result()
+                while pending:
+                    yield from pending.popleft().result()
+            finally:
+                # writer failed or gave up: don't convert the rest
+                for future in pending:
+                    future.cancel()
+    
     @staticmethod
     def export_field_csv(json_paths, model, fieldname):
         """Export specified field values from all entities in a collection to CSV
@@ -121,15 +210,38 @@ class Exporter():
         module = modules.Module(identifier.module_for_name(
             identifier.MODEL_REPO_MODELS[model]['module']
         ))
+        output,writer = fileio.csv_str_writer()
+        def line(row):
+            writer.writerow(row)
+            text = output.getvalue()
+            output.seek(0)
+            output.truncate()
+            return text.strip()
+        yield line(['object_id', 'fieldname', 'value',])
+        for row in fieldexport.field_values(json_paths, [fieldname], module):
+            yield line(row)
+    
+    @staticmethod
+    def export_field(json_paths, model, fieldnames, output=None, fmt='csv'):
+        """Export field values from objects to CSV, JSON Lines, or Parquet
+        
+        Writes one (object_id, fieldname, value) row per object and field.
+        See DDR.fieldexport.
+        
+        @param json_paths: list of .json files
+        @param model: str
+        @param fieldnames: list
+        @param output: str Absolute path, or None for stdout
+        @param fmt: str One of fieldexport.FORMATS
+        """
+        module = modules.Module(identifier.module_for_name(
+            identifier.MODEL_REPO_MODELS[model]['module']
+        ))
         headers = ['object_id', 'fieldname', 'value',]
-        yield fileio.write_csv_str(headers)
-        for json_path in json_paths:
-            oi = identifier.Identifier(json_path)
-            fieldvalues = models.common.prep_csv(
-                oi.object(), module, fields=[fieldname]
-            )
-            row = [oi.id, fieldname, fieldvalues[0]]
-            yield fileio.write_csv_str(row)
+        with fieldexport.open_writer(fmt, output, headers) as writer:
+            for row in fieldexport.field_values(json_paths, fieldnames, module):
+                writer.write(row)
+        return output
 
 
 def nicer_unicode_decode_error(headers, obj, csv):
@@ -161,12 +273,16 @@ class InvalidCSVException(Exception):
 class Checker():
 
     @staticmethod
-    def check_repository(cidentifier):
+    def check_repository(cidentifier, allowed_ids=[]):
         """Load repository, check for staged or modified files
         
         Entity.add_files will not work properly if the repo contains staged
         or modified files.
         
+        When resuming an import, files of the objects (and their parents)
+        journaled by the interrupted import are expected to be staged or
+        modified; pass their IDs as allowed_ids.
+        
         Results dict includes:
         - 'passed': boolean
         - 'repo': GitPython repository
@@ -174,12 +290,54 @@ class Checker():
         - 'modified': list of modified files
         
         @param cidentifier: Identifier
+        @param allowed_ids: list Object IDs whose files may be staged/modified
         @returns: list of staged and modified files
         """
         logging.info('Checking repository')
         repo = dvcs.repository(cidentifier.path_abs())
         logging.info(repo)
-        return dvcs.list_staged(repo), dvcs.list_modified(repo)
+        status = dvcs.status(repo, untracked=False)
+        oids = set(allowed_ids)
+        parents = set()
+        for oid in allowed_ids:
+            try:
+                oi = identifier.Identifier(oid, cidentifier.basepath)
+            except (identifier.InvalidInputException,
+                    identifier.InvalidIdentifierException):
+                continue
+            if oi.model in ['segment', 'file']:
+                # adding or updating a child rewrites its parent's JSON
+                parents.add(oi.parent_id())
+        return (
+            [path for path in status.staged
+             if not Checker._allowed_path(path, oids, parents)],
+            [path for path in status.modified
+             if not Checker._allowed_path(path, oids, parents)],
+        )
+    
+    @staticmethod
+    def _allowed_path(path, oids, parents=set()):
+        """True if path belongs to one of the objects
+        
+        Object files are in a directory named with the ID (entity.json,
+        new files) or have names starting with the ID (file JSON, binaries,
+        access files).  Only the JSON of parents is allowed.
+        
+        @param path: str Path relative to repository
+        @param oids: set of object IDs
+        @param parents: set of parent object IDs
+        @returns: boolean
+        """
+        path = Path(path)
+        if (path.name == 'entity.json') and (path.parent.name in parents):
+            return True
+        for part in path.parts:
+            if part in oids:
+                return True
+            for oid in oids:
+                if part.startswith(oid + '-') or part.startswith(oid + '.'):
+                    return True
+        return False
     
     @staticmethod
     def check_eids(rowds, cidentifier, idservice_client):
@@ -255,13 +413,11 @@ class Checker():
             model=model,
             recursive=True, force_read=True
         )
-        existing_ids = [
+        existing_ids = set(
             identifier.Identifier(path=path).id
             for path in metadata_paths
-        ]
-        new_ids = [rowd['id'] for rowd in rowds]
-        already = [i for i in new_ids if i in existing_ids]
-        return already
+        )
+        return [rowd['id'] for rowd in rowds if rowd['id'] in existing_ids]
 
     @staticmethod
     def _prep_valid_values(vocabs):
@@ -323,7 +479,7 @@ class Checker():
         return header_errs
 
     @staticmethod
-    def validate_csv_rowds(model, headers, rowds):
+    def validate_csv_rowds(model, headers, rowds, workers=1):
         module = Checker._get_module(model)
         required_fields = module.required_fields(
             module.module.REQUIRED_FIELDS_EXCEPTIONS
@@ -335,7 +491,8 @@ class Checker():
         if model and (model == 'file'):
             find_dupes = False
         rowds_errs = csvfile.validate_rowds(
-            module, headers, required_fields, valid_values, rowds, find_dupes
+            module, headers, required_fields, valid_values, rowds, find_dupes,
+            workers=workers
         )
         return rowds_errs
 
@@ -365,6 +522,403 @@ class Checker():
                 file_errs.append(f"row {n}: Unreadable file: {path}"); continue
         return file_errs
 
+    @staticmethod
+    def check_duplicate_files(rowds, cidentifier, numbers=None):
+        """Return warnings if any binaries are already in the collection
+
+        Only the sha1/sha256 given in the CSV are checked.  Local files
+        are not hashed here, so rows without hashes cannot be checked and
+        a warning says how many there are; `ddrimport file --plan` hashes
+        and checks them, and ingest stops at a duplicate before copying it.
+        Also reports files that appear more than once in the CSV.  Hashes
+        are looked up in the collection's HashIndex rather than by reading
+        every File JSON.
+
+        @param rowds: list of dicts
+        @param cidentifier: Identifier
+        @param numbers: list CSV row numbers of rowds, if not 0,1,2...
+        @returns: list of str
+        """
+        if numbers is None:
+            numbers = range(len(rowds))
+        dup_errs = []
+        index = models.files.hash_index(cidentifier.path_abs())
+        seen = {}
+        unchecked = 0
+        for n,rowd in zip(numbers, rowds):
+            # metadata-only updates of existing files
+            if rowd.get('identifier') and rowd['identifier'].model == 'file':
+                continue
+            sha1,sha256 = rowd.get('sha1'),rowd.get('sha256')
+            if not (sha1 or sha256):
+                unchecked += 1
+                continue
+            existing = index.lookup(sha1=sha1, sha256=sha256)
+            if existing:
+                dup_errs.append(
+                    f"row {n}: Duplicate of {', '.join(existing)}: {rowd.get('basename_orig')}"
+                )
+            for h in [sha1, sha256]:
+                if h and (h in seen):
+                    dup_errs.append(
+                        f"row {n}: Same file as row {seen[h]}: {rowd.get('basename_orig')}"
+                    )
+                    break
+            for h in [sha1, sha256]:
+                if h and (h not in seen):
+                    seen[h] = n
+        if unchecked:
+            dup_errs.append(
+                f"{unchecked} files have no sha1/sha256 in the CSV and were "
+                "not checked (use --plan to hash and check them)"
+            )
+        return dup_errs
+
+
+class ImportJournal():
+    """Append-only record of imported CSV rows, for resuming imports
+    
+    Rows are imported in checkpoints of config.IMPORT_CHECKPOINT_ROWS.
+    The row numbers of a checkpoint are journaled before it starts.  When
+    its batch session has exited (files written, parents refreshed, files
+    staged) a line with the row number, object ID, and a hash of the row's
+    CSV data is added for each row, and the journal is fsync'd.
+    
+    With --resume, rows journaled with an unchanged hash are skipped.
+    Rows from a checkpoint that started but did not finish may have
+    been written but not staged, so they are redone and saved even if
+    they match the repository.
+    
+    Without --resume the journal is discarded, unless it records rows
+    outside the rows being imported (see --reset-journal).
+    
+    >>> journal = ImportJournal(csv_path).load()
+    >>> rowds = journal.pending(rowds)
+    >>> for checkpoint in Importer._checkpoints(journal.rows):
+    ...     journal.begin(checkpoint)
+    ...     ...
+    ...     journal.complete(checkpoint)
+    """
+    path = None
+    
+    def __init__(self, csv_path):
+        """
+        @param csv_path: str Absolute path to CSV data file.
+        """
+        self.path = csv_path + JOURNAL_SUFFIX
+        self.done = {}      # row number: hash
+        self.started = set()
+        # (n, rowd, hash, redo) for each rowd returned by pending()
+        self.rows = []
+    
+    def __repr__(self):
+        return "<%s.%s %s>" % (self.__module__, self.__class__.__name__, self.path)
+    
+    @staticmethod
+    def row_hash(rowd):
+        """Hash of a row's CSV data (str values only; see make_rowds)
+        
+        @param rowd: dict
+        @returns: str
+        """
+        data = [
+            [key, value] for key,value in sorted(rowd.items())
+            if isinstance(value, str)
+        ]
+        return hashlib.sha1(json.dumps(data).encode('utf-8')).hexdigest()
+    
+    def load(self):
+        """Read journal; a line cut off by a crash is ignored
+        
+        @returns: ImportJournal
+        """
+        self.done = {}
+        self.started = set()
+        for entry in fileio.read_jsonl(self.path):
+            if 'begin' in entry:
+                self.started.update(entry['begin'])
+            elif 'row' in entry:
+                self.done[entry['row']] = entry['hash']
+        return self
+    
+    def reset(self):
+        """Discard journal of a previous import"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.done = {}
+        self.started = set()
+    
+    @staticmethod
+    def row_numbers(rowds, row_start=0, numbers=None):
+        """CSV row numbers of rowds
+        
+        @param rowds: list of dicts
+        @param row_start: int CSV row number of rowds[0]
+        @param numbers: list CSV row numbers of rowds, if not consecutive
+        @returns: list of ints
+        """
+        if numbers is None:
+            numbers = range(row_start, row_start + len(rowds))
+        return list(numbers)
+    
+    def other_rows(self, numbers):
+        """Journaled row numbers that are not in numbers
+        
+        A journal with other rows belongs to an import of another
+        range of the CSV (see --fromto).
+        
+        @param numbers: list CSV row numbers
+        @returns: list of ints
+        """
+        return sorted((set(self.done) | self.started) - set(numbers))
+    
+    def ids(self, rowds, row_start=0, numbers=None):
+        """IDs of rowds that were journaled as started or done
+        
+        Files of these objects may have been written and staged by an
+        interrupted import.
+        
+        @param rowds: list of dicts
+        @param row_start: int CSV row number of rowds[0]
+        @param numbers: list CSV row numbers of rowds, if not consecutive
+        @returns: set of str
+        """
+        journaled = set(self.done) | self.started
+        return {
+            rowd['id']
+            for n,rowd in zip(self.row_numbers(rowds, row_start, numbers), rowds)
+            if (n in journaled) and rowd.get('id')
+        }
+    
+    def pending(self, rowds, row_start=0, numbers=None):
+        """Returns rowds not yet imported, or changed since they were
+        
+        Row numbers, hashes, and redo flags for the returned rowds are
+        in self.rows, in the same order.
+        
+        @param rowds: list of dicts, straight from make_rowds
+        @param row_start: int CSV row number of rowds[0]
+        @param numbers: list CSV row numbers of rowds, if not consecutive
+        @returns: list of dicts
+        """
+        numbers = self.row_numbers(rowds, row_start, numbers)
+        self.rows = []
+        for n,rowd in zip(numbers, rowds):
+            rowhash = self.row_hash(rowd)
+            if self.done.get(n) == rowhash:
+                continue
+            redo = (n in self.started) and (n not in self.done)
+            self.rows.append((n, rowd, rowhash, redo))
+        return [rowd for n,rowd,rowhash,redo in self.rows]
+    
+    def begin(self, rows):
+        """Record the start of a checkpoint
+        
+        @param rows: list of (n, rowd, hash, redo)
+        """
+        self._append([{'begin': [n for n,rowd,rowhash,redo in rows]}])
+    
+    def complete(self, rows):
+        """Record rows of a checkpoint as done
+        
+        @param rows: list of (n, rowd, hash, redo)
+        """
+        self._append([
+            {'row': n, 'id': rowd.get('id'), 'hash': rowhash}
+            for n,rowd,rowhash,redo in rows
+        ])
+        for n,rowd,rowhash,redo in rows:
+            self.done[n] = rowhash
+    
+    def _append(self, entries):
+        fileio.append_jsonl(self.path, entries)
+
+
+
+class ImportPlan():
+    """Serialized result of analyzing a CSV import, for review and apply
+    
+    Planning (`ddrimport entity|file --plan`) does the loading and
+    comparing an import does but writes nothing to the repository.  For
+    each row that would change something it records the row number, the
+    target object, the action ('create', 'update', or 'add' for a new
+    file), the changed fields with old and new values, and the size and
+    hashes of new binaries.  Rows that would change nothing are left out.
+    
+    Applying (`ddrimport apply`) imports only the rows in the plan, from
+    the plan's copy of the row data, so the CSV is not parsed again and
+    unchanged objects are not loaded.  A plan is stale if objects' .json
+    files or new binaries have changed since it was made.
+    
+    The plan is a JSON Lines file: a header, then one line per row.
+    
+    >>> plan = Importer.plan_entities(csv_path, cidentifier)
+    >>> plan.save()
+    >>> plan = ImportPlan.load(plan.path)
+    >>> plan.stale()
+    []
+    >>> Importer.apply_plan(plan, cidentifier, vocabs_url, git_name, git_mail, agent)
+    """
+    VERSION = 1
+    path = None
+    
+    def __init__(self, path, model, csv_path, collection_id):
+        """
+        @param path: str Absolute path to plan file
+        @param model: str 'entity' or 'file'
+        @param csv_path: str Absolute path to CSV data file.
+        @param collection_id: str
+        """
+        self.path = path
+        self.model = model
+        self.csv_path = csv_path
+        self.collection_id = collection_id
+        self.created = datetime.now(config.TZ)
+        self.rows = []
+    
+    def __repr__(self):
+        return "<%s.%s %s>" % (self.__module__, self.__class__.__name__, self.path)
+    
+    @staticmethod
+    def json_hash(json_path):
+        """SHA1 of an object's .json, or None if it does not exist"""
+        if not (json_path and os.path.exists(json_path)):
+            return None
+        return util.file_hashes(json_path, ['sha1'])['sha1']
+    
+    @staticmethod
+    def binary_info(path):
+        """Size, mtime, and hashes of a new binary, or None if missing
+        
+        @param path: str
+        @returns: dict or None
+        """
+        if not os.path.exists(path):
+            return None
+        stat = os.stat(path)
+        info = {'path': str(path), 'size': stat.st_size, 'mtime': stat.st_mtime}
+        info.update(util.file_hashes(path))
+        return info
+    
+    def add(self, n, rowd, oid, action, json_path=None, changes={}, binary=None):
+        """Add a row to the plan
+        
+        Only the CSV cells (str values) are kept; things added to the row
+        after it was read, like the Identifier set by
+        Checker.validate_csv_identifiers or path_abs, are left out.
+        
+        @param n: int CSV row number
+        @param rowd: dict Row as read from the CSV (see csvfile.make_rowds)
+        @param oid: str Object to create or update (parent, for new files)
+        @param action: str 'create', 'update', or 'add'
+        @param json_path: str .json of object to create or update
+        @param changes: dict {fieldname: [old, new]}
+        @param binary: dict See binary_info
+        """
+        self.rows.append({
+            'row': n,
+            'id': oid,
+            'action': action,
+            'json': json_path,
+            'json_sha1': self.json_hash(json_path),
+            'changes': changes,
+            'binary': binary,
+            'rowd': {
+                key: value for key,value in rowd.items()
+                if isinstance(value, str) and key != 'path_abs'
+            },
+        })
+    
+    def save(self):
+        """Write plan (atomically)
+        
+        @returns: str path
+        """
+        header = {
+            'plan': self.VERSION,
+            'model': self.model,
+            'csv': self.csv_path,
+            'collection': self.collection_id,
+            'created': self.created,
+            'rows': len(self.rows),
+        }
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            for entry in [header] + self.rows:
+                f.write(json.dumps(entry, default=str) + '\n')
+        os.replace(tmp_path, self.path)
+        return self.path
+    
+    @staticmethod
+    def load(path):
+        """Read plan written by ImportPlan.save
+        
+        @param path: str
+        @returns: ImportPlan
+        """
+        entries = fileio.read_jsonl(path)
+        header = next(entries, {})
+        if header.get('plan') != ImportPlan.VERSION:
+            raise Exception(f'Not an import plan (version {ImportPlan.VERSION}): {path}')
+        plan = ImportPlan(path, header['model'], header['csv'], header['collection'])
+        plan.created = header['created']
+        plan.rows = list(entries)
+        if len(plan.rows) != header['rows']:
+            raise Exception(
+                f'Plan is incomplete: {len(plan.rows)}/{header["rows"]} rows'
+            )
+        return plan
+    
+    def summary(self):
+        """Number of rows by action
+        
+        @returns: dict
+        """
+        return dict(collections.Counter(row['action'] for row in self.rows))
+    
+    def stale(self):
+        """Objects and binaries changed since the plan was made
+        
+        @returns: list of error messages
+        """
+        errs = []
+        for row in self.rows:
+            if row['action'] in ['create', 'update']:
+                if self.json_hash(row['json']) != row['json_sha1']:
+                    errs.append(f'row {row["row"]}: {row["id"]} changed since plan')
+            binary = row['binary']
+            if binary:
+                try:
+                    stat = os.stat(binary['path'])
+                except FileNotFoundError:
+                    stat = None
+                if not stat or (stat.st_size, stat.st_mtime) != (
+                        binary['size'], binary['mtime']):
+                    errs.append(
+                        f'row {row["row"]}: {binary["path"]} changed since plan'
+                    )
+        return errs
+    
+    def rowds(self):
+        """Row data for the planned rows, as read from the CSV
+        
+        Rows for new binaries carry the planned size and hashes under
+        ingest.PLANNED_BINARY so they are not calculated again.
+        """
+        rowds = []
+        for row in self.rows:
+            rowd = dict(row['rowd'])
+            if row['action'] == 'add' and row['binary']:
+                rowd[ingest.PLANNED_BINARY] = {
+                    key: row['binary'][key]
+                    for key in ['size', 'md5', 'sha1', 'sha256']
+                }
+            rowds.append(rowd)
+        return rowds
+    
+    def numbers(self):
+        """CSV row numbers of the planned rows"""
+        return [row['row'] for row in self.rows]
 
 class ModifiedFilesError(Exception):
     pass
@@ -437,13 +991,19 @@ class Importer():
     # ----------------------------------------------------------------------
 
     @staticmethod
-    def import_entities(csv_path, cidentifier, vocabs_url, git_name, git_mail, agent, dryrun=False):
+    def import_entities(csv_path, cidentifier, vocabs_url, git_name, git_mail, agent, dryrun=False,
+                        resume=False, checkpoint_rows=config.IMPORT_CHECKPOINT_ROWS,
+                        plan=None, rowds=None, row_start=0, reset_journal=False):
         """Adds or updates entities from a CSV file
         
         Running function multiple times with the same CSV file is idempotent.
         After the initial pass, files will only be modified if the CSV data
         has been updated.
         
+        Rows are imported and staged in checkpoints of checkpoint_rows,
+        and recorded in an ImportJournal; with resume=True rows already
+        imported are skipped.
+        
         This function writes and stages files but does not commit them!
         That is left to the user or to another function.
         
@@ -454,6 +1014,12 @@ class Importer():
         @param git_mail: str
         @param agent: str
         @param dryrun: boolean
+        @param resume: boolean Skip rows recorded in the journal
+        @param checkpoint_rows: int
+        @param plan: ImportPlan Only import the planned rows (CSV is not read)
+        @param rowds: list of rowd dicts (default: all rows in CSV)
+        @param row_start: int CSV row number of rowds[0]
+        @param reset_journal: boolean Discard a journal of other rows
         @returns: list of updated entities
         """
         logging.info('------------------------------------------------------------------------')
@@ -463,77 +1029,116 @@ class Importer():
         repository = dvcs.repository(cidentifier.path_abs())
         logging.info(repository)
         
-        logging.info('Reading %s' % csv_path)
-        headers,rowds,csv_errs = csvfile.make_rowds(fileio.read_csv(csv_path))
+        numbers = None
+        if plan:
+            logging.info('Reading plan %s' % plan.path)
+            rowds = plan.rowds()
+            numbers = plan.numbers()
+        elif rowds is None:
+            logging.info('Reading %s' % csv_path)
+            headers,rowds,csv_errs = csvfile.make_rowds(fileio.iter_csv(csv_path))
         logging.info('%s rows' % len(rowds))
+        journal = Importer._journal(
+            csv_path, resume, dryrun,
+            ImportJournal.row_numbers(rowds, row_start, numbers), reset_journal
+        )
+        journal.pending(rowds, row_start, numbers)
+        if resume:
+            logging.info('Resuming: %s rows already imported' % (
+                len(rowds) - len(journal.rows)
+            ))
         
         logging.info('- - - - - - - - - - - - - - - - - - - - - - - -')
         logging.info('Importing')
         start_updates = datetime.now(config.TZ)
-        git_files = []
         updated = []
         elapsed_rounds = []
         obj_metadata = None
         
         if dryrun:
             logging.info('Dry run - no modifications')
-        for n,rowd in enumerate(rowds):
-            logging.info('%s/%s - %s' % (n+1, len(rowds), rowd['id']))
-            start_round = datetime.now(config.TZ)
-            
-            eidentifier = identifier.Identifier(id=rowd['id'], base_path=cidentifier.basepath)
-            # if there is an existing object it will be loaded
-            try:
-                entity = eidentifier.object()
-            except IOError:
-                entity = None
-            if not entity:
-                entity = models.Entity.new(eidentifier)
-            modified = entity.load_csv(rowd)
-            # Getting obj_metadata takes about 1sec each time
-            # TODO caching works as long as all objects have same metadata...
-            if not obj_metadata:
-                obj_metadata = models.common.object_metadata(
-                    eidentifier.fields_module(),
-                    repository.working_dir
-                )
-            
-            if dryrun:
-                pass
-            elif modified:
-                # write files
-                if not os.path.exists(entity.path_abs):
-                    os.makedirs(entity.path_abs)
-                logging.debug('    writing %s' % entity.json_path)
+        collection = cidentifier.object()
+        for checkpoint in Importer._checkpoints(journal.rows, checkpoint_rows):
+            if not dryrun:
+                journal.begin(checkpoint)
+            git_files = []
+            checkpoint_updated = []
+            # parent refreshes and changelogs are written once when session exits;
+            # staging is done below
+            with models.batch_session(
+                    collection, stage=False,
+                    git_name=git_name, git_mail=git_mail, agent=agent):
+                for n,rowd,rowhash,redo in checkpoint:
+                    logging.info('%s/%s - %s' % (n+1, len(rowds), rowd['id']))
+                    start_round = datetime.now(config.TZ)
                 
-                exit,status,updated_files = entity.save(
-                    git_name, git_mail, agent,
-                    collection=cidentifier.object(),
-                    #cleaned_data=rowd,
-                    commit=False
-                )
+                    eidentifier = identifier.Identifier(id=rowd['id'], base_path=cidentifier.basepath)
+                    # if there is an existing object it will be loaded
+                    try:
+                        entity = eidentifier.object()
+                    except IOError:
+                        entity = None
+                    if not entity:
+                        entity = models.Entity.new(eidentifier)
+                    modified = entity.load_csv(rowd)
+                    if redo and not modified:
+                        # written by interrupted import but maybe not staged
+                        logging.debug('    redoing interrupted row')
+                        modified = True
+                    # Getting obj_metadata takes about 1sec each time
+                    # TODO caching works as long as all objects have same metadata...
+                    if not obj_metadata:
+                        obj_metadata = models.common.object_metadata(
+                            eidentifier.fields_module(),
+                            repository.working_dir
+                        )
                 
-                # stage
-                git_files.append(updated_files)
-                updated.append(entity)
+                    if dryrun:
+                        pass
+                    elif modified:
+                        # write files
+                        if not os.path.exists(entity.path_abs):
+                            os.makedirs(entity.path_abs)
+                        logging.debug('    writing %s' % entity.json_path)
+                    
+                        exit,status,updated_files = entity.save(
+                            git_name, git_mail, agent,
+                            collection=collection,
+                            #cleaned_data=rowd,
+                            commit=False
+                        )
+                    
+                        # stage
+                        git_files.extend([
+                            path.replace('%s/' % collection.path_abs, '')
+                            for path in updated_files
+                        ])
+                        checkpoint_updated.append(entity)
+                
+                    elapsed_round = datetime.now(config.TZ) - start_round
+                    elapsed_rounds.append(elapsed_round)
+                    logging.debug('| %s (%s)' % (eidentifier, elapsed_round))
+            # changelogs were written when session exited
+            for entity in checkpoint_updated:
+                git_files.append(entity.changelog_path_rel)
             
-            elapsed_round = datetime.now(config.TZ) - start_round
-            elapsed_rounds.append(elapsed_round)
-            logging.debug('| %s (%s)' % (eidentifier, elapsed_round))
-    
+            if checkpoint_updated and not dryrun:
+                logging.info('Staging %s modified files' % len(git_files))
+                start_stage = datetime.now(config.TZ)
+                dvcs.stage(repository, git_files)
+                for path in util.natural_sort(dvcs.list_staged(repository)):
+                    if path in git_files:
+                        logging.debug('+ %s' % path)
+                    else:
+                        logging.debug('| %s' % path)
+                elapsed_stage = datetime.now(config.TZ) - start_stage
+                logging.debug('ok (%s)' % elapsed_stage)
+            if not dryrun:
+                journal.complete(checkpoint)
+            updated.extend(checkpoint_updated)
+        
         if dryrun:
             logging.info('Dry run - no modifications')
-        elif updated:
-            logging.info('Staging %s modified files' % len(git_files))
-            start_stage = datetime.now(config.TZ)
-            dvcs.stage(repository, git_files)
-            for path in util.natural_sort(dvcs.list_staged(repository)):
-                if path in git_files:
-                    logging.debug('+ %s' % path)
-                else:
-                    logging.debug('| %s' % path)
-            elapsed_stage = datetime.now(config.TZ) - start_stage
-            logging.debug('ok (%s)' % elapsed_stage)
         
         elapsed_updates = datetime.now(config.TZ) - start_updates
         logging.debug('%s updated in %s' % (len(elapsed_rounds), elapsed_updates))
@@ -541,6 +1146,48 @@ class Importer():
         
         return updated
 
+    @staticmethod
+    def _journal(csv_path, resume, dryrun, numbers=(), reset_journal=False):
+        """ImportJournal for CSV; loaded if resuming, else started fresh
+        
+        An existing journal is only discarded if it covers no rows
+        other than numbers; otherwise it may be the only record of an
+        interrupted import of another range of the CSV, so an Exception
+        is raised unless reset_journal is set.
+        
+        @param csv_path: str
+        @param resume: boolean
+        @param dryrun: boolean Don't touch existing journal
+        @param numbers: list CSV row numbers to be imported
+        @param reset_journal: boolean Discard journal even if it does not match
+        @returns: ImportJournal
+        """
+        journal = ImportJournal(csv_path)
+        if resume:
+            journal.load()
+        elif not dryrun:
+            others = journal.load().other_rows(numbers)
+            if others and not reset_journal:
+                raise Exception(
+                    f'{journal.path} records {len(others)} rows not in this '
+                    f'import (rows {others[0]}-{others[-1]}). '
+                    'Use --resume or --reset-journal.'
+                )
+            journal.reset()
+        return journal
+    
+    @staticmethod
+    def _checkpoints(rows, size=config.IMPORT_CHECKPOINT_ROWS):
+        """Split journal rows into checkpoints
+        
+        @param rows: list
+        @param size: int
+        @returns: generator of lists
+        """
+        size = max(int(size), 1)
+        for start in range(0, len(rows), size):
+            yield rows[start:start + size]
+
     @staticmethod
     def _csv_load(module, rowds):
         return [models.common.csvload_rowd(module, rowd) for rowd in rowds]
@@ -638,6 +1285,11 @@ class Importer():
         """
         new = []
         existing = []
+        # one scandir per entity dir instead of a stat per file
+        presence = models.files.files_presence([
+            obj for obj in files.values()
+            if obj and (obj.identifier.model in identifier.NODES)
+        ])
         for n,rowd in enumerate(rowds):
             # gather facts
             has_id = rowd.get('id')
@@ -646,7 +1298,7 @@ class Importer():
             if obj and (obj.identifier.model in identifier.NODES):
                 obj_is_node = True
             if obj and obj_is_node:
-                json_exists = Path(obj.json_path).exists()
+                json_exists = presence[obj.id]['json']
             else:
                 json_exists = False
             # decide
@@ -668,11 +1320,19 @@ class Importer():
     @staticmethod
     def import_files(csv_path, rowds, cidentifier, vocabs_url, git_name, git_mail,
                      agent, row_start=0, row_end=9999999,
-                     tmp_dir=config.MEDIA_BASE, log_path=None, dryrun=False):
+                     tmp_dir=config.MEDIA_BASE, log_path=None, dryrun=False,
+                     access_workers=config.ACCESS_FILE_WORKERS,
+                     ingest_workers=config.INGEST_WORKERS,
+                     resume=False, checkpoint_rows=config.IMPORT_CHECKPOINT_ROWS,
+                     numbers=None, reset_journal=False):
         """Adds or updates files from a CSV file
         
         TODO how to handle excluded fields like XMP???
         
+        Rows are imported and staged in checkpoints of checkpoint_rows,
+        and recorded in an ImportJournal; with resume=True rows already
+        imported are skipped.
+        
         @param csv_path: Absolute path to CSV data file.
         @param rowds: list of rowd dicts
         @param cidentifier: Identifier
@@ -682,6 +1342,13 @@ class Importer():
         @param agent: str
         @param log_path: str Absolute path to addfile log for all files
         @param dryrun: boolean
+        @param access_workers: int Number of access files to make concurrently
+        @param ingest_workers: int Number of files to hash and copy concurrently
+        @param row_start: int CSV row number of rowds[0], for the journal
+        @param resume: boolean Skip rows recorded in the journal
+        @param checkpoint_rows: int
+        @param numbers: list CSV row numbers of rowds (ex: from an ImportPlan)
+        @param reset_journal: boolean Discard a journal of other rows
         @returns: list git_files
         """
         if log_path:
@@ -706,6 +1373,13 @@ class Importer():
         log.debug(repository)
         
         log.info(f'{len(rowds)} rows')
+        journal = Importer._journal(
+            csv_path, resume, dryrun,
+            ImportJournal.row_numbers(rowds, row_start, numbers), reset_journal
+        )
+        rowds = journal.pending(rowds, row_start, numbers)
+        if resume:
+            log.info(f'Resuming: {len(rowds)} rows not yet imported')
         log.info(f'csv_load rowds')
          # Apply module's csvload_* methods to rowd data
         rowds = Importer._csv_load(Checker._get_module(model), rowds)
@@ -728,30 +1402,58 @@ class Importer():
                 f'{len(bad_entities)} entities could not be loaded! - IMPORT CANCELLED!'
             )
         
-        log.info('- - - - - - - - - - - - - - - - - - - - - - - -')
-        log.info('Updating existing files')
-        git_files = Importer._update_existing_files(
-            rowds_existing,
-            fid_parents, entities, files, models, repository,
-            git_name, git_mail, agent,
-            log, dryrun
-        )
+        # journal rows now refer to csv_loaded rowds
+        journal.rows = [
+            (n, rowd, rowhash, redo)
+            for (n,rowd_csv,rowhash,redo),rowd in zip(journal.rows, rowds)
+        ]
+        new_rowds = set(id(rowd) for rowd in rowds_new)
+        redo_rowds = set(id(rowd) for n,rowd,rowhash,redo in journal.rows if redo)
         
-        log.info('- - - - - - - - - - - - - - - - - - - - - - - -')
-        log.info('Adding new files')
-        git_files2 = Importer._add_new_files(
-            rowds_new,
-            fid_parents, entities, files,
-            git_name, git_mail, agent,
-            log, dryrun,
-            tmp_dir=tmp_dir
-        )
-        log.info('- - - - - - - - - - - - - - - - - - - - - - - -')
+        git_files = []
+        for checkpoint in Importer._checkpoints(journal.rows, checkpoint_rows):
+            if not dryrun:
+                journal.begin(checkpoint)
+            # Parent entities are refreshed, changelogs written, and files
+            # staged once per entity per checkpoint, rather than once per file.
+            with models.batch_session(
+                    cidentifier.object(),
+                    git_name=git_name, git_mail=git_mail, agent=agent):
+                log.info('- - - - - - - - - - - - - - - - - - - - - - - -')
+                log.info('Updating existing files')
+                git_files += Importer._update_existing_files(
+                    [
+                        rowd for n,rowd,rowhash,redo in checkpoint
+                        if id(rowd) not in new_rowds
+                    ],
+                    fid_parents, entities, files, models, repository,
+                    git_name, git_mail, agent,
+                    log, dryrun,
+                    redo=redo_rowds
+                )
+                
+                log.info('- - - - - - - - - - - - - - - - - - - - - - - -')
+                log.info('Adding new files')
+                git_files2 = Importer._add_new_files(
+                    [
+                        rowd for n,rowd,rowhash,redo in checkpoint
+                        if id(rowd) in new_rowds
+                    ],
+                    fid_parents, entities, files,
+                    git_name, git_mail, agent,
+                    log, dryrun,
+                    tmp_dir=tmp_dir,
+                    access_workers=access_workers,
+                    ingest_workers=ingest_workers
+                )
+                log.info('- - - - - - - - - - - - - - - - - - - - - - - -')
+            if not dryrun:
+                journal.complete(checkpoint)
         
         return git_files
     
     @staticmethod
-    def _update_existing_files(rowds, fid_parents, entities, files, models, repository, git_name, git_mail, agent, log, dryrun):
+    def _update_existing_files(rowds, fid_parents, entities, files, models, repository, git_name, git_mail, agent, log, dryrun, redo=set()):
         start = datetime.now(config.TZ)
         elapsed_rounds = []
         git_files = []
@@ -777,6 +1479,10 @@ class Importer():
             entity = entities[eid]
             file_ = files[fid]
             modified = file_.load_csv(rowd)
+            if (id(rowd) in redo) and not modified:
+                # written by interrupted import but maybe not staged
+                log.debug('    redoing interrupted row')
+                modified = True
             # Getting obj_metadata takes about 1sec each time
             # TODO caching works as long as all objects have same metadata...
             if not obj_metadata:
@@ -792,7 +1498,7 @@ class Importer():
                 new_annex_files = ingest.replace_access(
                     repository, file_, rowd.get('access_path')
                 )
-                annex_files.append(new_annex_files)
+                annex_files.extend(new_annex_files)
             
             if modified and not dryrun:
                 log.debug('    writing %s' % file_.json_path)
@@ -805,7 +1511,10 @@ class Importer():
                 )
                 
                 # stage
-                git_files.append(updated_files)
+                git_files.extend([
+                    path.replace('%s/' % repository.working_dir, '')
+                    for path in updated_files
+                ])
                 updated.append(file_)
             
             elapsed_round = datetime.now(config.TZ) - start_round
@@ -815,7 +1524,12 @@ class Importer():
         elapsed = datetime.now(config.TZ) - start
         log.debug('%s updated in %s' % (len(elapsed_rounds), elapsed))
                 
-        if (git_files or annex_files) and not dryrun:
+        batch = models.session.active_session(repository.working_dir)
+        if batch and not dryrun:
+            # parent entities refreshed and files staged when session exits
+            log.info('Queueing %s modified files' % len(git_files))
+            batch.add_files(git_files=git_files, annex_files=annex_files)
+        elif (git_files or annex_files) and not dryrun:
             log.info('Staging %s modified files' % len(git_files))
             start_stage = datetime.now(config.TZ)
             # Stage annex files (binaries) before non-binary git files
@@ -835,59 +1549,112 @@ class Importer():
         
         return git_files
     
+    @staticmethod
+    def _new_file_parent(rowd, fid_parents, entities, files):
+        """Object a new file in rowd will be added to
+        
+        @param rowd: dict
+        @param fid_parents: dict
+        @param entities: dict
+        @param files: dict
+        @returns: Entity (or File if file ID is a file-role)
+        """
+        file_ = files.get(rowd['id'])  # Note: no File object yet for new files
+        parent = entities[fid_parents[rowd['id']].id]
+        # If the actual file ID is not specified in the rowd
+        # (ex: SHA1 not yet known),
+        # the ID in the CSV will be the ID of the *parent* object.
+        # In this case, file_ and parent vars will likely be wrong.
+        # TODO refactor up the chain somewhere.
+        # NOTE: no File object yet for new files
+        if file_ and (file_.identifier.model not in identifier.NODES):
+            parent = file_
+        return parent
+    
     @staticmethod
     def _add_new_files(rowds, fid_parents, entities, files, git_name,
                        git_mail, agent, log, dryrun,
-                       tmp_dir=config.MEDIA_BASE):
+                       tmp_dir=config.MEDIA_BASE,
+                       access_workers=config.ACCESS_FILE_WORKERS,
+                       ingest_workers=config.INGEST_WORKERS):
         log.info(f'addfile log to {log.path}')
         git_files = []
         failures = []
         start = datetime.now(config.TZ)
         elapsed_rounds = []
         len_rowds = len(rowds)
-        for n,rowd in enumerate(rowds):
-            log.info('+ %s/%s - %s (%s)' % (
-                n+1, len_rowds, rowd['id'], rowd['basename_orig']
-            ))
-            start_round = datetime.now(config.TZ)
-
-            fid = rowd['id']
-            parent_id = fid_parents[fid].id
-            file_ = files.get(fid)  # Note: no File object yet for new files
-            parent = entities[parent_id]
-            # If the actual file ID is not specified in the rowd
-            # (ex: SHA1 not yet known),
-            # the ID in the CSV will be the ID of the *parent* object.
-            # In this case, file_ and parent vars will likely be wrong.
-            # TODO refactor up the chain somewhere.
-            # NOTE: no File object yet for new files
-            if file_ and (file_.identifier.model not in identifier.NODES):
-                parent = file_
-            
-            log.debug('| parent %s' % (parent))
-            
-            if not dryrun:
-                file_,repo2,log2 = ingest.add_file(
-                    rowd, parent,
-                    git_name, git_mail, agent,
-                    tmp_dir=tmp_dir, log_path=log.path, show_staged=False
-                )
-                # TODO integrate into ingest.add_file
-                if rowd.get('access_path'):
-                    file_,repo3,log3,status = ingest.add_access(
-                        parent, file_, rowd['access_path'],
+        parents = [
+            Importer._new_file_parent(rowd, fid_parents, entities, files)
+            for rowd in rowds
+        ]
+        # Access files are made concurrently and attached, in row order,
+        # after all the files have been added.  Files with pooled access
+        # files are saved once, when their access file is attached.
+        access_pool = None
+        if (access_workers > 1) and not dryrun:
+            access_pool = ingest.AccessPool(access_workers)
+            log.info(f'{access_pool}')
+        # Files are hashed and copied ahead in worker threads;
+        # this thread saves and stages them in row order.
+        pipeline = None
+        if (ingest_workers > 1) and not dryrun:
+            pipeline = ingest.IngestPipeline(ingest_workers)
+            pipeline.feed(zip(rowds, parents))
+            log.info(f'{pipeline}')
+        try:
+            for n,rowd in enumerate(rowds):
+                log.info('+ %s/%s - %s (%s)' % (
+                    n+1, len_rowds, rowd['id'], rowd['basename_orig']
+                ))
+                start_round = datetime.now(config.TZ)
+                file_ = files.get(rowd['id'])
+                parent = parents[n]
+                log.debug('| parent %s' % (parent))
+                
+                if not dryrun:
+                    file_,repo2,log2 = ingest.add_file(
+                        rowd, parent,
                         git_name, git_mail, agent,
-                        log_path=log.path, show_staged=False
+                        tmp_dir=tmp_dir, log_path=log.path, show_staged=False,
+                        # custom access files replace generated ones
+                        # so don't make those in the background
+                        access_pool=None if rowd.get('access_path') else access_pool,
+                        prepared=pipeline.next() if pipeline else None
                     )
-                git_files.append(file_)
+                    # TODO integrate into ingest.add_file
+                    if rowd.get('access_path'):
+                        file_,repo3,log3,status = ingest.add_access(
+                            parent, file_, rowd['access_path'],
+                            git_name, git_mail, agent,
+                            log_path=log.path, show_staged=False
+                        )
+                    git_files.append(file_)
+                
+                elapsed_round = datetime.now(config.TZ) - start_round
+                elapsed_rounds.append(elapsed_round)
+                log.debug('| file   %s' % (file_))
+                log.debug('| %s' % (elapsed_round))
             
-            elapsed_round = datetime.now(config.TZ) - start_round
-            elapsed_rounds.append(elapsed_round)
-            log.debug('| file   %s' % (file_))
-            log.debug('| %s' % (elapsed_round))
+            if access_pool:
+                log.info('Attaching access files')
+                for (file_,parent),access_path in access_pool.results():
+                    ingest.attach_access(
+                        file_, parent, access_path,
+                        git_name, git_mail, agent, log
+                    )
+        finally:
+            if pipeline:
+                pipeline.shutdown()
+            if access_pool:
+                access_pool.shutdown(cancel=True)
                   
         elapsed = datetime.now(config.TZ) - start
         log.debug('%s added in %s' % (len(elapsed_rounds), elapsed))
+        # duplicate-binary index was updated by File.save
+        models.files.save_hash_indexes()
+        cache = accesscache.default_cache()
+        if cache:
+            log.info(f'access cache {cache.stats}')
         if failures:
             log.error('************************************************************************')
             for e in failures:
@@ -895,6 +1662,172 @@ class Importer():
             log.error('************************************************************************')
         return git_files,failures
     
+    # ----------------------------------------------------------------------
+    
+    @staticmethod
+    def _plan_changes(obj, rowd):
+        """Load rowd into obj (in memory) and return the changed fields
+        
+        @param obj: Entity or File
+        @param rowd: dict
+        @returns: dict {fieldname: [old, new]}
+        """
+        before = {field: getattr(obj, field, None) for field in rowd}
+        modified = obj.load_csv(dict(rowd))
+        return {
+            field: [before.get(field), getattr(obj, field, None)]
+            for field in modified
+        }
+    
+    @staticmethod
+    def plan_entities(csv_path, cidentifier, plan_path=None, rowds=None, row_start=0):
+        """Analyze an entity import without writing anything
+        
+        @param csv_path: Absolute path to CSV data file.
+        @param cidentifier: Identifier
+        @param plan_path: str (default: CSV path + PLAN_SUFFIX)
+        @param rowds: list of rowd dicts (default: all rows in CSV)
+        @param row_start: int CSV row number of rowds[0]
+        @returns: ImportPlan
+        """
+        if rowds is None:
+            logging.info('Reading %s' % csv_path)
+            headers,rowds,csv_errs = csvfile.make_rowds(fileio.iter_csv(csv_path))
+        num = len(rowds)
+        logging.info('%s rows' % num)
+        plan = ImportPlan(
+            plan_path or csv_path + PLAN_SUFFIX, 'entity', csv_path, cidentifier.id
+        )
+        for n,rowd in enumerate(rowds, row_start):
+            eidentifier = identifier.Identifier(id=rowd['id'], base_path=cidentifier.basepath)
+            try:
+                entity = eidentifier.object()
+            except IOError:
+                entity = None
+            action = 'update'
+            if not entity:
+                entity = models.Entity.new(eidentifier)
+                action = 'create'
+            changes = Importer._plan_changes(entity, rowd)
+            logging.info('%s/%s - %s %s (%s changed)' % (
+                n+1, num, rowd['id'], action, len(changes)
+            ))
+            if changes or (action == 'create'):
+                plan.add(
+                    n, rowd, eidentifier.id, action, entity.json_path, changes
+                )
+        return plan
+    
+    @staticmethod
+    def plan_files(csv_path, rowds, cidentifier, plan_path=None, row_start=0):
+        """Analyze a file import without writing anything
+        
+        New binaries are hashed here.  When the plan is applied they are
+        only checked for changes (size, mtime) and the planned hashes are
+        used instead of hashing them again.
+        
+        @param csv_path: Absolute path to CSV data file.
+        @param rowds: list of rowd dicts
+        @param cidentifier: Identifier
+        @param plan_path: str (default: CSV path + PLAN_SUFFIX)
+        @param row_start: int CSV row number of rowds[0]
+        @returns: ImportPlan
+        """
+        model = 'file'
+        csv_dir = os.path.dirname(csv_path)
+        plan = ImportPlan(
+            plan_path or csv_path + PLAN_SUFFIX, model, csv_path, cidentifier.id
+        )
+        rowds_loaded = Importer._csv_load(Checker._get_module(model), rowds)
+        for rowd in rowds_loaded:
+            rowd['path_abs'] = Path(csv_dir) / rowd['basename_orig']
+        fidentifiers = Importer._fidentifiers(rowds_loaded, cidentifier)
+        fid_parents = Importer._fid_parents(fidentifiers, rowds_loaded, cidentifier)
+        eidentifiers = Importer._eidentifiers(fid_parents)
+        entities,bad_entities = Importer._existing_bad_entities(eidentifiers)
+        if bad_entities:
+            raise Exception(
+                f'{len(bad_entities)} entities could not be loaded! - {bad_entities}'
+            )
+        files = Importer._file_objects(fidentifiers)
+        rowds_new,rowds_existing = Importer._rowds_new_existing(rowds_loaded, files)
+        new_rowds = set(id(rowd) for rowd in rowds_new)
+        num = len(rowds)
+        # hashes of new binaries, for Checker.check_duplicate_files
+        hashed = []
+        hashed_rows = []
+        for n,(rowd_csv,rowd) in enumerate(zip(rowds, rowds_loaded), row_start):
+            logging.info('%s/%s - %s' % (n+1, num, rowd['id']))
+            if id(rowd) in new_rowds:
+                parent = Importer._new_file_parent(
+                    rowd, fid_parents, entities, files
+                )
+                binary = ImportPlan.binary_info(rowd['path_abs'])
+                plan.add(n, rowd_csv, parent.id, 'add', binary=binary)
+                if binary:
+                    hashed.append({
+                        'basename_orig': rowd['basename_orig'],
+                        'sha1': binary['sha1'], 'sha256': binary['sha256'],
+                    })
+                    hashed_rows.append(n)
+                continue
+            file_ = files[rowd['id']]
+            rowd = dict(rowd)
+            for field in FILE_UPDATE_IGNORE_FIELDS:
+                rowd.pop(field, None)
+            changes = Importer._plan_changes(file_, rowd)
+            if changes or rowd.get('access_path'):
+                plan.add(
+                    n, rowd_csv, file_.id, 'update', file_.json_path, changes
+                )
+        for warning in Checker.check_duplicate_files(
+                hashed, cidentifier, hashed_rows):
+            logging.warning(f'- {warning}')
+        return plan
+    
+    @staticmethod
+    def apply_plan(plan, cidentifier, vocabs_url, git_name, git_mail, agent,
+                   dryrun=False, resume=False, reset_journal=False, **kwargs):
+        """Import the rows in an ImportPlan
+        
+        Raises an Exception without writing anything if the plan is for
+        another collection or is stale (see ImportPlan.stale).
+        Other kwargs are passed to import_files.
+        
+        @param plan: ImportPlan
+        @param cidentifier: Identifier
+        @param vocabs_url: str URL or path to vocabs
+        @param git_name: str
+        @param git_mail: str
+        @param agent: str
+        @param dryrun: boolean
+        @param resume: boolean Skip rows recorded in the CSV's journal
+        @param reset_journal: boolean Discard a journal of other rows
+        @returns: list of updated entities, or list git_files
+        """
+        if plan.collection_id != cidentifier.id:
+            raise Exception(
+                f'Plan is for {plan.collection_id}, not {cidentifier.id}'
+            )
+        stale = plan.stale()
+        if stale:
+            for err in stale:
+                logging.error(err)
+            raise Exception(
+                f'{len(stale)} rows changed since plan was made - IMPORT CANCELLED!'
+            )
+        if plan.model == 'entity':
+            return Importer.import_entities(
+                plan.csv_path, cidentifier, vocabs_url, git_name, git_mail,
+                agent, dryrun=dryrun, resume=resume, plan=plan,
+                reset_journal=reset_journal
+            )
+        return Importer.import_files(
+            plan.csv_path, plan.rowds(), cidentifier, vocabs_url,
+            git_name, git_mail, agent, dryrun=dryrun, resume=resume,
+            numbers=plan.numbers(), reset_journal=reset_journal, **kwargs
+        )
+    
     @staticmethod
     def register_entity_ids(csv_path, cidentifier, idservice_client, dryrun=True):
         """
@@ -1006,7 +1939,9 @@ class Updater():
     TODO = 'todo'
     THIS = 'this'
     DONE = 'done.csv'
+    DONE_JOURNAL = 'done.jsonl'
     COLLECTION_LOG = '%s.log'
+    LOCK = '%s.lock'
 
     @staticmethod
     def update_collection(cidentifier, user, mail, commit=False):
@@ -1023,151 +1958,254 @@ class Updater():
         return Updater._analyze(start, end, response)
     
     @staticmethod
-    def update_multi(basedir, source, user, mail, commit=False, keep=False):
-        """
+    def update_multi(basedir, source, user, mail, commit=False, keep=False,
+                     workers=1, remote=None):
+        """Clone, update, and (optionally) commit each collection in list
+        
+        With workers > 1 collections are processed in a process pool.
+        Each collection is cloned into its own directory in basedir and
+        locked while it is worked on.  Failures are recorded per
+        collection in done.csv and in the summary; they do not stop the
+        other collections.
+        
         @param user: str User name
         @param mail: str User email
         @param basedir: str Absolute path to base dir.
         @param source: str Absolute path to list file.
         @param commit: boolean
         @param keep: boolean
-        @return:
+        @param workers: int Number of collections to process at once
+        @param remote: str Dir of bare repos to clone from instead of Gitolite
+        @return: dict summary
         """
         logging.info('========================================================================')
         logging.info('Prepping collections list')
         cids_path = Updater._prep_todo(basedir, source)
         cids = Updater._read_todo(cids_path)
         
-        completed = 0
-        successful = 0
-        total_failures = 0
-        total_load_errs = 0
-        total_save_errs = 0
-        total_bad_exits = 0
-        total_objects_saved = 0
-        total_files_updated = 0
-        per_objects = []
-        while(cids):
-            logging.info('------------------------------------------------------------------------')
-            # rm current cid from TODO, update TODO and THIS
-            cid = cids.pop(0)
-            logging.info(cid)
-            Updater._write_todo(cids, cids_path)
-            Updater._write_this(basedir, cid)
-            
-            collection_log = os.path.join(basedir, Updater.COLLECTION_LOG % cid)
-            collection_path = os.path.join(basedir, cid)
-            cidentifier = identifier.Identifier(cid, base_path=basedir)
-            
-            # clone
-            if os.path.exists(collection_path):
-                logging.info('Removing existing repo: %s' % collection_path)
-                shutil.rmtree(collection_path)
-            logging.info('Cloning %s' % collection_path)
-            try:
-                clone_exit,clone_status = commands.clone(
-                    user, mail,
-                    cidentifier,
-                    collection_path
-                )
-                logging.info('ok')
-            except:
-                metrics = UpdaterMetrics()
-                metrics.cid = cid
-                metrics.verdict = 'FAIL'
-                metrics.error = 'clone failed'
-                metrics.traceback = traceback.format_exc().strip()
-            
-            # transform
-            try:
-                metrics = Updater.update_collection(cidentifier, user, mail, commit=commit)
-            except:
-                metrics = UpdaterMetrics()
-                metrics.cid = cid
-                metrics.verdict = 'FAIL'
-                metrics.error = 'update failed'
-                metrics.traceback = traceback.format_exc().strip()
-                
-            if metrics.verdict == 'ok':
-                logging.info(metrics.verdict)
-                successful += 1
-            else:
-                logging.error(metrics)
-            logging.info('objects_saved: %s' % metrics.objects_saved)
-            logging.info('files_updated: %s' % metrics.files_updated)
-            logging.info('s/object:      %s' % metrics.per_object)
-            logging.info('failures:      %s (%s)' % (metrics.failures, metrics.fail_rate))
-            logging.info('load_errs:     %s' % len(metrics.load_errs))
-            logging.info('save_errs:     %s' % len(metrics.save_errs))
-            logging.info('bad_exits:     %s' % len(metrics.bad_exits))
-            total_objects_saved += metrics.objects_saved
-            total_files_updated += metrics.files_updated
-            total_failures += metrics.failures
-            total_load_errs += len(list(metrics.load_errs.keys()))
-            total_save_errs += len(list(metrics.save_errs.keys()))
-            total_bad_exits += len(list(metrics.bad_exits.keys()))
-            delta = metrics.per_object
-            per_objects.append(delta)
-            
-            if commit:
-                if metrics.load_errs or metrics.save_errs or metrics.bad_exits:
-                    logging.error('We have errors! Cannot commit!')
-                    metrics.committed = False
-                else:
-                    repo = dvcs.repository(
-                        collection_path,
-                        user_name=user, user_mail=mail
+        summary = {
+            'collections': 0,
+            'successful': 0,
+            'failures': 0,
+            'objects_saved': 0,
+            'files_updated': 0,
+            'per_objects': [],
+            'failed': {},
+        }
+        args = (basedir, user, mail, commit, keep, remote)
+        # IDs of collections done or started, in case TODO lists one twice
+        done = Updater._done_ids(basedir)
+        if workers <= 1:
+            while(cids):
+                logging.info('------------------------------------------------------------------------')
+                # rm current cid from TODO, update TODO and THIS
+                cid = cids.pop(0)
+                logging.info(cid)
+                Updater._write_todo(cids, cids_path)
+                if cid in done:
+                    logging.info('already done')
+                    continue
+                done.add(cid)
+                Updater._write_this(basedir, cid)
+                metrics = Updater._update_one(cid, *args)
+                Updater._record(basedir, metrics, summary)
+                # update THIS, not writing this collection any more
+                Updater._write_this(basedir, '')
+                logging.info('')
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                running = {}
+                while cids or running:
+                    # only start as many as can run so TODO stays accurate
+                    while cids and (len(running) < workers):
+                        cid = cids.pop(0)
+                        if cid in done:
+                            continue
+                        done.add(cid)
+                        logging.info('Starting %s' % cid)
+                        running[
+                            executor.submit(Updater._update_one, cid, *args)
+                        ] = cid
+                        Updater._write_todo(cids, cids_path)
+                    Updater._write_this(basedir, '\n'.join(running.values()))
+                    finished,_ = futures.wait(
+                        running, return_when=futures.FIRST_COMPLETED
                     )
-                    # stage
-                    stage_these = []
-                    if metrics.updated:
-                        for f in metrics.updated.values():
-                            stage_these.extend(f)
-                    logging.info('%s files changed' % (len(stage_these)))
-                    if stage_these:
-                        logging.info('Staging...')
-                        staged = dvcs.stage(repo, git_files=stage_these)
-                        logging.info('Committing...')
-                        committed = dvcs.commit(
-                            repo,
-                            "Batch updated all objects in collection",
-                            agent=Updater.AGENT
-                        )
-                        logging.info('commit %s' % committed)
-                        metrics.committed = str(committed)[:10]
-                        # remove remotes so you can't sync
-                        # (remotes will return next time it's modded tho)
-                        for name in dvcs.repos_remotes(repo):
-                            repo.remove_remote(remote)
-                        logging.info('ok')
-                    else:
-                        metrics.committed = 'nochanges'
-            else:
-                metrics.committed = 'nocommit'
-            
-            if os.path.exists(collection_path) and not keep:
-                logging.info('Deleting %s' % collection_path)
-                shutil.rmtree(collection_path)
-                logging.info('ok')
-                metrics.kept = 'nokeep'
-            else:
-                logging.info('Keeping %s' % collection_path)
-                metrics.kept = 'kept'
-            
-            Updater._write_done(basedir, metrics)
-            # update THIS, not writing this collection any more
+                    for future in finished:
+                        cid = running.pop(future)
+                        try:
+                            metrics = future.result()
+                        except:
+                            metrics = Updater._failed(cid, 'worker failed')
+                        Updater._record(basedir, metrics, summary)
             Updater._write_this(basedir, '')
-            completed += 1
-            logging.info('')
-
-        return {
-            'collections': completed,
-            'successful': successful,
-            'failures': total_failures,
-            'objects_saved': total_objects_saved,
-            'files_updated': total_files_updated,
-            'per_objects': per_objects,
-        }
+        Updater._compact_done(basedir)
+        
+        logging.info('========================================================================')
+        logging.info('%s collections, %s successful' % (
+            summary['collections'], summary['successful']
+        ))
+        for cid,error in summary['failed'].items():
+            logging.error('FAIL %s: %s' % (cid, error))
+        return summary
+    
+    @staticmethod
+    def _failed(cid, error):
+        """UpdaterMetrics for a collection that could not be processed"""
+        metrics = UpdaterMetrics()
+        metrics.cid = cid
+        metrics.verdict = 'FAIL'
+        metrics.error = error
+        metrics.traceback = traceback.format_exc().strip()
+        return metrics
+    
+    @staticmethod
+    def _record(basedir, metrics, summary):
+        """Log a collection's metrics, add them to summary and DONE
+        
+        @param basedir: str
+        @param metrics: UpdaterMetrics
+        @param summary: dict
+        """
+        if metrics.verdict == 'ok':
+            logging.info('%s %s' % (metrics.cid, metrics.verdict))
+            summary['successful'] += 1
+        else:
+            logging.error('%s %s %s' % (metrics.cid, metrics.verdict, metrics.error))
+            summary['failed'][metrics.cid] = metrics.error or metrics.verdict
+        logging.info('objects_saved: %s' % metrics.objects_saved)
+        logging.info('files_updated: %s' % metrics.files_updated)
+        logging.info('s/object:      %s' % metrics.per_object)
+        logging.info('failures:      %s (%s)' % (metrics.failures, metrics.fail_rate))
+        logging.info('load_errs:     %s' % len(metrics.load_errs))
+        logging.info('save_errs:     %s' % len(metrics.save_errs))
+        logging.info('bad_exits:     %s' % len(metrics.bad_exits))
+        summary['collections'] += 1
+        summary['objects_saved'] += metrics.objects_saved
+        summary['files_updated'] += metrics.files_updated
+        summary['failures'] += metrics.failures
+        summary['per_objects'].append(metrics.per_object)
+        Updater._write_done(basedir, metrics)
+    
+    @staticmethod
+    def _update_one(cid, basedir, user, mail, commit=False, keep=False,
+                    remote=None):
+        """Clone, update, commit, and clean up one collection
+        
+        Runs in update_multi worker processes.  The collection is locked
+        (see Updater.LOCK) so two runs can't work on it at once.
+        Errors are returned in the metrics rather than raised.
+        
+        @returns: UpdaterMetrics
+        """
+        lock_path = os.path.join(basedir, Updater.LOCK % cid)
+        lock_text = str(os.getpid())
+        if locking.lock(lock_path, lock_text) != 'ok':
+            return Updater._failed(cid, 'locked')
+        try:
+            return Updater._update_locked(
+                cid, basedir, user, mail, commit, keep, remote
+            )
+        finally:
+            locking.unlock(lock_path, lock_text)
+    
+    @staticmethod
+    def _update_locked(cid, basedir, user, mail, commit, keep, remote):
+        collection_path = os.path.join(basedir, cid)
+        cidentifier = identifier.Identifier(cid, base_path=basedir)
+        
+        # clone
+        if os.path.exists(collection_path):
+            logging.info('Removing existing repo: %s' % collection_path)
+            shutil.rmtree(collection_path)
+        logging.info('Cloning %s' % collection_path)
+        try:
+            Updater._clone(user, mail, cidentifier, collection_path, remote)
+            logging.info('ok')
+        except:
+            return Updater._failed(cid, 'clone failed')
+        
+        # transform
+        try:
+            metrics = Updater.update_collection(cidentifier, user, mail, commit=commit)
+        except:
+            metrics = Updater._failed(cid, 'update failed')
+        
+        if commit:
+            # unchanged collections are committed as 'nochanges'
+            if metrics.error or metrics.load_errs or metrics.save_errs \
+            or metrics.bad_exits:
+                logging.error('We have errors! Cannot commit!')
+                metrics.committed = False
+            else:
+                try:
+                    metrics.committed = Updater._commit(
+                        collection_path, user, mail, metrics
+                    )
+                except:
+                    failed = Updater._failed(cid, 'commit failed')
+                    metrics.verdict = failed.verdict
+                    metrics.error = failed.error
+                    metrics.traceback = failed.traceback
+                    metrics.committed = False
+        else:
+            metrics.committed = 'nocommit'
+        
+        if os.path.exists(collection_path) and not keep:
+            logging.info('Deleting %s' % collection_path)
+            shutil.rmtree(collection_path)
+            logging.info('ok')
+            metrics.kept = 'nokeep'
+        else:
+            logging.info('Keeping %s' % collection_path)
+            metrics.kept = 'kept'
+        return metrics
+    
+    @staticmethod
+    def _clone(user, mail, cidentifier, collection_path, remote=None):
+        """Clone from Gitolite, or from a dir of bare repos if remote
+        """
+        if not remote:
+            return commands.clone(user, mail, cidentifier, collection_path)
+        repo = git.Repo.clone_from(
+            os.path.join(remote, '%s.git' % cidentifier.id), collection_path
+        )
+        dvcs.git_set_configs(repo, user, mail)
+        return 0,'ok'
+    
+    @staticmethod
+    def _commit(collection_path, user, mail, metrics):
+        """Stage and commit updated files
+        
+        @returns: str commit ID (first 10 chars) or 'nochanges'
+        """
+        repo = dvcs.repository(
+            collection_path,
+            user_name=user, user_mail=mail
+        )
+        # stage
+        stage_these = []
+        if metrics.updated:
+            for f in metrics.updated.values():
+                stage_these.extend(f)
+        logging.info('%s files changed' % (len(stage_these)))
+        if not stage_these:
+            return 'nochanges'
+        logging.info('Staging...')
+        staged = dvcs.stage(repo, git_files=stage_these)
+        logging.info('Committing...')
+        committed = dvcs.commit(
+            repo,
+            "Batch updated all objects in collection",
+            agent=Updater.AGENT
+        )
+        logging.info('commit %s' % committed)
+        # remove remotes so you can't sync
+        # (remotes will return next time it's modded tho)
+        for remote in repo.remotes:
+            repo.delete_remote(remote)
+        logging.info('ok')
+        return str(committed)[:10]
     
     @staticmethod
     def _consolidate_paths(updated_files):
@@ -1199,28 +2237,32 @@ class Updater():
         bad_exits = {}
         statuses = {}
         updated_files = {}
-        for n,path in enumerate(paths):
-            logging.info('%s/%s %s' % (n, num, path))
-            try:
-                o = identifier.Identifier(path).object()
-            except:
-                load_errs[o.identifier.id] = traceback.format_exc().strip().splitlines()[-1]
-                logging.error('ERROR: instantiation')
-                continue
-            try:
-                exit,status,updated = o.save(
-                    git_user, git_mail, agent=Updater.AGENT, commit=False
-                )
-            except:
-                save_errs[o.identifier.id] = traceback.format_exc().strip().splitlines()[-1]
-                logging.error('ERROR: save')
-                continue
-            if exit != 0:
-                bad_exits[o.identifier.id] = exit
-                logging.error('ERROR: bad exit')
-            if status != 'ok':
-                statuses[o.identifier.id] = status
-            updated_files[o.identifier.id] = updated
+        # each parent entity is rewritten once when the session exits
+        with models.batch_session(
+                collection, stage=False,
+                git_name=git_user, git_mail=git_mail, agent=Updater.AGENT):
+            for n,path in enumerate(paths):
+                logging.info('%s/%s %s' % (n, num, path))
+                try:
+                    o = identifier.Identifier(path).object()
+                except:
+                    load_errs[o.identifier.id] = traceback.format_exc().strip().splitlines()[-1]
+                    logging.error('ERROR: instantiation')
+                    continue
+                try:
+                    exit,status,updated = o.save(
+                        git_user, git_mail, agent=Updater.AGENT, commit=False
+                    )
+                except:
+                    save_errs[o.identifier.id] = traceback.format_exc().strip().splitlines()[-1]
+                    logging.error('ERROR: save')
+                    continue
+                if exit != 0:
+                    bad_exits[o.identifier.id] = exit
+                    logging.error('ERROR: bad exit')
+                if status != 'ok':
+                    statuses[o.identifier.id] = status
+                updated_files[o.identifier.id] = updated
         
         return {
             'cid': cidentifier.id,    # str collection ID
@@ -1285,17 +2327,12 @@ class Updater():
             pass
         else:
             cids = []
-        # Read cids from DONE
-        if not os.path.join(basedir, Updater.DONE):
-            Updater._write_done(basedir, None)
-        done_headers,done_rows = Updater._read_done(basedir)
-        done = [row[0] for row in done_rows]
+        # Read cids from DONE, including any journaled by an interrupted run
+        Updater._compact_done(basedir)
+        done = Updater._done_ids(basedir)
         # Remove DONE cids from TODO cids
-        completed = []
-        for cid in done:
-            if cid in cids:
-                completed.append(cid)
-                cids.remove(cid)
+        completed = [cid for cid in cids if cid in done]
+        cids = [cid for cid in cids if cid not in done]
         logging.info('Removed completed collections: %s' % completed)
         # Write TODO cids to TODO
         Updater._write_todo(cids, path)
@@ -1318,6 +2355,7 @@ class Updater():
     
     @staticmethod
     def _read_this(basedir):
+        path = os.path.join(basedir, Updater.THIS)
         text = fileio.read_text(path)
         return text.strip()
     
@@ -1328,6 +2366,8 @@ class Updater():
     
     @staticmethod
     def _read_done(basedir):
+        """Rows from DONE plus rows journaled since it was last compacted
+        """
         path = os.path.join(basedir, Updater.DONE)
         headers = None
         rows = []
@@ -1335,19 +2375,54 @@ class Updater():
             rows = fileio.read_csv(path)
             if rows:
                 headers = rows.pop(0)
+        rows.extend(
+            fileio.read_jsonl(os.path.join(basedir, Updater.DONE_JOURNAL))
+        )
+        if rows and not headers:
+            headers = UpdaterMetrics().headers()
         return headers,rows
     
+    @staticmethod
+    def _done_ids(basedir):
+        """Set of IDs of completed collections"""
+        headers,rows = Updater._read_done(basedir)
+        return set(row[0] for row in rows)
+    
     @staticmethod
     def _write_done(basedir, metrics=UpdaterMetrics()):
-        path = os.path.join(basedir, Updater.DONE)
-        headers = []
-        rows = []
-        if os.path.exists(path):
-            rows = fileio.read_csv(path)
-            if rows:
-                headers = rows.pop(0)
-        if not headers:
-            headers = metrics.headers()
+        """Append a collection's metrics to the DONE journal
+        
+        Each record is fsync'd so a crash loses at most the collection
+        in progress.  See _compact_done.
+        """
         if metrics.cid:
-            rows.append(metrics.row())
-        fileio.write_csv(path, headers, rows)
+            # str values, as they will be read back from DONE
+            row = ['' if value is None else str(value) for value in metrics.row()]
+            fileio.append_jsonl(
+                os.path.join(basedir, Updater.DONE_JOURNAL), [row]
+            )
+    
+    @staticmethod
+    def _compact_done(basedir):
+        """Rewrite DONE with the journaled rows, then remove the journal
+        
+        Rows already in DONE (journal left behind by a crash during a
+        previous compaction) are not repeated.
+        """
+        path = os.path.join(basedir, Updater.DONE)
+        journal_path = os.path.join(basedir, Updater.DONE_JOURNAL)
+        if not os.path.exists(journal_path):
+            return path
+        headers,rows = Updater._read_done(basedir)
+        seen = set()
+        unique = []
+        for row in rows:
+            key = tuple(row)
+            if key not in seen:
+                seen.add(key)
+                unique.append(row)
+        tmp_path = path + '.tmp'
+        fileio.write_csv(tmp_path, headers, unique)
+        os.replace(tmp_path, path)
+        os.remove(journal_path)
+        return path
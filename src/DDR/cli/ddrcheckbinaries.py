@@ -36,21 +36,17 @@ def check_file(json_path, verbose=False):
         return result
     
     mismatches = []
-    md5 = util.file_hash(f.path_abs, 'md5')
-    if not (md5 == f.md5):
-        mismatches.append['md5']
-    sha1 = util.file_hash(f.path_abs, 'sha1')
-    if not (sha1 == f.sha1):
-        mismatches.append['sha1']
-    sha256 = util.file_hash(f.path_abs, 'sha256')
-    if not (sha256 == f.sha256):
-        mismatches.append['sha256']
+    hashes = util.file_hashes(f.path_abs, ALGORITHMS)
+    for algo in ALGORITHMS:
+        if not (hashes[algo] == getattr(f, algo)):
+            mismatches.append(algo)
+    sha256 = hashes['sha256']
     # SHA256 hash from the git-annex filename
     annex_sha256 = os.path.basename(
         os.path.realpath(f.path_abs)
     ).split('--')[1]
     if not (sha256 == annex_sha256):
-        mismatches.append['annex_sha256']
+        mismatches.append('annex_sha256')
     
     if mismatches:
         mismatches.append(json_path)
@@ -23,6 +23,10 @@ You can also print out blank CSV files with all fields:
 And blank with only required fields:
     $ ddrexport -br entity ...
 
+Field values from all objects can be written as CSV, JSON Lines, or Parquet:
+    $ ddrexport fieldcsv entity creators,topics /PATH/TO/ddr/ddr-test-123
+    $ ddrexport fieldcsv -f parquet -o /tmp/creators.parquet entity creators ...
+
 Please see "ddrimport help" for information on importing CSV files.
 ---"""
 
@@ -38,6 +42,7 @@ import click
 from DDR import config
 from DDR import batch
 from DDR import dvcs
+from DDR import fieldexport
 from DDR import fileio
 from DDR import identifier
 from DDR import util
@@ -76,13 +81,14 @@ def help():
 @click.option('--include','-i', help='ID(s) to include (see help for formatting).')
 @click.option('--exclude','-e', help='ID(s) to exclude (see help for formatting).')
 @click.option('--dryrun','-d', is_flag=True, help="Print paths but don't export anything.")
-def entity(collection, destination, blank, required, idfile, include, exclude, dryrun):
+@click.option('--workers','-w', type=int, default=config.EXPORT_WORKERS, help='Number of processes to load objects in.')
+def entity(collection, destination, blank, required, idfile, include, exclude, dryrun, workers):
     """Export entity/object records to CSV.
     """
     export(
         'entity',
         collection, destination,
-        blank, required, idfile, include, exclude, dryrun
+        blank, required, idfile, include, exclude, dryrun, workers
     )
 
 
@@ -95,13 +101,14 @@ def entity(collection, destination, blank, required, idfile, include, exclude, d
 @click.option('--include','-i', help='ID(s) to include (see help for formatting).')
 @click.option('--exclude','-e', help='ID(s) to exclude (see help for formatting).')
 @click.option('--dryrun','-d', is_flag=True, help="Print paths but don't export anything.")
-def file(collection, destination, blank, required, idfile, include, exclude, dryrun):
+@click.option('--workers','-w', type=int, default=config.EXPORT_WORKERS, help='Number of processes to load objects in.')
+def file(collection, destination, blank, required, idfile, include, exclude, dryrun, workers):
     """Export file records to CSV.
     """
     export(
         'file',
         collection, destination,
-        blank, required, idfile, include, exclude, dryrun
+        blank, required, idfile, include, exclude, dryrun, workers
     )
 
 
@@ -109,22 +116,29 @@ def file(collection, destination, blank, required, idfile, include, exclude, dry
 @click.argument('model')
 @click.argument('fieldname')
 @click.argument('collection')
-def fieldcsv(model, fieldname, collection):
+@click.option('--format','-f', 'fmt', type=click.Choice(fieldexport.FORMATS), default='csv', help='Output format (default csv).')
+@click.option('--output','-o', help='Output file (default stdout; required for parquet).')
+def fieldcsv(model, fieldname, collection, fmt, output):
     """Export value of specified field for all model objects in collections
     
+    Separate multiple field names with commas.
+    
     @param model str: 
     @param fieldname str: 
     @param collection str: 
     """
-    for item in batch.Exporter.export_field_csv(
-            json_paths=all_paths(collection, model),
-            model=model,
-            fieldname=fieldname,
-    ):
-        click.echo(item)
+    if output:
+        output = os.path.abspath(output)
+    batch.Exporter.export_field(
+        json_paths=all_paths(collection, model),
+        model=model,
+        fieldnames=fieldname.split(','),
+        output=output,
+        fmt=fmt,
+    )
 
 
-def export(model, collection, destination, blank, required, idfile, include, exclude, dryrun):
+def export(model, collection, destination, blank, required, idfile, include, exclude, dryrun, workers=1):
     # ensure we have absolute paths (CWD+relpath)
     collection_path = os.path.abspath(collection)
     destination_path = os.path.abspath(destination)
@@ -177,7 +191,9 @@ def export(model, collection, destination, blank, required, idfile, include, exc
         for n,path in enumerate(paths):
             logging.info('%s/%s %s' % (n+1, len(paths), path))
     else:
-        batch.Exporter.export(paths, model, filename, required_only=required)
+        batch.Exporter.export(
+            paths, model, filename, required_only=required, workers=workers
+        )
     
     finish = datetime.now()
     elapsed = finish - start
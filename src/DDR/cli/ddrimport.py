@@ -13,6 +13,13 @@ for "external" files than for normal ones for which binaries will be
 imported.
     $ ddrimport file /tmp/ddr-test-123-file.csv /PATH/TO/ddr/ddr-test-123/
 
+Review an import before making it: --plan writes what would change
+(objects, changed fields, new binaries with hashes) to a plan file
+without touching the repository.  "apply" then imports just those rows,
+without reading the CSV again.
+    $ ddrimport file --plan /tmp/ddr-test-123-file.plan /tmp/ddr-test-123-file.csv /PATH/TO/ddr/ddr-test-123/
+    $ ddrimport apply /tmp/ddr-test-123-file.plan /PATH/TO/ddr/ddr-test-123/
+
 Register entity IDs with the ID service API:
     $ ddrimport register /tmp/ddr-test-123-entity.csv /PATH/TO/ddr/ddr-test-123
 
@@ -95,16 +102,18 @@ def help():
 @click.option('--username','-U', help='ID service username. Use flag to avoid being prompted.')
 @click.option('--password','-P', help='ID service password. Use flag to avoid being prompted. Passwords args will remain in ~/.bash_history.')
 @click.option('--idservice','-i', help='Override URL of ID service in configs.')
-def check(model, csv, collection, username, password, idservice):
+@click.option('--workers','-w', type=int, default=1, help='Number of processes to validate rows in.')
+def check(model, csv, collection, username, password, idservice, workers):
     """Validates CSV file, performs integrity checks.
     """
     start = datetime.now()
     csv_path,collection_path = make_paths(csv, collection)
     ci = identifier.Identifier(collection_path)
     logging.debug(ci)
-    headers,rowds,csv_errs = csvfile.make_rowds(fileio.read_csv(csv_path))
+    headers,rowds,csv_errs = csvfile.make_rowds(fileio.iter_csv(csv_path))
     run_checks(
         model, ci, csv_path, headers, rowds, csv_errs,
+        workers=workers,
     )
     finish = datetime.now()
     elapsed = finish - start
@@ -146,9 +155,12 @@ def register(csv, collection, username, password, idservice, dryrun):
 @click.option('--idservice','-i', help='Override URL of ID service in configs.')
 @click.option('--nocheck','-N', is_flag=True, help="Disable checking/validation (may take time on large collections).")
 @click.option('--dryrun','-d', is_flag=True, help="Simulated run-through; don't modify files.")
-# TODO @click.option('--fromto', '-F', help="Only import specified rows. Use Python list syntax e.g. '523:711' or ':200' or '100:'.")
+@click.option('--fromto', '-F', help="Only import specified rows. Use Python list syntax e.g. '523:711' or ':200' or '100:'.")
+@click.option('--resume','-r', is_flag=True, help="Skip rows completed by an interrupted import.")
+@click.option('--reset-journal', is_flag=True, help="Start a new import journal even if it records other rows.")
+@click.option('--plan','-p', help="Write import plan to this path instead of importing.")
 # TODO @click.option('--log','-l', help='Log addfile to this path')
-def entity(csv, collection, user, mail, username, password, idservice, nocheck, dryrun):
+def entity(csv, collection, user, mail, username, password, idservice, nocheck, dryrun, fromto, resume, reset_journal, plan):
     """Import entity/object records from CSV.
     """
     start = datetime.now()
@@ -156,13 +168,28 @@ def entity(csv, collection, user, mail, username, password, idservice, nocheck,
     csv_path,collection_path = make_paths(csv, collection)
     ci = identifier.Identifier(collection_path)
     logging.debug(ci)
-    headers,rowds,csv_errs = csvfile.make_rowds(fileio.read_csv(csv_path))
+    row_start,row_end = rows_start_end(fromto)
+    headers,rowds,csv_errs = csvfile.make_rowds(
+        read_csv_rows(csv_path, row_start, row_end)
+    )
     if not nocheck:
+        # rows completed by an interrupted import aren't checked again
+        rowds_check = rowds
+        journaled_ids = []
+        if resume:
+            journal = batch.ImportJournal(csv_path).load()
+            journaled_ids = journal.ids(rowds, row_start)
+            rowds_check = journal.pending(rowds, row_start)
         run_checks(
-            'entity', ci, csv_path, headers, rowds, csv_errs,
+            'entity', ci, csv_path, headers, rowds_check, csv_errs,
             idservice_api_login(username, password, idservice),
+            journaled_ids=journaled_ids,
         )
-    #row_start,row_end = rows_start_end(fromto)
+    if plan:
+        write_plan(batch.Importer.plan_entities(
+            csv_path, ci, os.path.abspath(plan), rowds, row_start
+        ))
+        return
     imported = batch.Importer.import_entities(
         csv_path=csv_path,
         cidentifier=ci,
@@ -172,8 +199,10 @@ def entity(csv, collection, user, mail, username, password, idservice, nocheck,
         agent=AGENT,
         #log_path=log,
         dryrun=dryrun,
-        #row_start=row_start,
-        #row_end=row_end,
+        resume=resume,
+        reset_journal=reset_journal,
+        rowds=rowds,
+        row_start=row_start,
     )
     
     finish = datetime.now()
@@ -190,21 +219,40 @@ def entity(csv, collection, user, mail, username, password, idservice, nocheck,
 @click.option('--dryrun','-d', is_flag=True, help="Simulated run-through; don't modify files.")
 @click.option('--fromto', '-F', help="Only import specified rows. Use Python list syntax e.g. '523:711' or ':200' or '100:'.")
 @click.option('--log','-l', help='(optional) Log addfile to this path')
+@click.option('--access-workers','-a', type=int, default=config.ACCESS_FILE_WORKERS, help='Number of access files to make concurrently.')
+@click.option('--ingest-workers','-w', type=int, default=config.INGEST_WORKERS, help='Number of files to hash and copy concurrently.')
+@click.option('--resume','-r', is_flag=True, help="Skip rows completed by an interrupted import.")
+@click.option('--reset-journal', is_flag=True, help="Start a new import journal even if it records other rows.")
+@click.option('--plan','-p', help="Write import plan to this path instead of importing.")
 # TODO @click.option('--nocheck','-N', help="Disable checking/validation (may take time on large collections).")
-def file(csv, collection, user, mail, nocheck, dryrun, fromto, log):
+def file(csv, collection, user, mail, nocheck, dryrun, fromto, log, access_workers, ingest_workers, resume, reset_journal, plan):
     """Import file records from CSV.
     """
     start = datetime.now()
     csv_path,collection_path = make_paths(csv, collection)
     ci = identifier.Identifier(collection_path)
     logging.debug(ci)
-    headers,rowds,csv_errs = csvfile.make_rowds(fileio.read_csv(csv_path))
+    row_start,row_end = rows_start_end(fromto)
+    headers,rowds,csv_errs = csvfile.make_rowds(
+        read_csv_rows(csv_path, row_start, row_end)
+    )
     if not nocheck:
+        # rows completed by an interrupted import aren't checked again
+        rowds_check = rowds
+        journaled_ids = []
+        if resume:
+            journal = batch.ImportJournal(csv_path).load()
+            journaled_ids = journal.ids(rowds, row_start)
+            rowds_check = journal.pending(rowds, row_start)
         run_checks(
-            'file', ci, csv_path, headers, rowds, csv_errs,
-            log_path=log,
+            'file', ci, csv_path, headers, rowds_check, csv_errs,
+            log_path=log, journaled_ids=journaled_ids,
         )
-    row_start,row_end = rows_start_end(fromto)
+    if plan:
+        write_plan(batch.Importer.plan_files(
+            csv_path, rowds, ci, os.path.abspath(plan), row_start
+        ))
+        return
     imported = batch.Importer.import_files(
         csv_path=csv_path,
         rowds=rowds,
@@ -216,7 +264,47 @@ def file(csv, collection, user, mail, nocheck, dryrun, fromto, log):
         log_path=log,
         dryrun=dryrun,
         row_start=row_start,
-        row_end=row_end,
+        access_workers=access_workers,
+        ingest_workers=ingest_workers,
+        resume=resume,
+        reset_journal=reset_journal,
+    )
+    
+    finish = datetime.now()
+    elapsed = finish - start
+    logging.info('DONE - %s elapsed' % elapsed)
+
+
+@ddrimport.command()
+@click.argument('plan')
+@click.argument('collection')
+@click.option('--user','-u', help='(required for commit) Git user name.')
+@click.option('--mail','-m', help='(required for commit) Git user e-mail address.')
+@click.option('--dryrun','-d', is_flag=True, help="Simulated run-through; don't modify files.")
+@click.option('--log','-l', help='(optional) Log addfile to this path')
+@click.option('--access-workers','-a', type=int, default=config.ACCESS_FILE_WORKERS, help='Number of access files to make concurrently.')
+@click.option('--ingest-workers','-w', type=int, default=config.INGEST_WORKERS, help='Number of files to hash and copy concurrently.')
+@click.option('--resume','-r', is_flag=True, help="Skip rows completed by an interrupted import.")
+@click.option('--reset-journal', is_flag=True, help="Start a new import journal even if it records other rows.")
+def apply(plan, collection, user, mail, dryrun, log, access_workers, ingest_workers, resume, reset_journal):
+    """Import the rows in a plan made with --plan.
+    """
+    start = datetime.now()
+    plan_path,collection_path = make_paths(plan, collection)
+    ci = identifier.Identifier(collection_path)
+    logging.debug(ci)
+    import_plan = batch.ImportPlan.load(plan_path)
+    logging.info(f'{import_plan} {import_plan.summary()}')
+    kwargs = {}
+    if import_plan.model == 'file':
+        kwargs = dict(
+            log_path=log,
+            access_workers=access_workers,
+            ingest_workers=ingest_workers,
+        )
+    imported = batch.Importer.apply_plan(
+        import_plan, ci, config.VOCABS_URL, user, mail, AGENT,
+        dryrun=dryrun, resume=resume, reset_journal=reset_journal, **kwargs
     )
     
     finish = datetime.now()
@@ -258,6 +346,21 @@ def clean(collection, remove):
     logging.info('DONE - %s elapsed' % elapsed)
 
 
+def write_plan(plan):
+    """Save ImportPlan and log what it would do
+    
+    @param plan: batch.ImportPlan
+    """
+    for row in plan.rows:
+        logging.info(f"row {row['row']}: {row['action']} {row['id']}")
+        for field,(old,new) in row['changes'].items():
+            logging.debug(f'  {field}: {old!r} -> {new!r}')
+        if row['binary']:
+            logging.debug(f"  {row['binary']['path']} {row['binary']['sha1']}")
+    plan.save()
+    logging.info(f'{plan.summary()}')
+    logging.info(f'Wrote plan to {plan.path}')
+
 def make_paths(csv, collection):
     """Massage path args, die if paths missing.
     """
@@ -276,19 +379,28 @@ def make_paths(csv, collection):
         sys.exit(1)
     return csv_path,collection_path
 
-def run_checks(model, ci, csv_path, headers, rowds, csv_errs, log_path=None, idservice_client=None):
+def run_checks(model, ci, csv_path, headers, rowds, csv_errs, log_path=None, idservice_client=None, workers=1, journaled_ids=[]):
     """run checks on the CSV doc,repo and quit if errors
+    
+    When resuming, files of objects journaled by the interrupted import
+    (journaled_ids) may be staged or modified; other files may not.
     """
     logging.info('Validating headers')
     header_errs = batch.Checker.validate_csv_headers(model, headers, rowds)
     logging.info('Validating rows')
-    rowds_errs = batch.Checker.validate_csv_rowds(model, headers, rowds)
+    rowds_errs = batch.Checker.validate_csv_rowds(
+        model, headers, rowds, workers=workers
+    )
     logging.info('Validating object IDs')
     id_errs = batch.Checker.validate_csv_identifiers(rowds)
     file_errs = []
     if model == 'file':
         logging.info('Validating files')
         file_errs = batch.Checker.validate_csv_files(csv_path, rowds)
+        logging.info('Checking for duplicate files')
+        # CSV hashes may be stale so duplicates do not stop the import
+        for warning in batch.Checker.check_duplicate_files(rowds, ci):
+            logging.warning(f'- {warning}')
     for err in csv_errs:
         logging.error(f'CSV: {err}')
     for key,val in header_errs.items():
@@ -302,7 +414,7 @@ def run_checks(model, ci, csv_path, headers, rowds, csv_errs, log_path=None, ids
     for err in file_errs:
         logging.error(f"- {err}")
     # repository
-    staged,modified = batch.Checker.check_repository(ci)
+    staged,modified = batch.Checker.check_repository(ci, journaled_ids)
     for f in staged: logging.error(f'staged: {f}')
     for f in modified: logging.error(f'modified: {f}')
     if csv_errs or id_errs or header_errs or rowds_errs or file_errs or staged or modified:
@@ -329,18 +441,47 @@ def run_checks(model, ci, csv_path, headers, rowds, csv_errs, log_path=None, ids
 
 def rows_start_end(fromto):
     """Returns start/end rows, or the first/last rows
+    
+    Rows are journaled by number (see batch.ImportJournal) so they must
+    not be negative; die if they are, or if the range is empty or bad.
+    
     @param fromto: str "NUM0:NUM1"
     """
     row_start = 0
     row_end = 9999999
     if fromto:
-        rowstart,rowend = fromto.split(':')
-        if rowstart:
-            row_start = int(rowstart)
-        if rowend:
-            row_end = int(rowend)
+        try:
+            rowstart,rowend = fromto.split(':')
+            if rowstart:
+                row_start = int(rowstart)
+            if rowend:
+                row_end = int(rowend)
+        except ValueError:
+            print(f'ddrimport: --fromto must be START:END, not "{fromto}".')
+            sys.exit(1)
+        if (row_start < 0) or (row_end < 0):
+            print('ddrimport: --fromto rows must not be negative.')
+            sys.exit(1)
+        if row_start >= row_end:
+            print('ddrimport: --fromto START must be less than END.')
+            sys.exit(1)
     return row_start,row_end
 
+def read_csv_rows(csv_path, row_start, row_end):
+    """Read only the rows selected by --fromto
+    
+    Seeks straight to row_start using a sidecar row index next to the CSV
+    (see fileio.iter_csv).
+    
+    @param csv_path: str
+    @param row_start: int
+    @param row_end: int
+    @returns: iterator of rows, header row first
+    """
+    return fileio.iter_csv(
+        csv_path, row_start, row_end, index=bool(row_start)
+    )
+
 def log_error(err, debug=False):
     """Print Exception message to log, or traceback to console
     
@@ -32,10 +32,10 @@ import click
 
 from DDR import config
 from DDR import csvfile
+from DDR import fieldexport
 from DDR import fileio
 from DDR import format_json
 from DDR.identifier import Identifier
-from DDR.models.common import load_json_lite
 from DDR import util
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
@@ -68,57 +68,44 @@ PERSONS_FIELDNAMES = ['creators','persons']
 #@click.option('--datasette','-d', default=config.DATASETTE, help='Datasette HOST:IP.')
 @click.argument('fieldname')
 @click.argument('collection')
-def dump(fieldname, collection):
+@click.option('--format','-f', 'fmt', type=click.Choice(fieldexport.FORMATS), default='csv', help='Output format (default csv).')
+@click.option('--output','-o', help='Output file (default stdout; required for parquet).')
+def dump(fieldname, collection, fmt, output):
     """Returns creators/person/etc names from all records in a collection
     """
     assert fieldname in PERSONS_FIELDNAMES
     # all the .jsons in collection
     # for each one, extract id and field
     headers = ['id', 'fieldname', 'name']
-    click.echo(fileio.write_csv_str(headers))
-    for oid,name in _read_collection_files(collection, fieldname):
-        row = [oid, fieldname, name]
-        click.echo(fileio.write_csv_str(row))
+    with fieldexport.open_writer(fmt, output, headers) as writer:
+        for oid,name in _read_collection_files(collection, fieldname):
+            writer.write([oid, fieldname, name])
 
 def _read_collection_files(collection_path, fieldname):
     """Returns an OID and name for each creator or person in collection
     """
-    # collection
     ci = Identifier(collection_path)
-    oid,names = _extract_field_values(ci.path_abs('json'), fieldname)
-    for name in names:
-        yield (oid, name)
-    # objects
-    for path in util.natural_sort([
-        path for path in util.find_meta_files(
+    paths = [ci.path_abs('json')] + util.natural_sort(
+        util.find_meta_files(
             basedir=collection_path, model='entity', recursive=1, force_read=1
         )
-    ]):
-        oid,names = _extract_field_values(path, fieldname)
-        for name in names:
+    )
+    for oid,fname,value in fieldexport.field_values(paths, [fieldname]):
+        for name in _field_names(value):
             yield (oid, name)
 
-def _extract_field_values(path, fieldname):
-    """Extracts individual creators,persons values from JSON document
+def _field_names(value):
+    """Extracts individual creators,persons values from field value
     """
-    oi = Identifier(path)
-    jsonlines = load_json_lite(path, oi.model, oi.id)
-    jsonlines.pop(0)
     values = []
-    for data in jsonlines:
-        for fname,value in data.items():
-            if not value:
-                break
-            if fname == fieldname:
-                for item in value:
-                    # creators
-                    if isinstance(item, dict):
-                        values.append(item['namepart'])
-                    # persons
-                    elif item:
-                        values.append(item)
-                break
-    return oi.id,values
+    for item in value or []:
+        # creators
+        if isinstance(item, dict):
+            values.append(item['namepart'])
+        # persons
+        elif item:
+            values.append(item)
+    return values
 
 
 @ddrnames.command()
@@ -12,6 +12,7 @@ from DDR import config
 from DDR import docstore
 from DDR import fileio
 from DDR import identifier
+from DDR import models
 from DDR import storage
 from DDR import util
 
@@ -236,11 +237,12 @@ def filter_files(files: List[Path],
     num_objects_publishable = len(publishable)
     logprint(LOG, f'{num_objects_publishable}/{num_objects_total} publishable objects')
     # list binaries and access files
+    presence = models.files.files_presence(publishable)
     binaries = [
-        Path(o.path_rel) for o in publishable if Path(o.path_abs).exists()
+        Path(o.path_rel) for o in publishable if o.present(presence)
     ]
     accesses = [
-        Path(o.access_rel) for o in publishable if Path(o.access_abs).exists()
+        Path(o.access_rel) for o in publishable if o.access_present(presence)
     ]
     paths = sorted(list(set(binaries + accesses)))
     num_files_tocopy = len(paths)
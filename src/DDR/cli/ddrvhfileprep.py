@@ -9,7 +9,6 @@
 
 import csv
 import datetime
-import hashlib
 import mimetypes
 import os
 from pathlib import Path
@@ -19,6 +18,7 @@ import sys
 import click
 
 from DDR import identifier
+from DDR import util
 
 CONTEXT_SETTINGS = dict(help_option_names=['-h', '--help'])
 
@@ -87,23 +87,6 @@ CSVCOLS = [ 'id',
 # Assumes standard IA stream is an mp4
 IASTREAMEXT = 'mp4'
 
-def file_hash(path, algo='sha1'):
-    if algo == 'sha256':
-        h = hashlib.sha256()
-    elif algo == 'md5':
-        h = hashlib.md5()
-    else:
-        h = hashlib.sha1()
-    block_size=65536
-    f = open(path, 'rb')
-    while True:
-        data = f.read(block_size)
-        if not data:
-            break
-        h.update(data)
-    f.close()
-    return h.hexdigest()    
-
 def process_seg_dir(dpath,outpath):
     # Init output data list
     odata = []
@@ -132,11 +115,12 @@ def process_seg_dir(dpath,outpath):
             orow['digitize_person'] = "Hoshide, Dana"
             orow['label'] = "Segment {}".format(segno)
 
-            orow['md5'] = file_hash(thisfile,'md5')
+            hashes = util.file_hashes(thisfile, ['md5', 'sha1', 'sha256'])
+            orow['md5'] = hashes['md5']
             print("md5: {}".format(orow['md5']))
-            orow['sha1'] = file_hash(thisfile,'sha1')
+            orow['sha1'] = hashes['sha1']
             print("sha1: {}".format(orow['sha1']))
-            orow['sha256'] = file_hash(thisfile,'sha256')
+            orow['sha256'] = hashes['sha256']
             print("sha256: {}".format(orow['sha256']))
             orow['size'] = os.path.getsize(thisfile)
             print("size: {}".format(orow['size']))
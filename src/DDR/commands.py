@@ -1,3 +1,4 @@
+from contextlib import contextmanager
 from functools import wraps
 import logging
 import os
@@ -90,7 +91,7 @@ def commit_files(repo, message, git_files=[], annex_files=[]):
     logging.debug('    files added:         {}'.format(added))
     
     if annex_files:
-        repo.git.annex('add', annex_files)
+        dvcs.annex_stage(repo, annex_files)
     if git_files:
         repo.index.add(git_files)
     
@@ -110,6 +111,209 @@ def commit_files(repo, message, git_files=[], annex_files=[]):
     return repo
 
 
+# Active transactions by collection path
+_TRANSACTIONS = {}
+
+def active_transaction(collection_path):
+    """Returns the Transaction for the collection if one is active.
+
+    @param collection_path: str Absolute path to collection repo.
+    @returns: Transaction or None
+    """
+    if not collection_path:
+        return None
+    return _TRANSACTIONS.get(os.path.normpath(collection_path))
+
+class Transaction():
+    """Collects changelog entries and changed paths for one collection
+
+    update() and entity_update() with commit=False normally check out
+    master, add the remote, write a changelog entry, and stage files every
+    time they are called.  While a Transaction is active they instead
+    record their messages and paths here.  Branch and remote setup happen
+    once, and at the end each changelog is written once and all paths are
+    staged in one git-add and one git-annex-add.
+
+    Use via commands.transaction rather than instantiating directly.
+    """
+
+    def __init__(self, collection, user_name, user_mail, agent='', stage=True):
+        """
+        @param collection: Collection
+        @param user_name: str
+        @param user_mail: str
+        @param agent: str
+        @param stage: bool Stage files when transaction finishes.
+        """
+        self.collection = collection
+        self.collection_path = os.path.normpath(collection.path_abs)
+        self.user_name = user_name
+        self.user_mail = user_mail
+        self.agent = agent
+        self.stage = stage
+        self.repo = None
+        # changelog messages by (path, user, mail)
+        self.changelogs = {}
+        self.agents = {}
+        self.git_files = []
+        self.annex_files = []
+
+    def __repr__(self):
+        return "<%s.%s %s>" % (
+            self.__module__, self.__class__.__name__, self.collection_path
+        )
+
+    def setup(self):
+        """Check out master and add remote, once per transaction
+
+        @returns: GitPython Repo object
+        """
+        if not self.repo:
+            self.repo = dvcs.repository(
+                self.collection_path, self.user_name, self.user_mail
+            )
+            self.repo.git.checkout('master')
+            dvcs.remote_add(
+                self.repo, self.collection.git_url, config.GIT_REMOTE_NAME
+            )
+        return self.repo
+
+    def _relative(self, path):
+        path = str(path)
+        if os.path.isabs(path):
+            return os.path.relpath(path, self.collection_path)
+        return path
+
+    def changelog(self, path, messages, user_name=None, user_mail=None, agent=''):
+        """Queue changelog messages; one entry per changelog is written at end.
+
+        @param path: str Absolute path to changelog
+        @param messages: list of str
+        @param user_name: str (default: transaction user)
+        @param user_mail: str (default: transaction user)
+        @param agent: str
+        """
+        key = (
+            str(path), user_name or self.user_name, user_mail or self.user_mail
+        )
+        if key not in self.changelogs:
+            self.changelogs[key] = []
+        for message in messages:
+            if message not in self.changelogs[key]:
+                self.changelogs[key].append(message)
+        if agent or self.agent:
+            self.agents[key] = agent or self.agent
+
+    def add_files(self, git_files=[], annex_files=[]):
+        """Queue files to be staged at end.
+
+        @param git_files: list of paths (absolute or relative to collection)
+        @param annex_files: list of paths (absolute or relative to collection)
+        """
+        for path in annex_files:
+            path = self._relative(path)
+            if path not in self.annex_files:
+                self.annex_files.append(path)
+        for path in git_files:
+            path = self._relative(path)
+            if path not in self.git_files:
+                self.git_files.append(path)
+
+    def write_changelogs(self):
+        """Write one entry to each changelog with queued messages
+
+        @returns: list of changelog paths relative to collection
+        """
+        written = []
+        for key,messages in self.changelogs.items():
+            path,user_name,user_mail = key
+            if self.agents.get(key):
+                messages = messages + ['@agent: %s' % self.agents[key]]
+            write_changelog_entry(path, messages, user_name, user_mail)
+            written.append(self._relative(path))
+        self.changelogs = {}
+        self.agents = {}
+        self.add_files(git_files=written)
+        return written
+
+    def finish(self):
+        """Write changelogs and (if stage) stage all queued files
+
+        @returns: list of git and annex files (relative to collection)
+        """
+        self.write_changelogs()
+        files = self.annex_files + [
+            path for path in self.git_files if path not in self.annex_files
+        ]
+        if self.stage and files:
+            self.stage_files()
+        return files
+
+    def stage_files(self):
+        """Stage queued files: one git-annex-add, then one git-add
+
+        Annex files (binaries) are staged before non-binary git files
+        else binaries might end up in .git/objects/ which would be NOT GOOD.
+        """
+        repo = self.setup()
+        git_files = [
+            path for path in self.git_files if path not in self.annex_files
+        ]
+        logging.debug('    staging {} annex, {} git files'.format(
+            len(self.annex_files), len(git_files)
+        ))
+        dvcs.annex_stage(repo, self.annex_files)
+        if git_files:
+            dvcs.stage(repo, git_files)
+        still_modified = [
+            path for path in dvcs.list_modified(repo)
+            if (path in git_files) or (path in self.annex_files)
+        ]
+        self.git_files = []
+        self.annex_files = []
+        if still_modified:
+            raise Exception('Could not stage {} files: {}'.format(
+                len(still_modified), still_modified
+            ))
+
+@contextmanager
+def transaction(collection, user_name, user_mail, agent='', stage=True):
+    """Defer changelog writes and staging for a collection until exit
+
+    update() and entity_update() called with commit=False inside the
+    block record their changes in the Transaction.  If a transaction is
+    already active for the collection it is reused and the outer
+    transaction does the work at exit.  If the block raises, queued
+    changelog entries are dropped and nothing is staged.
+
+    >>> with commands.transaction(collection, 'user', 'user@example.org') as tx:
+    ...     for entity in entities:
+    ...         entity.save('user', 'user@example.org', 'agent', commit=False)
+
+    @param collection: Collection
+    @param user_name: str
+    @param user_mail: str
+    @param agent: str
+    @param stage: bool Stage updated files at exit.
+    @returns: Transaction
+    """
+    path = os.path.normpath(collection.path_abs)
+    if _TRANSACTIONS.get(path):
+        yield _TRANSACTIONS[path]
+        return
+    tx = Transaction(collection, user_name, user_mail, agent, stage=stage)
+    _TRANSACTIONS[path] = tx
+    try:
+        yield tx
+    except Exception:
+        # failed batch: don't record changes in changelogs or stage
+        tx.changelogs = {}
+        tx.agents = {}
+        raise
+    finally:
+        _TRANSACTIONS.pop(path, None)
+    tx.finish()
+
 
 #@command
 @local_only
@@ -370,6 +574,18 @@ def update(user_name, user_mail, collection, updated_files, agent='', commit=Fal
     @param commit: (optional) Commit files after staging them.
     @return: message ('ok' if successful)
     """
+    tx = active_transaction(collection.path_abs)
+    if tx and not commit:
+        # changelog and staging deferred until transaction ends
+        tx.setup()
+        tx.changelog(
+            collection.changelog_path,
+            ['Updated collection file(s) {}'.format(f) for f in updated_files],
+            user_name, user_mail, agent
+        )
+        tx.add_files(git_files=updated_files)
+        return 0,'ok'
+    
     repo = dvcs.repository(collection.path, user_name, user_mail)
     if repo:
         logging.debug('    git repo {}'.format(collection.path))
@@ -626,6 +842,18 @@ def file_destroy(user_name, user_mail, collection, entity, rm_files, updated_fil
     return 0,'ok',git_files
 
 
+def entity_update_messages(entity, updated_files):
+    """Changelog messages for entity_update
+    
+    @param entity: Entity
+    @param updated_files: List of paths to updated file(s), relative to entitys.
+    @returns: list of str
+    """
+    return [
+        'Updated entity file {}'.format(os.path.join(entity.id, f))
+        for f in updated_files
+    ]
+
 @command
 @local_only
 def entity_update(user_name, user_mail, collection, entity, updated_files, agent='', commit=True):
@@ -644,20 +872,28 @@ def entity_update(user_name, user_mail, collection, entity, updated_files, agent
     @param commit: (optional) Commit files after staging them.
     @return: message ('ok' if successful)
     """
-    repo = dvcs.repository(collection.path, user_name, user_mail)
-    repo.git.checkout('master')
-    dvcs.remote_add(repo, collection.git_url, config.GIT_REMOTE_NAME)
-    
     # entity file paths are relative to collection root
     git_files = []
     for f in updated_files:
         git_files.append( os.path.join( 'files', entity.id, str(f)) )
     
     # entity changelog
-    entity_changelog_messages = []
-    for f in updated_files:
-        p = os.path.join(entity.id, f)
-        entity_changelog_messages.append('Updated entity file {}'.format(p))
+    entity_changelog_messages = entity_update_messages(entity, updated_files)
+    
+    tx = active_transaction(collection.path_abs)
+    if tx and not commit:
+        # changelog and staging deferred until transaction ends
+        tx.setup()
+        tx.changelog(
+            entity.changelog_path, entity_changelog_messages,
+            user_name, user_mail, agent
+        )
+        tx.add_files(git_files=git_files)
+        return 0,'ok'
+    
+    repo = dvcs.repository(collection.path, user_name, user_mail)
+    repo.git.checkout('master')
+    dvcs.remote_add(repo, collection.git_url, config.GIT_REMOTE_NAME)
 
     # prep log entries
     if agent:
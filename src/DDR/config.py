@@ -89,6 +89,23 @@ ACCESS_FILE_EXTENSION = CONFIG.get('cmdln','access_file_extension')
 ACCESS_FILE_SUFFIX = ACCESS_FILE_APPEND + ACCESS_FILE_EXTENSION
 ACCESS_FILE_GEOMETRY = CONFIG.get('cmdln','access_file_geometry')
 ACCESS_FILE_OPTIONS  = CONFIG.get('cmdln','access_file_options')
+# Number of access files made concurrently during batch imports
+ACCESS_FILE_WORKERS = CONFIG.getint('cmdln','access_file_workers', fallback=1)
+# ImageMagick memory/map limit per access file job (ex: '512MiB')
+ACCESS_FILE_MEMORY_LIMIT = CONFIG.get('cmdln','access_file_memory_limit', fallback='')
+# Cache of access files keyed by master SHA256 (see DDR.accesscache)
+ACCESS_CACHE_DIR = CONFIG.get('cmdln','access_cache_dir', fallback='')
+ACCESS_CACHE_MAX_MB = CONFIG.getint('cmdln','access_cache_max_mb', fallback=10240)
+# Hard-link same-filesystem source files into repo instead of copying
+INGEST_HARDLINK = CONFIG.getboolean('cmdln','ingest_hardlink', fallback=False)
+# Number of files hashed/copied ahead of the writer during batch imports
+INGEST_WORKERS = CONFIG.getint('cmdln','ingest_workers', fallback=1)
+# Number of processes loading objects during batch exports
+EXPORT_WORKERS = CONFIG.getint('cmdln','export_workers', fallback=1)
+# Number of collections updated at once by ddr-batch
+UPDATE_WORKERS = CONFIG.getint('cmdln','update_workers', fallback=1)
+# Rows imported between journal checkpoints (see batch.ImportJournal)
+IMPORT_CHECKPOINT_ROWS = CONFIG.getint('cmdln','import_checkpoint_rows', fallback=500)
 
 THUMBNAIL_GEOMETRY   = CONFIG.get('cmdln','thumbnail_geometry')
 THUMBNAIL_COLORSPACE = 'sRGB'
@@ -1,4 +1,7 @@
+from concurrent.futures import ProcessPoolExecutor
+import itertools
 import logging
+import types
 from typing import Any, Dict, List, Match, Optional, Set, Tuple, Union
 
 from DDR import identifier
@@ -27,13 +30,22 @@ def make_rowds(
 ):  # -> Tuple[List[str], List[Dict[str,str]], List[str]]:
     """Takes list of rows (from csv lib) and turns into list of rowds (dicts)
     
-    @param rows: list
+    rows may also be an iterator such as fileio.iter_csv, in which case
+    row_start and row_end must not be negative.
+    
+    @param rows: list or iterator
     @returns: (headers, list of dicts, list of errors)
     """
-    headers = [_strip_str(data) for data in rows.pop(0)]
+    if isinstance(rows, list):
+        headers = [_strip_str(data) for data in rows.pop(0)]
+        rows = rows[row_start:row_end]
+    else:
+        rows = iter(rows)
+        headers = [_strip_str(data) for data in next(rows)]
+        rows = itertools.islice(rows, row_start, row_end)
     rowds = []
     errors = []
-    for n,row in enumerate(rows[row_start:row_end]):
+    for n,row in enumerate(rows):
         try:
             rowd = make_row_dict(headers, row)
             rowds.append(rowd)
@@ -163,19 +175,43 @@ def check_row_values(module, headers, valid_values, rowd):
     @param rowd: A single row (dict, not list of fields)
     @returns: list of invalid values
     """
+    return _check_row(
+        _row_validators(module.module, headers), valid_values, rowd
+    )
+
+def _row_validators(module, headers):
+    """Looks up csvload_* and csvvalidate_* functions for headers once
+    
+    Same lookup as modules.Module.function, which otherwise runs for
+    every field of every row.
+    
+    @param module: collection, entity, files model definitions module
+    @param headers: List of field names
+    @returns: list of (field, csvload function or None, csvvalidate function or None)
+    """
+    names = set(dir(module))
+    def lookup(function_name):
+        if function_name in names:
+            return getattr(module, function_name)
+        return None
+    return [
+        (field, lookup('csvload_%s' % field), lookup('csvvalidate_%s' % field))
+        for field in headers
+    ]
+
+def _check_row(validators, valid_values, rowd):
+    """check_row_values using validators from _row_validators"""
     invalid = []
     if not validate_id(rowd['id']):
         invalid.append('id')
-    for field in headers:
+    for field,csvload,csvvalidate in validators:
         try:
-            value = module.function(
-                'csvload_%s' % field,
-                rowd[field]
-            )
-            valid = module.function(
-                'csvvalidate_%s' % field,
-                [valid_values, value]
-            )
+            value = rowd[field]
+            if csvload:
+                value = csvload(value)
+            valid = [valid_values, value]
+            if csvvalidate:
+                valid = csvvalidate(valid)
             if not valid:
                 invalid.append(field)
         except KeyError as err:
@@ -193,32 +229,41 @@ def find_duplicate_ids(rowds):
     @returns: list of errors (n, duplicate ID)
     """
     errs = []
-    ids = []
+    ids = set()
     for n,rowd in enumerate(rowds):
         if rowd['id'] in ids:
             msg = 'row %s: %s' % (n, rowd['id'])
             errs.append(msg)
         else:
-            ids.append(rowd['id'])
+            ids.add(rowd['id'])
     return errs
 
 def find_multiple_cids(rowds):
     """Look for pointers to multiple collections
     
+    Rows under a collection that has already been seen can't add a new
+    collection ID, so only the first row for each collection is parsed.
+    
     @param rowds: list of dicts
     @returns: list of errors (n, cid)
     """
     cids = []
+    prefixes = ()
     for n,rowd in enumerate(rowds):
-        try:
-            oid = identifier.Identifier(rowd['id'])
-        except identifier.InvalidInputException:
-            continue
-        except identifier.InvalidIdentifierException:
+        if (rowd['id'] in cids) or rowd['id'].startswith(prefixes):
             continue
-        cid = oid.collection().id
+        oid = rowd.get('identifier')
+        if not oid:
+            try:
+                oid = identifier.Identifier(id=rowd['id'])
+            except identifier.InvalidInputException:
+                continue
+            except identifier.InvalidIdentifierException:
+                continue
+        cid = oid.collection_id()
         if cid not in cids:
             cids.append(cid)
+            prefixes = tuple('%s-' % c for c in cids)
     if len(cids) > 1:
         return cids
     return []
@@ -237,23 +282,91 @@ def find_missing_required(required_fields, rowds):
             errs.append(f"row {n}: {', '.join(bad_fields)}")
     return errs
 
-def find_invalid_values(module, headers, valid_values, rowds):
+def find_invalid_values(module, headers, valid_values, rowds, workers=1):
     """Find controlled-vocab fields that contain bad data.
     
     @param module: modules.Module object
     @param headers: List of field names
     @param valid_values:
     @param rowds: list of dicts
+    @param workers: int Number of processes to validate rows in
     @returns: list of strings (row n, object ID, bad_fields)
     """
+    if (workers > 1) and (len(rowds) > VALIDATE_CHUNK_MIN):
+        results = _check_rows_parallel(
+            module, headers, valid_values, rowds, workers
+        )
+    else:
+        validators = _row_validators(module.module, headers)
+        results = [
+            (n, _check_row(validators, valid_values, rowd))
+            for n,rowd in enumerate(rowds)
+        ]
     errs = []
-    for n,rowd in enumerate(rowds):
-        bad_fields = check_row_values(module, headers, valid_values, rowd)
+    for n,bad_fields in results:
         if bad_fields:
             errs.append(f"row {n}: {', '.join(bad_fields)}")
     return errs
+
+# Smallest number of rows sent to a validation worker at once
+VALIDATE_CHUNK_MIN = 500
+
+# Set in each validation worker process by _init_validate_worker
+_WORKER_VALIDATORS = None
+_WORKER_VALID_VALUES = None
+
+def _init_validate_worker(module, headers, valid_values):
+    """Look up validators and keep vocabs once per worker process
+    
+    @param module: Module name, or (picklable) module-like object
+    @param headers: List of field names
+    @param valid_values:
+    """
+    global _WORKER_VALIDATORS
+    global _WORKER_VALID_VALUES
+    if isinstance(module, str):
+        module = identifier.module_for_name(module)
+    _WORKER_VALIDATORS = _row_validators(module, headers)
+    _WORKER_VALID_VALUES = valid_values
+
+def _check_rows_chunk(start, rowds):
+    return [
+        (start + n, _check_row(_WORKER_VALIDATORS, _WORKER_VALID_VALUES, rowd))
+        for n,rowd in enumerate(rowds)
+    ]
+
+def _check_rows_parallel(module, headers, valid_values, rowds, workers):
+    """Validate chunks of rows in a process pool
+    
+    Only the fields being checked are sent to workers.
+    
+    @returns: list of (n, bad_fields) in row order
+    """
+    # modules can't be pickled; workers import them by name
+    module = module.module
+    if isinstance(module, types.ModuleType):
+        module = module.__name__
+    fields = ['id'] + list(headers)
+    chunk_size = max(VALIDATE_CHUNK_MIN, len(rowds) // (workers * 4) + 1)
+    results = []
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_validate_worker,
+            initargs=(module, headers, valid_values)) as executor:
+        futures = [
+            executor.submit(
+                _check_rows_chunk, start, [
+                    {key: rowd[key] for key in fields if key in rowd}
+                    for rowd in rowds[start:start + chunk_size]
+                ]
+            )
+            for start in range(0, len(rowds), chunk_size)
+        ]
+        for future in futures:
+            results.extend(future.result())
+    return results
     
-def validate_rowds(module, headers, required_fields, valid_values, rowds, find_dupes=True):
+def validate_rowds(module, headers, required_fields, valid_values, rowds, find_dupes=True, workers=1):
     """Examines rows and raises exceptions if problems.
     
     Looks for
@@ -268,11 +381,14 @@ def validate_rowds(module, headers, required_fields, valid_values, rowds, find_d
     @param valid_values:
     @param rowds: List of row dicts
     @param find_dupes: boolean (should be False for new files)
+    @param workers: int Number of processes to check field values in
     """
     errs = {}
     multiple_cids = find_multiple_cids(rowds)
     missing_required = find_missing_required(required_fields, rowds)
-    invalid_values = find_invalid_values(module, headers, valid_values, rowds)
+    invalid_values = find_invalid_values(
+        module, headers, valid_values, rowds, workers
+    )
     if find_dupes:
         duplicate_ids = find_duplicate_ids(rowds)
         if duplicate_ids:
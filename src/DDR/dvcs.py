@@ -9,6 +9,8 @@ import os
 import re
 import shutil
 import socket
+import subprocess
+import tempfile
 from typing import Any, Dict, List, Optional, Set, Tuple, Union
 
 from bs4 import BeautifulSoup
@@ -243,8 +245,7 @@ def list_untracked(repo: git.Repo) -> List[str]:
     @param repo: A Gitpython Repo object
     @return: List of filenames
     """
-    stdout = repo_status(repo, short=True)
-    return _parse_list_untracked(stdout)
+    return status(repo).untracked
 
 def _parse_list_modified(diff: str) -> List[str]:
     """Parses output of "git stage --name-only".
@@ -320,13 +321,105 @@ def list_conflicted(repo: git.Repo) -> List[str]:
     stdout = repo.git.ls_files('--unmerged')
     return _parse_list_conflicted(stdout)
 
+class GitStatus():
+    """Parsed output of `git status --porcelain=v2 -z --branch`
+    
+    Lists of paths are relative to the repo base, in git's order.
+    Unmerged paths are in conflicted and also in modified (as with
+    `git diff --name-only`).  ahead/behind are None if there is
+    no upstream.
+    """
+    branch = None
+    oid = None
+    upstream = None
+    ahead = None
+    behind = None
+    
+    def __init__(self):
+        self.staged: List[str] = []
+        self.modified: List[str] = []
+        self.untracked: List[str] = []
+        self.conflicted: List[str] = []
+    
+    def __repr__(self):
+        return "<%s.%s %s staged:%s modified:%s untracked:%s conflicted:%s>" % (
+            self.__module__, self.__class__.__name__, self.branch,
+            len(self.staged), len(self.modified), len(self.untracked),
+            len(self.conflicted),
+        )
+    
+    def dict(self) -> Dict[str, List[str]]:
+        return {
+            'staged': self.staged,
+            'modified': self.modified,
+            'untracked': self.untracked,
+            'conflicted': self.conflicted,
+        }
+
+def _parse_status_v2(text: str) -> GitStatus:
+    """Parses output of "git status --porcelain=v2 -z --branch".
+    
+    See git-status(1) "Porcelain Format Version 2".
+    """
+    st = GitStatus()
+    fields = text.split('\0')
+    n = 0
+    while n < len(fields):
+        entry = fields[n]
+        n += 1
+        if not entry:
+            continue
+        kind = entry[0]
+        if kind == '#':
+            key,_,value = entry[2:].partition(' ')
+            if key == 'branch.oid':
+                st.oid = None if value == '(initial)' else value
+            elif key == 'branch.head':
+                st.branch = None if value == '(detached)' else value
+            elif key == 'branch.upstream':
+                st.upstream = value
+            elif key == 'branch.ab':
+                ahead,behind = value.split(' ')
+                st.ahead,st.behind = int(ahead), abs(int(behind))
+        elif kind in ['1', '2']:
+            # 1 XY sub mH mI mW hH hI path
+            # 2 XY sub mH mI mW hH hI Xscore path NUL origPath
+            parts = entry.split(' ', 8 if kind == '1' else 9)
+            xy,path = parts[1],parts[-1]
+            if kind == '2':
+                n += 1  # skip origPath
+            if xy[0] != '.':
+                st.staged.append(path)
+            if xy[1] != '.':
+                st.modified.append(path)
+        elif kind == 'u':
+            # u XY sub m1 m2 m3 mW h1 h2 h3 path
+            path = entry.split(' ', 10)[-1]
+            st.conflicted.append(path)
+            st.modified.append(path)
+        elif kind == '?':
+            st.untracked.append(entry[2:])
+    return st
+
+def status(repo: git.Repo, untracked: bool=True) -> GitStatus:
+    """Staged, modified, untracked, conflicted files and branch info
+    
+    Runs a single `git status --porcelain=v2 -z --branch`.
+    Use this when several of these are needed rather than calling
+    list_staged, list_modified, etc separately; for only one of them
+    the list_* functions (`git diff --name-only`) are cheaper.
+    
+    @param repo: A Gitpython Repo object
+    @param untracked: bool Set False to skip scanning for untracked files
+    @returns: GitStatus
+    """
+    args = ['--porcelain=v2', '-z', '--branch']
+    if not untracked:
+        args.append('--untracked-files=no')
+    return _parse_status_v2(repo.git.status(*args))
+
 def git_status(repo: git.Repo) -> Dict[str, List[str]]:
-    return {
-        'staged': list_staged(repo),
-        'modified': list_modified(repo),
-        'untracked': list_untracked(repo),
-        'conflicted': list_conflicted(repo),
-    }
+    return status(repo).dict()
 
 def file_in_git_objects(repo: git.Repo, path_rel: str) -> bool:
     """True if the (binary) file is in .git/objects
@@ -1225,14 +1318,157 @@ def annex_trim(repo, confirmed=False):
         'dropped':dropped,
     }
 
-def annex_stage(repo: git.Repo, annex_files: List[str]=[]):
+ANNEX_ADD_BATCH_CMD = [
+    'git', 'annex', 'add', '--batch', '--json', '--json-error-messages'
+]
+
+def _parse_annex_add_json(path: str, line: str) -> Dict[str, object]:
+    """Parse one line of `git annex add --batch --json` output
+    
+    git-annex writes a blank line for paths it does not add
+    (e.g. files that are gitignored or already annexed and unchanged).
+    It does the same for paths that do not exist, so AnnexAddBatch.add
+    does not send those.
+    
+    @param path: str Path that was written to git-annex
+    @param line: str
+    @returns: dict with at least 'file' and 'success'; 'skipped' if blank
+    """
+    line = line.strip()
+    if not line:
+        return {'file': path, 'success': True, 'skipped': True}
+    result = json.loads(line)
+    result.setdefault('file', path)
+    result.setdefault('success', False)
+    return result
+
+class AnnexAddBatch():
+    """Long-lived `git annex add --batch --json` process
+    
+    Paths are written to the process one per line and each path's JSON
+    result is read back, so any number of files can be annexed with one
+    git-annex process (and no command-line length limit).
+    
+    >>> with AnnexAddBatch(repo) as batch:
+    ...     for path in annex_files:
+    ...         result = batch.add(path)
+    """
+    
+    def __init__(self, repo: git.Repo):
+        """
+        @param repo: A GitPython repository
+        """
+        self.repo = repo
+        self.proc = None
+        self.stderr = None
+    
+    def __repr__(self):
+        return "<%s.%s %s>" % (
+            self.__module__, self.__class__.__name__, self.repo.working_dir
+        )
+    
+    def __enter__(self):
+        self.start()
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        self.close()
+    
+    def start(self):
+        # stderr goes to a file so a chatty git-annex can't fill the pipe
+        # and block while we wait on stdout
+        self.stderr = tempfile.TemporaryFile()
+        self.proc = subprocess.Popen(
+            ANNEX_ADD_BATCH_CMD,
+            cwd=self.repo.working_dir,
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=self.stderr,
+            text=True, bufsize=1,  # line buffered
+        )
+    
+    def add(self, path: str) -> Dict[str, object]:
+        """git-annex-add one file
+        
+        @param path: str Path relative to repo base
+        @returns: dict Parsed JSON result (see _parse_annex_add_json)
+        """
+        if '\n' in path:
+            raise ValueError('Cannot annex path containing newline: %s' % path)
+        # git-annex skips missing paths silently; report them as failures
+        if not os.path.lexists(os.path.join(self.repo.working_dir, path)):
+            return {
+                'file': path, 'success': False,
+                'error-messages': ['%s not found' % path],
+            }
+        if not self.proc:
+            self.start()
+        self.proc.stdin.write(path + '\n')
+        self.proc.stdin.flush()
+        line = self.proc.stdout.readline()
+        if not line:
+            raise GitCommandError(
+                ANNEX_ADD_BATCH_CMD, self.proc.poll(), self.errors()
+            )
+        return _parse_annex_add_json(path, line)
+    
+    def errors(self) -> str:
+        if not self.stderr:
+            return ''
+        self.stderr.seek(0)
+        return self.stderr.read().decode('utf-8', errors='replace')
+    
+    def close(self) -> int:
+        """Close stdin so git-annex finishes and exits
+        
+        @returns: int git-annex exit status
+        """
+        status = None
+        if self.proc:
+            self.proc.stdin.close()
+            status = self.proc.wait()
+            self.proc.stdout.close()
+            self.proc = None
+        if self.stderr:
+            self.stderr.close()
+            self.stderr = None
+        return status
+
+def annex_add_batch(repo: git.Repo,
+                    annex_files: List[str]=[]) -> List[Dict[str, object]]:
+    """git-annex-add files using one `git annex add --batch` process
+    
+    @param repo: A GitPython repository
+    @param annex_files: list of annex file paths, relative to repo base
+    @returns: list of results (see _parse_annex_add_json), in order
+    """
+    if not annex_files:
+        return []
+    with AnnexAddBatch(repo) as batch:
+        return [batch.add(path) for path in annex_files]
+
+def annex_stage(repo: git.Repo,
+                annex_files: List[str]=[]) -> List[Dict[str, object]]:
     """Stage some files with git-annex.
     
     @param repo: A GitPython repository
     @param annex_files: list of annex file paths, relative to repo base
+    @returns: list of annex_add_batch results
     """
-    for path in annex_files:
-        repo.git.annex('add', path)
+    results = annex_add_batch(repo, annex_files)
+    failed = [result for result in results if not result['success']]
+    if failed:
+        raise GitCommandError(
+            ANNEX_ADD_BATCH_CMD, 1,
+            'Could not annex {} files: {}'.format(
+                len(failed),
+                ', '.join([
+                    '{} ({})'.format(
+                        r['file'], '; '.join(r.get('error-messages', []))
+                    )
+                    for r in failed
+                ])
+            )
+        )
+    return results
 
 def annex_file_targets(repo: git.Repo,
                        relative: bool=False) -> List[Tuple[Any, Any]]:
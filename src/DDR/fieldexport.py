@@ -0,0 +1,287 @@
+"""
+fieldexport - stream field values from many objects to CSV, JSONL, or Parquet
+
+Objects are not instantiated.  Each .json file is read once and parsed
+only as far as the last requested field (see load_fields), and all rows
+go through one writer for the whole export.
+
+>>> paths = util.find_meta_files(collection_path, model='entity', recursive=1, force_read=1)
+>>> headers = ['id', 'fieldname', 'value']
+>>> with fieldexport.open_writer('parquet', '/tmp/creators.parquet', headers) as writer:
+...     for oid,fieldname,value in fieldexport.field_values(paths, ['creators']):
+...         writer.write([oid, fieldname, value])
+
+Parquet output needs pyarrow (pip install ddr-cmdln[parquet]).
+"""
+
+from datetime import datetime
+import json
+import re
+import sys
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from DDR import config
+from DDR import fileio
+from DDR import identifier
+from DDR import util
+
+FORMATS = ['csv', 'jsonl', 'parquet']
+
+# rows buffered before writing a Parquet row group
+PARQUET_BATCH_ROWS = 10000
+
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = re.compile(r'\s*')
+
+def _iter_list(text: str) -> Iterator[Any]:
+    """Parse and yield the items of a JSON list one at a time
+
+    Items after the last one consumed are not parsed.
+
+    @param text: str JSON text of a list
+    """
+    pos = _WHITESPACE.match(text).end()
+    if not text.startswith('[', pos):
+        raise json.JSONDecodeError('Expecting "["', text, pos)
+    pos = _WHITESPACE.match(text, pos + 1).end()
+    if text.startswith(']', pos):
+        return
+    while True:
+        item,pos = _DECODER.raw_decode(text, pos)
+        yield item
+        pos = _WHITESPACE.match(text, pos).end()
+        if text.startswith(']', pos):
+            return
+        if not text.startswith(',', pos):
+            raise json.JSONDecodeError('Expecting "," delimiter', text, pos)
+        pos = _WHITESPACE.match(text, pos + 1).end()
+
+def load_fields(json_path: str, fieldnames: List[str]) -> Dict[str, Any]:
+    """Read only the named fields from an object's .json file
+
+    Items of the document are parsed in order until all the named
+    fields are found; the rest of the document is not parsed.
+    Returns raw JSON values; jsonload_* functions are not applied.
+    Missing fields are left out.
+
+    @param json_path: str Absolute path to .json file
+    @param fieldnames: list
+    @returns: dict
+    """
+    wanted = set(fieldnames)
+    fields = {}
+    if not wanted:
+        return fields
+    for item in _iter_list(fileio.read_text(json_path)):
+        # first item is object metadata, the rest are {fieldname: value}
+        if not isinstance(item, dict) or len(item) != 1:
+            continue
+        fieldname,value = next(iter(item.items()))
+        if fieldname in wanted:
+            fields[fieldname] = value
+            if len(fields) == len(wanted):
+                break
+    return fields
+
+def field_values(json_paths: List[str], fieldnames: List[str],
+                 module=None) -> Iterator[Tuple[str, str, Any]]:
+    """Yield (object_id, fieldname, value) for each object and field
+
+    If module is given, values are converted to the CSV cell text that
+    models.common.prep_csv would give for the loaded object (see
+    _csv_value).  Otherwise raw JSON values are returned.
+
+    @param json_paths: list of .json files
+    @param fieldnames: list
+    @param module: modules.Module (optional)
+    """
+    model_fields = {}
+    if module:
+        model_fields = {f['name']: f for f in module.module.FIELDS}
+    for json_path in json_paths:
+        oi = identifier.Identifier(json_path)
+        fields = load_fields(json_path, fieldnames)
+        for fieldname in fieldnames:
+            if module:
+                value = _csv_value(
+                    module, model_fields.get(fieldname), fieldname, fields, oi
+                )
+            else:
+                value = fields.get(fieldname)
+            yield oi.id,fieldname,value
+
+def _csv_value(module, model_field, fieldname, fields, oi):
+    """Convert a raw JSON value to CSV cell text
+
+    Same steps as models.common.load_json (jsonload_*, strip, FIELDS
+    default for missing fields, time zone for naive datetimes) followed
+    by models.common.prep_csv (csvdump_*, normalize_text).
+
+    @param module: modules.Module
+    @param model_field: dict Field from module FIELDS, or None
+    @param fieldname: str
+    @param fields: dict Output of load_fields
+    @param oi: Identifier
+    @returns: str
+    """
+    if not model_field:
+        # not loaded from JSON by load_json
+        if fieldname not in fields:
+            return ''
+        value = fields[fieldname]
+    elif fieldname in fields:
+        value = module.function('jsonload_%s' % fieldname, fields[fieldname])
+        if isinstance(value, str):
+            value = value.strip()
+    else:
+        value = model_field.get('default', None)
+    if model_field and (model_field['model_type'] == datetime) \
+    and isinstance(value, datetime) and not value.tzinfo:
+        value = value.replace(
+            tzinfo=config.ALT_TIMEZONES.get(oi.idparts['org'], config.TZ)
+        )
+    value = module.function('csvdump_%s' % fieldname, value)
+    if value is None:
+        return ''
+    return util.normalize_text(value)
+
+
+class Writer():
+    """Base class for export writers; closed when used as a context manager
+    """
+
+    def __init__(self, f, headers: List[str], close_file: bool=False):
+        """
+        @param f: File object
+        @param headers: list
+        @param close_file: bool Close f when the writer is closed
+        """
+        self.f = f
+        self.headers = headers
+        self.close_file = close_file
+
+    def write(self, row: List[Any]):
+        raise NotImplementedError
+
+    def close(self):
+        if self.close_file:
+            self.f.close()
+        else:
+            self.f.flush()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CSVWriter(Writer):
+    """Writes rows to a text file through one csv.writer
+    """
+
+    def __init__(self, f, headers: List[str], close_file: bool=False,
+                 lineterminator: str='\r\n'):
+        """
+        @param f: Text file object
+        @param headers: list
+        @param close_file: bool Close f when the writer is closed
+        @param lineterminator: str CSV line ending
+        """
+        super().__init__(f, headers, close_file)
+        self.writer = fileio.csv_writer(self.f, lineterminator)
+        self.writer.writerow(self.headers)
+
+    def write(self, row: List[Any]):
+        self.writer.writerow(row)
+
+
+class JSONLWriter(Writer):
+    """Writes rows as JSON objects, one per line
+    """
+
+    def write(self, row: List[Any]):
+        self.f.write(json.dumps(dict(zip(self.headers, row))))
+        self.f.write('\n')
+
+
+class ParquetWriter(Writer):
+    """Writes rows to an Apache Parquet file of string columns
+
+    Non-string values are stored as JSON text.
+    """
+
+    def __init__(self, f, headers: List[str],
+                 batch_rows: int=PARQUET_BATCH_ROWS):
+        """
+        @param f: str path or binary file object
+        @param headers: list
+        @param batch_rows: int Rows per row group
+        """
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise Exception(
+                'Parquet output requires pyarrow (pip install ddr-cmdln[parquet])'
+            )
+        super().__init__(f, headers)
+        self.pa = pyarrow
+        self.batch_rows = batch_rows
+        self.schema = pyarrow.schema(
+            [(header, pyarrow.string()) for header in headers]
+        )
+        self.writer = pyarrow.parquet.ParquetWriter(f, self.schema)
+        self.columns = [[] for header in headers]
+
+    def write(self, row: List[Any]):
+        for column,value in zip(self.columns, row):
+            if not (value is None or isinstance(value, str)):
+                value = json.dumps(value)
+            column.append(value)
+        if len(self.columns[0]) >= self.batch_rows:
+            self._flush()
+
+    def _flush(self):
+        if self.columns[0]:
+            self.writer.write_table(
+                self.pa.table(self.columns, schema=self.schema)
+            )
+            self.columns = [[] for header in self.headers]
+
+    def close(self):
+        self._flush()
+        self.writer.close()
+
+
+WRITERS = {
+    'csv': CSVWriter,
+    'jsonl': JSONLWriter,
+    'parquet': ParquetWriter,
+}
+
+def open_writer(fmt: str, output: Optional[str], headers: List[str]):
+    """Writer for the format, to a file or stdout
+
+    Files opened here are closed when the writer is closed.
+
+    @param fmt: str One of FORMATS
+    @param output: str Absolute path, or None for stdout (CSV and JSONL only)
+    @param headers: list
+    @returns: Writer
+    """
+    if fmt not in WRITERS:
+        raise Exception('Unknown format "%s" (%s)' % (fmt, ', '.join(FORMATS)))
+    if fmt == 'parquet':
+        if not output:
+            raise Exception('Parquet output must be written to a file')
+        return ParquetWriter(output, headers)
+    if not output and (fmt == 'csv'):
+        # plain newlines on the terminal
+        return CSVWriter(sys.stdout, headers, lineterminator='\n')
+    if not output:
+        return WRITERS[fmt](sys.stdout, headers)
+    return WRITERS[fmt](
+        open(output, 'w', newline='', encoding='utf-8'), headers, close_file=True
+    )
@@ -3,6 +3,8 @@ import csv
 import io
 import json
 import os
+import re
+import struct
 import sys
 from typing import Any, Dict, List, Match, Optional, Set, Tuple, Union
 
@@ -41,6 +43,42 @@ def append_text(text: str, path: str):
             f.write('\n')
         f.write(text)
 
+def append_jsonl(path: str, entries: List[Any]):
+    """Append entries to a JSON Lines file and fsync it.
+    
+    If a previous write was cut off mid-line by a crash, a newline is
+    added first so the new entries are still readable.
+    
+    @param path: str Absolute path to file.
+    @param entries: list of JSON-serializable objects
+    """
+    with open(path, 'ab+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+        for entry in entries:
+            f.write((json.dumps(entry, default=str) + '\n').encode('utf-8'))
+        f.flush()
+        os.fsync(f.fileno())
+
+def read_jsonl(path: str):
+    """Yield entries from a JSON Lines file, skipping unreadable lines.
+    
+    Lines cut off by a crash (see append_jsonl) are skipped.
+    
+    @param path: str Absolute path to file.
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
 
 # Some files' XMP data is wayyyyyy too big
 csv.field_size_limit(sys.maxsize)
@@ -61,16 +99,18 @@ def csv_reader(csvfile):
     )
     return reader
 
-def csv_writer(csvfile):
+def csv_writer(csvfile, lineterminator='\r\n'):
     """Get a csv.writer object for the file.
     
     @param csvfile: A file object.
+    @param lineterminator: str
     """
     writer = csv.writer(
         csvfile,
         delimiter=CSV_DELIMITER,
         quoting=CSV_QUOTING,
         quotechar=CSV_QUOTECHAR,
+        lineterminator=lineterminator,
     )
     return writer
 
@@ -110,6 +150,146 @@ def read_csv(path: str) -> List[Dict[str,str]]:
             rows.append(row)
     return rows
 
+def iter_csv(path: str,
+             row_start: int=0,
+             row_end: Optional[int]=None,
+             index: bool=False):
+    """Iterate over CSV rows without reading the whole file.
+    
+    Yields the header row, then data rows row_start through row_end-1
+    (zero-indexed, not counting the header), like
+    read_csv(path)[0] + read_csv(path)[1:][row_start:row_end].
+    Rows before row_start are skipped by seeking to their byte offset
+    instead of parsing them.  If index is True the offsets are kept
+    in a sidecar file (see csv_row_offset).  The file is opened in binary
+    mode for the seek and read through an io.TextIOWrapper.
+    
+    >>> rows = fileio.iter_csv(path, row_start=100000, row_end=100500)
+    >>> headers = next(rows)
+    >>> for row in rows:
+    ...     import_row(headers, row)
+    
+    @param path: Absolute path to CSV file
+    @param row_start: int First data row (must not be negative)
+    @param row_end: int (optional) Stop before this data row
+    @param index: bool Use or make the sidecar row index
+    @returns generator of rows
+    """
+    with open(path, 'rb') as f:
+        text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+        reader = csv_reader(text)
+        headers = next(reader, None)
+        if headers is None:
+            return
+        yield headers
+        if row_start:
+            offset = csv_row_offset(path, row_start + 1, index)
+            if offset is None:
+                return
+            # discard text read ahead of the header
+            text.detach()
+            f.seek(offset)
+            text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+            reader = csv_reader(text)
+        for n,row in enumerate(reader, row_start):
+            if (row_end is not None) and (n >= row_end):
+                break
+            yield row
+
+# Sidecar CSV row index: source mtime_ns and size, then one byte
+# offset per CSV record (header is record 0), as little-endian int64s.
+CSV_INDEX_SUFFIX = '.rowidx'
+_CSV_INDEX_INT = struct.Struct('<q')
+
+# a line as split by a text file opened with newline='':
+# ends in \r\n, \n, or a bare \r
+_CSV_LINE = re.compile(rb'[^\r\n]*(?:\r\n|\r|\n)|[^\r\n]+')
+
+def csv_record_offsets(path: str):
+    """Yield byte offset of each CSV record.
+    
+    Records are found by csv_reader, so newlines inside quoted fields,
+    quote chars in unquoted fields, and \r line endings are handled the
+    same as when the rows are read.  The file is split into lines as
+    bytes and the bytes of the lines the reader has taken are counted.
+    
+    @param path: Absolute path to CSV file
+    @returns generator of ints
+    """
+    consumed = [0]
+    def lines(f):
+        for chunk in f:
+            for line in _CSV_LINE.findall(chunk):
+                consumed[0] += len(line)
+                yield line.decode('utf-8')
+    with open(path, 'rb') as f:
+        offset = 0
+        for row in csv_reader(lines(f)):
+            yield offset
+            offset = consumed[0]
+
+def write_csv_index(path: str) -> str:
+    """Write sidecar row index for CSV file.
+    
+    @param path: Absolute path to CSV file
+    @returns str Absolute path to index
+    """
+    index_path = path + CSV_INDEX_SUFFIX
+    tmp_path = '%s.%s.tmp' % (index_path, os.getpid())
+    st = os.stat(path)
+    with open(tmp_path, 'wb') as f:
+        f.write(_CSV_INDEX_INT.pack(st.st_mtime_ns))
+        f.write(_CSV_INDEX_INT.pack(st.st_size))
+        for offset in csv_record_offsets(path):
+            f.write(_CSV_INDEX_INT.pack(offset))
+    os.replace(tmp_path, index_path)
+    return index_path
+
+def _read_csv_index(path: str, record: int) -> Optional[int]:
+    """Offset of record from sidecar index; raises ValueError if stale"""
+    index_path = path + CSV_INDEX_SUFFIX
+    size = _CSV_INDEX_INT.size
+    st = os.stat(path)
+    with open(index_path, 'rb') as f:
+        header = f.read(size * 2)
+        if (len(header) != size * 2) or (
+                (_CSV_INDEX_INT.unpack(header[:size])[0],
+                 _CSV_INDEX_INT.unpack(header[size:])[0])
+                != (st.st_mtime_ns, st.st_size)):
+            raise ValueError('Stale CSV index %s' % index_path)
+        f.seek(size * (2 + record))
+        data = f.read(size)
+    if len(data) < size:
+        return None
+    return _CSV_INDEX_INT.unpack(data)[0]
+
+def csv_row_offset(path: str, record: int, index: bool=False) -> Optional[int]:
+    """Byte offset of the start of a CSV record (header is record 0).
+    
+    With index=True the offset is read from the sidecar index, which is
+    (re)written if missing or older than the CSV.  If the index can't be
+    written (ex: read-only dir) the file is scanned instead.
+    
+    @param path: Absolute path to CSV file
+    @param record: int
+    @param index: bool Use or make the sidecar row index
+    @returns int, or None if file has fewer records
+    """
+    if index:
+        try:
+            return _read_csv_index(path, record)
+        except (OSError, ValueError):
+            pass
+        try:
+            write_csv_index(path)
+            return _read_csv_index(path, record)
+        except (OSError, ValueError):
+            pass
+    for n,offset in enumerate(csv_record_offsets(path)):
+        if n == record:
+            return offset
+    return None
+
 def write_csv(path: str,
               headers: List[str],
               rows: List[Dict[str,str]],
@@ -23,15 +23,20 @@ CalledProcessError: Command 'identify /tmp/DDRWorkbenchScreenShots.docx' returne
 
 from datetime import datetime
 import os
+import re
 import subprocess
 
 import envoy
 import libxmp
 
 IDENTIFY_CMD = 'identify "{path}"'
-CONVERT_CMD  = "convert {options} \"{src}\"[0] -resize '{geometry}' {dest}"
+CONVERT_CMD  = "convert {options} \"{src}\"{frame} -resize '{geometry}' {dest}"
 CONVERT_LARGEFILE_THRESHOLD = 768 * 1000
 CONVERT_LARGEFILE_OPTIONS = '-limit memory 2GB -limit map 4GB'
+CONVERT_MEMORY_LIMIT_OPTIONS = '-limit memory {limit} -limit map {limit}'
+# Increment when changes to the commands above change the files they make;
+# part of the accesscache key.
+CONVERT_VERSION = 1
 
 
 def analyze_magick(std_out, std_err):
@@ -100,36 +105,222 @@ def analyze(path):
         raise Exception(r.std_err)
     return analyze_magick(r.std_out, r.std_err)
 
+def _jpeg_segments(f):
+    """Yield (marker, length) of JPEG segments up to and including SOS
+    
+    The file is positioned at the start of each segment's data when
+    it is yielded; callers may read from it.
+    """
+    pos = 2
+    while True:
+        f.seek(pos)
+        marker = f.read(4)
+        if (len(marker) < 4) or (marker[0] != 0xFF):
+            return
+        code = marker[1]
+        length = int.from_bytes(marker[2:4], 'big')
+        yield code,length
+        if code == 0xDA:
+            return
+        pos += 2 + length
+
+# JPEG start-of-frame markers (not DHT, JPG, or DAC)
+JPEG_SOF_MARKERS = [
+    0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7,
+    0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF,
+]
+# TIFF tags
+TIFF_WIDTH_TAG = 256
+TIFF_HEIGHT_TAG = 257
+# Only look for PDF page count and size in the first part of the file
+PDF_SNIFF_BYTES = 1024 * 1024
+# /Count of a /Pages dict (not /Outlines), with keys in either order
+PDF_COUNT = re.compile(
+    rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)'
+    rb'|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b'
+)
+PDF_MEDIABOX = re.compile(
+    rb'/MediaBox\s*\[\s*(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s+(-?[\d.]+)\s*\]'
+)
+
+def _sniff_jpeg(f):
+    for code,length in _jpeg_segments(f):
+        if code in JPEG_SOF_MARKERS:
+            data = f.read(5)
+            if len(data) < 5:
+                return None
+            height = int.from_bytes(data[1:3], 'big')
+            width = int.from_bytes(data[3:5], 'big')
+            return 'JPEG',width,height,1
+    return None
+
+def _sniff_png(f):
+    f.seek(8)
+    header = f.read(16)
+    if header[4:8] != b'IHDR':
+        return None
+    width = int.from_bytes(header[8:12], 'big')
+    height = int.from_bytes(header[12:16], 'big')
+    return 'PNG',width,height,1
+
+def _sniff_tiff(f, byteorder):
+    """Dimensions from first IFD; frames by following the IFD chain"""
+    def read_int(n):
+        data = f.read(n)
+        if len(data) < n:
+            raise ValueError('truncated TIFF')
+        return int.from_bytes(data, byteorder)
+    f.seek(4)
+    offset = read_int(4)
+    width = height = None
+    frames = 0
+    seen = set()
+    while offset and (offset not in seen):
+        seen.add(offset)
+        f.seek(offset)
+        num = read_int(2)
+        entries = f.read(num * 12)
+        if len(entries) < num * 12:
+            raise ValueError('truncated TIFF')
+        if not frames:
+            for n in range(num):
+                entry = entries[n*12:n*12+12]
+                tag = int.from_bytes(entry[0:2], byteorder)
+                if tag not in [TIFF_WIDTH_TAG, TIFF_HEIGHT_TAG]:
+                    continue
+                # SHORT (3) or LONG (4)
+                if int.from_bytes(entry[2:4], byteorder) == 3:
+                    value = int.from_bytes(entry[8:10], byteorder)
+                else:
+                    value = int.from_bytes(entry[8:12], byteorder)
+                if tag == TIFF_WIDTH_TAG:
+                    width = value
+                else:
+                    height = value
+        frames += 1
+        offset = read_int(4)
+    if not (width and height):
+        return None
+    return 'TIFF',width,height,frames
+
+def _sniff_pdf(f):
+    """Page count and first MediaBox, if in first PDF_SNIFF_BYTES
+    
+    Page trees in compressed object streams are not visible so
+    frames may be None (unknown).
+    """
+    f.seek(0)
+    head = f.read(PDF_SNIFF_BYTES)
+    frames = None
+    counts = [
+        int(a or b) for a,b in PDF_COUNT.findall(head)
+    ]
+    if counts:
+        # root of the page tree has the largest count
+        frames = max(counts)
+    width = height = None
+    m = PDF_MEDIABOX.search(head)
+    if m:
+        x0,y0,x1,y1 = [float(n) for n in m.groups()]
+        width,height = round(abs(x1 - x0)), round(abs(y1 - y0))
+    return 'PDF',width,height,frames
+
+def sniff(path):
+    """Look at file headers and return dict of attributes like analyze()
+    
+    Recognizes JPEG, PNG, TIFF, and PDF without running ImageMagick.
+    Adds width, height (first frame/page; PDF in points), and
+    multiframe (None if unknown) to the analyze() fields.
+    
+    @param path: Absolute path to file
+    @returns: dict, or None if not recognized
+    """
+    try:
+        with open(path, 'rb') as f:
+            magic = f.read(8)
+            if magic[:3] == b'\xff\xd8\xff':
+                sniffed = _sniff_jpeg(f)
+            elif magic == b'\x89PNG\r\n\x1a\n':
+                sniffed = _sniff_png(f)
+            elif magic[:4] == b'II*\x00':
+                sniffed = _sniff_tiff(f, 'little')
+            elif magic[:4] == b'MM\x00*':
+                sniffed = _sniff_tiff(f, 'big')
+            elif magic[:5] == b'%PDF-':
+                sniffed = _sniff_pdf(f)
+            else:
+                sniffed = None
+    except (OSError, ValueError):
+        return None
+    if not sniffed:
+        return None
+    fmt,width,height,frames = sniffed
+    multiframe = None
+    if frames:
+        multiframe = frames > 1
+    return {
+        'path': path,
+        'format': fmt,
+        'frames': frames,
+        'can_thumbnail': None,
+        'std_out': '',
+        'std_err': '',
+        'image': True,
+        'width': width,
+        'height': height,
+        'multiframe': multiframe,
+    }
+
 def geometry_is_ok(geometry):
     if ('x' in geometry) and (len(geometry.split('x')) == 2):
         return True
     return False
 
-def _convert_cmd(src, dest, geometry, options=''):
+def _convert_cmd(src, dest, geometry, options='', memory_limit=None,
+                 analysis=None):
     """Prepare ImageMagick convert command
     
+    If the format is known from analysis (see sniff and analyze) it is
+    given to convert so it doesn't have to detect it, and single-frame
+    images are read without a frame selector.  Otherwise only the first
+    frame/page is read.
+    
     @param src: Absolute path to source file.
     @param dest: Absolute path to destination file.
     @param geometry: String (ex: '200x200')
     @param options: str
+    @param memory_limit: str ImageMagick memory/map limit (ex: '512MiB')
+    @param analysis: dict (optional) Output of sniff or analyze
     @returns: str
     """
-    if os.path.getsize(src) >= CONVERT_LARGEFILE_THRESHOLD:
+    source,frame = src,'[0]'
+    if analysis and analysis.get('image') and analysis.get('format'):
+        source = f"{analysis['format']}:{src}"
+        if analysis.get('frames') == 1:
+            frame = ''
+    if memory_limit:
+        options = ' '.join([
+            CONVERT_MEMORY_LIMIT_OPTIONS.format(limit=memory_limit), options
+        ]).strip()
+    elif os.path.getsize(src) >= CONVERT_LARGEFILE_THRESHOLD:
         options = CONVERT_LARGEFILE_OPTIONS
     return CONVERT_CMD.format(
-        options=options, src=src, geometry=geometry, dest=dest
+        options=options, src=source, frame=frame, geometry=geometry, dest=dest
     )
 
-def thumbnail(src, dest, geometry, options=''):
+def thumbnail(src, dest, geometry, options='', memory_limit=None):
     """Attempt to make thumbnail
     
-    Note: uses Imagemagick 'convert' and 'identify'.
+    Note: uses Imagemagick 'convert', and 'identify' for formats
+          not recognized by sniff().
     Note: Writes log to DDRLocalEntity.files_log so entries appear
           alongside add_file() and add_access()
     
     @param src: Absolute path to source file.
     @param dest: Absolute path to destination file.
     @param geometry: String (ex: '200x200')
+    @param options: str
+    @param memory_limit: str ImageMagick memory/map limit (ex: '512MiB')
     @returns: Path to destination file
     """
     assert os.path.exists(src)
@@ -151,9 +342,10 @@ def thumbnail(src, dest, geometry, options=''):
         'size': None,
         'islink': None,
     }
-    analysis = analyze(src)
+    # identify only if format not recognized from headers
+    analysis = sniff(src) or analyze(src)
     data['analysis'] = analysis
-    cmd = _convert_cmd(src, dest, geometry, options)
+    cmd = _convert_cmd(src, dest, geometry, options, memory_limit, analysis)
     data['convert'] = cmd
     start = datetime.now()
     r = envoy.run(cmd)
@@ -168,12 +360,123 @@ def thumbnail(src, dest, geometry, options=''):
     data['islink'] = os.path.islink(dest)
     return data
 
+# APP1 segment namespace marking an XMP packet in JPEG
+JPEG_XMP_NS = b'http://ns.adobe.com/xap/1.0/\x00'
+# TIFF tag containing XMP packet
+TIFF_XMP_TAG = 700
+# PNG iTXt keyword for XMP packet
+PNG_XMP_KEYWORD = b'XML:com.adobe.xmp\x00'
+
+def _jpeg_has_xmp(f):
+    """Walk JPEG marker segments up to start-of-scan looking for XMP APP1
+    
+    Exif (APP1) and IPTC (APP13) are reconciled into XMP by libxmp
+    so files containing them are reported as unknown.
+    """
+    legacy = False
+    for code,length in _jpeg_segments(f):
+        if code == 0xDA:  # SOS - no more metadata segments
+            if legacy:
+                return None
+            return False
+        if code == 0xE1:  # APP1
+            if f.read(len(JPEG_XMP_NS)) == JPEG_XMP_NS:
+                return True
+            legacy = True
+        elif code == 0xED:  # APP13
+            legacy = True
+    return None
+
+def _png_has_xmp(f):
+    """Walk PNG chunk headers looking for XMP iTXt chunk
+    """
+    f.seek(8)
+    while True:
+        header = f.read(8)
+        if len(header) < 8:
+            return None
+        length = int.from_bytes(header[:4], 'big')
+        ctype = header[4:]
+        if ctype == b'IEND':
+            return False
+        if ctype == b'iTXt':
+            if f.read(len(PNG_XMP_KEYWORD)) == PNG_XMP_KEYWORD:
+                return True
+            f.seek(length + 4 - len(PNG_XMP_KEYWORD), 1)
+        else:
+            f.seek(length + 4, 1)  # data + CRC
+
+def _tiff_has_xmp(f, byteorder):
+    """Look for XMP tag in first TIFF IFD (where XMP toolkits look)
+    
+    libxmp reconciles basic TIFF tags into XMP so a TIFF without
+    the XMP tag is reported as unknown rather than False.
+    """
+    f.seek(4)
+    offset = int.from_bytes(f.read(4), byteorder)
+    f.seek(offset)
+    num = int.from_bytes(f.read(2), byteorder)
+    entries = f.read(num * 12)
+    if len(entries) < num * 12:
+        return None
+    for n in range(num):
+        tag = int.from_bytes(entries[n*12:n*12+2], byteorder)
+        if tag == TIFF_XMP_TAG:
+            return True
+    return None
+
+def has_xmp(path_abs):
+    """Cheaply checks if a file has an XMP packet by reading its headers
+    
+    Reads only JPEG marker segments, PNG chunk headers, or the first
+    TIFF IFD.  Other formats (e.g. PDF, where the metadata stream can be
+    anywhere in the file) are not checked.  Returns False only when
+    libxmp would find nothing, i.e. no XMP packet and no native metadata
+    that libxmp would convert to XMP.
+    
+    @param path_abs: Absolute path to file.
+    @returns: True, False, or None if unknown
+    """
+    try:
+        with open(path_abs, 'rb') as f:
+            magic = f.read(8)
+            if magic[:2] == b'\xff\xd8':
+                return _jpeg_has_xmp(f)
+            elif magic == b'\x89PNG\r\n\x1a\n':
+                return _png_has_xmp(f)
+            elif magic[:4] == b'II*\x00':
+                return _tiff_has_xmp(f, 'little')
+            elif magic[:4] == b'MM\x00*':
+                return _tiff_has_xmp(f, 'big')
+    except (OSError, ValueError):
+        pass
+    return None
+
+# newline plus any indentation
+XMP_NEWLINE_INDENT = re.compile(r'\n *')
+
+def normalize_xmp(xml):
+    """Removes newlines and the indentation following them from XMP
+    
+    Single pass; same output as repeatedly replacing '\\n ' with '\\n'
+    and then removing all '\\n'.
+    
+    @param xml: str
+    @returns: str
+    """
+    return XMP_NEWLINE_INDENT.sub('', xml)
+
 def extract_xmp(path_abs):
     """Attempts to extract XMP data from a file, returns as dict.
     
+    Files whose headers show they have no XMP packet (see has_xmp) are
+    not opened with libxmp.
+    
     @param path_abs: Absolute path to file.
     @return dict NOTE: this is not an XML file!
     """
+    if has_xmp(path_abs) == False:
+        return None
     xmpfile = libxmp.files.XMPFiles()
     try:
         xmpfile.open_file(path_abs, open_read=True)
@@ -181,9 +484,5 @@ def extract_xmp(path_abs):
         return None
     xmp = xmpfile.get_xmp()
     if xmp:
-        xml = xmp.serialize_to_unicode()
-        while xml.find('\n ') > -1:
-            xml = xml.replace('\n ', '\n')
-        xml = xml.replace('\n','')
-        return xml
+        return normalize_xmp(xmp.serialize_to_unicode())
     return None
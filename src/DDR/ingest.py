@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
 logger = logging.getLogger(__name__)
@@ -7,18 +8,25 @@ import shutil
 import sys
 import traceback
 
+from DDR import accesscache
 from DDR import changelog
 from DDR import config
 from DDR import dvcs
 from DDR import fileio
 from DDR import identifier
 from DDR import imaging
+from DDR.models import files
+from DDR.models import session
 from DDR import util
 
 FILE_BINARY_FIELDS = [
     'sha1', 'sha256', 'md5', 'size',
 ]
 
+# rowd key for size and hashes calculated when an import was planned
+# (see DDR.batch.ImportPlan); not a CSV field
+PLANNED_BINARY = '_planned_binary'
+
 # Decision table for various ways to process file data for batch operations
 # +---binary present
 # |+--external
@@ -77,17 +85,236 @@ def import_actions(rowd, file_present):
     raise Exception(f'No file ingest action for "{key}".')
 
 
+class PreparedFile():
+    """Results of prepare_file: actions, hashes, XMP, and temp copy if any"""
+    actions = None
+    tmp_path = None
+    size = None
+    md5 = None
+    sha1 = None
+    sha256 = None
+    xmp = None
+    log = None
+    error = None
+    # HashIndex holding sha1/sha256 (see check_duplicate)
+    reserved = None
+    
+    def __repr__(self):
+        return "<%s.%s %s>" % (
+            self.__module__, self.__class__.__name__, self.sha1
+        )
+    
+    def discard(self):
+        """Remove temp copy and hash reservation of a file that will not be added"""
+        if self.tmp_path and os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+        if self.reserved:
+            self.reserved.release(self.sha1, self.sha256)
+            self.reserved = None
+
+def prepare_file(src_path, rowd, entity, log, tmp_tag=''):
+    """Decide import actions, then hash, copy, and read XMP from file
+    
+    This is the slow, repository-independent part of add_file: nothing
+    is staged and the only file written is a hidden temp copy in the
+    entity's files dir, so it can run ahead in a worker thread.
+    
+    Binaries are hashed and checked for duplicates (see check_duplicate)
+    before they are copied.  Without hashes from an ImportPlan this means
+    a file to be ingested is read twice, once to hash and once to copy.
+    
+    @param src_path: Path Absolute path to source file
+    @param rowd: dict Row from a CSV import file in dict form.
+    @param entity: Entity object
+    @param log: util.FileLogger
+    @param tmp_tag: str (optional) See ingest_tmp_path
+    @returns: PreparedFile
+    """
+    prepared = PreparedFile()
+    prepared.log = log
+    actions = import_actions(rowd, os.path.exists(src_path))
+    log.debug('actions %s' % actions)
+    prepared.actions = actions
+    
+    planned = rowd.get(PLANNED_BINARY)
+    log.debug('Actions: attrs %s' % actions['attrs'])
+    if actions['attrs'] == 'calculate':
+        if actions['ingest'] and not planned:
+            log.debug('Hashing before copy')
+            md5,sha1,sha256 = checksums(src_path, log)
+            planned = {'md5': md5, 'sha1': sha1, 'sha256': sha256}
+        if planned:
+            # hashes are known before anything is copied
+            prepared.sha1,prepared.sha256 = planned['sha1'],planned['sha256']
+            prepared.reserved = check_duplicate(
+                entity, prepared.sha1, prepared.sha256, src_path, log
+            )
+        if actions['ingest']:
+            # renamed once file ID is known
+            prepared.tmp_path = ingest_tmp_path(src_path, entity, tmp_tag)
+        try:
+            prepared.size,prepared.md5,prepared.sha1,prepared.sha256,prepared.xmp = file_info(
+                src_path, log, copy_to=prepared.tmp_path, planned=planned
+            )
+            if not prepared.reserved:
+                # external binaries are hashed but not copied
+                prepared.reserved = check_duplicate(
+                    entity, prepared.sha1, prepared.sha256, src_path, log
+                )
+        except:
+            prepared.discard()
+            raise
+    elif actions['attrs'] == 'fromcsv':
+        prepared.size = rowd['size']
+        prepared.md5 = rowd['md5']
+        prepared.sha1 = rowd['sha1']
+        prepared.sha256 = rowd['sha256']
+        prepared.xmp = rowd.get('xmp')
+        prepared.reserved = check_duplicate(
+            entity, prepared.sha1, prepared.sha256, src_path, log
+        )
+    return prepared
+
+def check_duplicate(entity, sha1, sha256, src_path, log):
+    """Stop if binary is already in the collection or being added
+    
+    Uses the collection's HashIndex as loaded in this process, which
+    File.save keeps current; the collection is not walked again.
+    The hashes are reserved in the index until the File is saved or the
+    PreparedFile discarded, so a second copy of the binary in the same
+    import is a duplicate too.  With an IngestPipeline either copy may
+    be the one that is stopped.
+    
+    @param entity: Entity object
+    @param sha1: str
+    @param sha256: str
+    @param src_path: Path Absolute path to source file
+    @param log: util.FileLogger
+    @returns: HashIndex holding the reservation
+    """
+    index = files.hash_index(entity.collection_path, refresh=False)
+    duplicates = index.reserve(sha1, sha256, str(src_path))
+    if duplicates:
+        log.crash(
+            f'Duplicate of {", ".join(duplicates)}: {src_path}',
+            DuplicateFileException
+        )
+    return index
+
+def _prepare_job(src_path, rowd, entity, tmp_tag):
+    """Run prepare_file in a worker; errors are returned, not raised"""
+    log = util.BufferedLogger()
+    try:
+        return prepare_file(src_path, rowd, entity, log, tmp_tag)
+    except Exception as err:
+        prepared = PreparedFile()
+        prepared.log = log
+        prepared.error = err
+        return prepared
+
+class IngestPipeline():
+    """Prepares files for add_file in worker threads ahead of the caller
+    
+    Hashing, copying into the repo, and XMP extraction (prepare_file) run
+    for up to `ahead` rows in a thread pool; hashlib, file I/O, and Exempi
+    release the GIL so they can use several cores.  The caller stays the
+    single writer: it takes PreparedFiles back in row order and passes
+    them to add_file, which saves and stages each file as before.
+    Each row's log entries are held until the row is added, and errors
+    are raised in add_file, so logs and failures are the same as a
+    serial import.
+    
+    >>> with IngestPipeline(workers=4) as pipeline:
+    ...     pipeline.feed([(rowd, entity) for rowd in rowds])
+    ...     for rowd in rowds:
+    ...         add_file(rowd, entity, ..., prepared=pipeline.next())
+    """
+    
+    def __init__(self, workers=config.INGEST_WORKERS, ahead=None):
+        """
+        @param workers: int Max number of files prepared at once
+        @param ahead: int Max rows prepared but not yet added (default 2*workers)
+        """
+        self.workers = max(int(workers), 1)
+        # limits temp copies waiting in the repo
+        self.ahead = ahead or (self.workers * 2)
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.rows = []
+        self.jobs = []
+        self.submitted = 0
+    
+    def __repr__(self):
+        return "<%s.%s workers:%s ahead:%s>" % (
+            self.__module__, self.__class__.__name__, self.workers, self.ahead
+        )
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        self.shutdown()
+    
+    def feed(self, rows):
+        """Queue rows to prepare, in the order they will be added
+        
+        @param rows: list of (rowd, entity)
+        """
+        self.rows.extend(rows)
+        self._fill()
+    
+    def _fill(self):
+        while self.rows and (len(self.jobs) < self.ahead):
+            rowd,entity = self.rows.pop(0)
+            self.jobs.append(self.executor.submit(
+                _prepare_job,
+                Path(rowd['path_abs']), rowd, entity, '.%s' % self.submitted
+            ))
+            self.submitted += 1
+    
+    def next(self):
+        """Wait for and return PreparedFile for the next row
+        
+        @returns: PreparedFile
+        """
+        future = self.jobs.pop(0)
+        self._fill()
+        return future.result()
+    
+    def shutdown(self):
+        """Drop unstarted rows and remove temp copies of unused ones"""
+        self.rows = []
+        for future in self.jobs:
+            future.cancel()
+        self.executor.shutdown(wait=True)
+        for future in self.jobs:
+            if not future.cancelled():
+                future.result().discard()
+        self.jobs = []
+
+
 class FileExistsException(Exception):
     pass
 
+class DuplicateFileException(Exception):
+    pass
+
 class FileMissingException(Exception):
     pass
 
 
 def add_file(rowd, entity, git_name, git_mail, agent,
-             tmp_dir=config.MEDIA_BASE, log_path=None, show_staged=True):
+             tmp_dir=config.MEDIA_BASE, log_path=None, show_staged=True,
+             access_pool=None, prepared=None):
     """Add local or external file, with or without access.
     
+    If access_pool is given the access file is submitted to the pool
+    instead of being made here.  The File is not saved: the caller must
+    attach the access file with attach_access, which saves the File once
+    with or without it.
+    
+    If prepared is given (see IngestPipeline) the file was already
+    hashed and copied by prepare_file and those steps are skipped.
+    
     @param rowd: dict Row from a CSV import file in dict form.
     @param entity: Entity object
     @param git_name: Username of git committer.
@@ -95,6 +322,8 @@ def add_file(rowd, entity, git_name, git_mail, agent,
     @param agent: str (optional) Name of software making the change.
     @param log_path: str (optional) Absolute path to addfile log
     @param show_staged: boolean Log list of staged files
+    @param access_pool: AccessPool (optional)
+    @param prepared: PreparedFile (optional)
     @return File,repo,log
     """
     f = None
@@ -113,59 +342,83 @@ def add_file(rowd, entity, git_name, git_mail, agent,
     src_path = Path(rowd.pop('path_abs'))
     log.info(f'{src_path=}')
     
-    actions = import_actions(rowd, os.path.exists(src_path))
-    log.debug('actions %s' % actions)
-    
-    log.debug('Actions: attrs %s' % actions['attrs'])
-    if actions['attrs'] == 'calculate':
-        src_size,md5,sha1,sha256,xmp = file_info(src_path, log)
-    elif actions['attrs'] == 'fromcsv':
-        src_size = rowd['size']
-        md5,sha1,sha256 = rowd['md5'], rowd['sha1'], rowd['sha256']
-        xmp = rowd.get('xmp')
-    
-    file_ = file_object(
-        file_identifier(entity, rowd, sha1, log),
-        entity, rowd,
-        src_path, src_size,
-        md5, sha1, sha256, xmp,
-        log
-    )
+    if prepared:
+        if isinstance(prepared.log, util.BufferedLogger):
+            # entries logged by IngestPipeline worker
+            prepared.log.flush(log)
+        if prepared.error:
+            raise prepared.error
+    else:
+        prepared = prepare_file(src_path, rowd, entity, log)
+    rowd.pop(PLANNED_BINARY, None)
+    actions = prepared.actions
+    tmp_path = prepared.tmp_path
+    src_size = prepared.size
+    md5,sha1,sha256 = prepared.md5,prepared.sha1,prepared.sha256
+    xmp = prepared.xmp
     
-    log.debug('Actions: rename %s' % actions['rename'])
-    if actions['rename']:
-        copy_in_place(src_path, file_, log)
+    batch = session.active_session(entity.collection_path)
     
-    annex_files = []
+    # temp copy and hash reservation are dropped if the file is not saved
+    try:
+        file_ = file_object(
+            file_identifier(entity, rowd, sha1, log),
+            entity, rowd,
+            src_path, src_size,
+            md5, sha1, sha256, xmp,
+            log
+        )
+        
+        log.debug('Actions: rename %s' % actions['rename'])
+        if actions['rename']:
+            copy_in_place(src_path, file_, log)
+        
+        annex_files = []
+        
+        log.debug('Actions: ingest %s' % actions['ingest'])
+        if actions['ingest']:
+            if tmp_path:
+                move_to_file_path(file_, tmp_path, log)
+            else:
+                copy_to_file_path(file_, src_path, log)
+            annex_files.append(file_.path_abs)
+        
+        log.debug('Actions: access %s' % actions['access'])
+        deferred = actions['access'] and access_pool
+        if deferred:
+            # made concurrently; caller saves with attach_access
+            access_pool.submit(
+                src_path, file_.access_abs, log, data=(file_,entity), sha256=sha256
+            )
+        elif actions['access']:
+            access_path = make_access_file(
+                src_path, file_.access_abs, log, sha256=sha256
+            )
+            access_abs = set_access_file(file_, entity, access_path, log)
+            if access_abs:
+                annex_files.append(access_abs)
+        
+        git_files = []
+        if not deferred:
+            log.debug('Writing file and entity rowd')
+            exit,status,git_files = file_.save(
+                git_name, git_mail, agent, parent=entity, commit=False
+            )
+    except:
+        prepared.discard()
+        raise
     
-    log.debug('Actions: ingest %s' % actions['ingest'])
-    if actions['ingest']:
-        copy_to_file_path(file_, src_path, log)
-        annex_files.append(file_.path_abs)
-    
-    log.debug('Actions: access %s' % actions['access'])
-    if actions['access']:
-        access_path = make_access_file(src_path, file_.access_abs, log)
-        log.debug('Attaching access file')
-        if access_path and os.path.exists(access_path):
-            file_.set_access(access_path, entity)
-            annex_files.append(file_.access_abs)
-            log.debug('| file_.access_rel: %s' % file_.access_rel)
-            log.debug('| file_.access_abs: %s' % file_.access_abs)
-        else:
-            log.error('no access file')
+    git_files = [path.replace('%s/' % file_.collection_path, '') for path in git_files]
+    annex_files = [path.replace('%s/' % file_.collection_path, '') for path in annex_files]
+    if batch:
+        # parent entity is rewritten and files staged when session exits
+        log.debug('Queueing files for batch session')
+        batch.add_files(git_files=git_files, annex_files=annex_files)
+        return file_,dvcs.repository(entity.collection_path),log
     
-    log.debug('Writing file and entity rowd')
-    exit,status,git_files = file_.save(
-        git_name, git_mail, agent, parent=entity, commit=False
-    )
-
     log.debug('Staging files')
     repo = stage_files(
-        entity,
-        [path.replace('%s/' % file_.collection_path, '') for path in git_files],
-        [path.replace('%s/' % file_.collection_path, '') for path in annex_files],
-        log, show_staged=show_staged
+        entity, git_files, annex_files, log, show_staged=show_staged
     )
     # IMPORTANT: Files are only staged! Be sure to commit!
     # IMPORTANT: changelog is not staged!
@@ -187,11 +440,38 @@ def check_dir(label, path, log, mkdir=False, perm=os.W_OK):
         return False
     return True
 
+def copy_checksums(src_path, dest_path, log, planned=None):
+    """Copy file to dest_path and get MD5, SHA1, SHA256 hashes in one pass
+    
+    If planned hashes are given the file is only copied.
+    """
+    if not os.path.exists(os.path.dirname(dest_path)):
+        os.makedirs(os.path.dirname(dest_path))
+    log.debug('| cp %s %s' % (src_path, dest_path))
+    algos = ['md5', 'sha1', 'sha256']
+    if planned:
+        algos = []
+    method,hashes = util.copy_file_hashes(
+        src_path, dest_path, algos, hardlink=config.INGEST_HARDLINK
+    )
+    if method != 'hardlink':
+        os.chmod(dest_path, 0o644)
+    log.debug('| %s ok' % method)
+    if planned:
+        hashes = planned
+    md5    = hashes['md5'];    log.debug('| md5: %s' % md5)
+    sha1   = hashes['sha1'];   log.debug('| sha1: %s' % sha1)
+    sha256 = hashes['sha256']; log.debug('| sha256: %s' % sha256)
+    if not (sha1 and md5 and sha256):
+        log.crash('Could not calculate checksums')
+    return md5,sha1,sha256
+
 def checksums(src_path, log):
     """Get MD5, SHA1, SHA256 hashes for specified file"""
-    md5    = util.file_hash(src_path, 'md5');    log.debug('| md5: %s' % md5)
-    sha1   = util.file_hash(src_path, 'sha1');   log.debug('| sha1: %s' % sha1)
-    sha256 = util.file_hash(src_path, 'sha256'); log.debug('| sha256: %s' % sha256)
+    hashes = util.file_hashes(src_path, ['md5', 'sha1', 'sha256'])
+    md5    = hashes['md5'];    log.debug('| md5: %s' % md5)
+    sha1   = hashes['sha1'];   log.debug('| sha1: %s' % sha1)
+    sha256 = hashes['sha256']; log.debug('| sha256: %s' % sha256)
     if not (sha1 and md5 and sha256):
         log.crash('Could not calculate checksums')
     return md5,sha1,sha256
@@ -232,8 +512,10 @@ def copy_to_workdir(src_path, tmp_path, tmp_path_renamed, log):
     if not os.path.exists(os.path.dirname(tmp_path)):
         os.makedirs(os.path.dirname(tmp_path))
     log.debug('| cp %s %s' % (src_path, tmp_path))
-    shutil.copy(src_path, tmp_path)
-    os.chmod(tmp_path, 0o644)
+    method = util.copy_file(src_path, tmp_path, hardlink=config.INGEST_HARDLINK)
+    log.debug('| %s' % method)
+    if method != 'hardlink':
+        os.chmod(tmp_path, 0o644)
     if os.path.exists(tmp_path):
         log.debug('| done')
     else:
@@ -246,14 +528,45 @@ def copy_to_workdir(src_path, tmp_path, tmp_path_renamed, log):
     if not os.path.exists(tmp_path_renamed) and not os.path.exists(tmp_path):
         log.crash('File rename failed: %s -> %s' % (tmp_path, tmp_path_renamed))
 
+def ingest_tmp_path(src_path, entity, tag=''):
+    """Temporary path for a file being ingested into entity
+    
+    Hidden file in the entity's files dir, so it is on the same filesystem
+    as its final location and can be moved there with a rename.
+    
+    @param tag: str (optional) Keeps names of files prepared concurrently apart
+    """
+    return os.path.join(
+        entity.files_path, '.{}{}.ingest'.format(os.path.basename(src_path), tag)
+    )
+
+def move_to_file_path(file_, tmp_path, log):
+    """Rename file copied by copy_checksums to its place in the repository"""
+    log.debug('Moving')
+    log.debug('| mv %s %s' % (tmp_path, file_.path_abs))
+    if not os.path.exists(file_.entity_files_path):
+        os.makedirs(file_.entity_files_path)
+    os.replace(tmp_path, file_.path_abs)
+    if os.path.exists(file_.path_abs):
+        log.debug('| done')
+    else:
+        log.crash('Move failed!')
+        raise Exception(
+            'Failed to move file(s) to destination repo'
+        )
+
 def copy_to_file_path(file_, src_path, log):
     """Copy file to its place in the repository"""
     log.debug('Copying')
     log.debug('| cp %s %s' % (src_path, file_.path_abs))
     if not os.path.exists(file_.entity_files_path):
         os.makedirs(file_.entity_files_path)
-    shutil.copy(src_path, file_.path_abs)
-    os.chmod(file_.path_abs, 0o644)
+    method = util.copy_file(
+        src_path, file_.path_abs, hardlink=config.INGEST_HARDLINK
+    )
+    log.debug('| %s' % method)
+    if method != 'hardlink':
+        os.chmod(file_.path_abs, 0o644)
     if os.path.exists(file_.path_abs):
         log.debug('| done')
     else:
@@ -262,23 +575,48 @@ def copy_to_file_path(file_, src_path, log):
             'Failed to copy file(s) to destination repo'
         )
 
-def make_access_file(src_path, access_dest_path, log):
-    """Generate an access file and write to dest_path"""
+def make_access_file(src_path, access_dest_path, log, memory_limit=None,
+                     sha256=None):
+    """Generate an access file and write to dest_path
+    
+    If sha256 of src_path is given and the access cache is enabled
+    (see DDR.accesscache) a cached access file is used if available,
+    and newly made ones are added to the cache.
+    """
     log.debug('Making access file')
     if os.path.exists(access_dest_path):
         log.error('Access tmpfile already exists: %s' % access_dest_path)
     log.debug('| %s' % access_dest_path)
+    cache = None
+    if sha256:
+        cache = accesscache.default_cache()
+    if cache:
+        key = cache.key(
+            sha256, config.ACCESS_FILE_GEOMETRY, config.ACCESS_FILE_OPTIONS
+        )
+        if cache.fetch(key, access_dest_path):
+            log.debug('| access cache hit %s' % key)
+            return access_dest_path
+        log.debug('| access cache miss %s' % key)
     try:
         data = imaging.thumbnail(
             src_path,
             access_dest_path,
             geometry=config.ACCESS_FILE_GEOMETRY,
             options=config.ACCESS_FILE_OPTIONS,
+            memory_limit=memory_limit,
         )
-        # identify
-        log.debug('| identify: %s' % data['analysis']['std_out'])
-        if data['analysis'].get('std_err'):
-            log.error('| identify: %s' % data['analysis']['std_err'])
+        # identify, or format read from headers
+        analysis = data['analysis']
+        if analysis.get('std_out'):
+            log.debug('| identify: %s' % analysis['std_out'])
+        else:
+            log.debug('| sniff: %s %sx%s frames:%s' % (
+                analysis['format'], analysis.get('width'),
+                analysis.get('height'), analysis['frames'],
+            ))
+        if analysis.get('std_err'):
+            log.error('| identify: %s' % analysis['std_err'])
         # convert
         log.debug('| %s' % data['convert'])
         log.debug('| convert: status:%s exists:%s islink:%s size:%s' % (
@@ -297,6 +635,12 @@ def make_access_file(src_path, access_dest_path, log):
             log.error('DEST FILE IS A SYMLINK!')
         #
         tmp_access_path = data['dest']
+        if cache and (data['status_code'] == 0) and data['size'] \
+        and not data['islink']:
+            try:
+                cache.store(key, tmp_access_path)
+            except OSError as err:
+                log.error('| access cache: %s' % err)
         log.debug('| done')
     except:
         # write traceback to log and continue on
@@ -304,6 +648,132 @@ def make_access_file(src_path, access_dest_path, log):
         tmp_access_path = None
     return tmp_access_path
 
+class AccessPool():
+    """Makes access files concurrently during batch imports
+    
+    ImageMagick does the work in subprocesses so a thread per job is enough.
+    At most `workers` convert processes run at once, each limited to
+    `memory_limit`.  Results are returned in the order jobs were submitted
+    so files are attached and staged in the same order as a serial import.
+    Each job logs to its own util.BufferedLogger, which is written to the
+    job's log when its result is returned, so lines from concurrent jobs
+    are not interleaved.
+    
+    >>> with AccessPool(workers=4, memory_limit='512MiB') as pool:
+    ...     for file_ in files:
+    ...         pool.submit(file_.path_abs, file_.access_abs, log, data=file_)
+    ...     for file_,access_path in pool.results():
+    ...         attach_access(file_, entity, access_path, ...)
+    """
+    
+    def __init__(self, workers=config.ACCESS_FILE_WORKERS,
+                 memory_limit=config.ACCESS_FILE_MEMORY_LIMIT):
+        """
+        @param workers: int Max number of concurrent access file jobs
+        @param memory_limit: str ImageMagick memory/map limit per job
+        """
+        self.workers = max(int(workers), 1)
+        self.memory_limit = memory_limit or None
+        self.executor = ThreadPoolExecutor(max_workers=self.workers)
+        self.jobs = []
+    
+    def __repr__(self):
+        return "<%s.%s workers:%s pending:%s>" % (
+            self.__module__, self.__class__.__name__,
+            self.workers, len(self.jobs)
+        )
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, tb):
+        self.shutdown(cancel=(exc_type is not None))
+    
+    def submit(self, src_path, access_dest_path, log, data=None, sha256=None):
+        """Queue an access file job
+        
+        @param src_path: str Absolute path to master file
+        @param access_dest_path: str Absolute path to access file
+        @param log: util.FileLogger
+        @param data: Anything the caller wants back with the result
+        @param sha256: str (optional) SHA256 of master, for the access cache
+        """
+        buffered = util.BufferedLogger()
+        future = self.executor.submit(
+            make_access_file,
+            src_path, access_dest_path, buffered, memory_limit=self.memory_limit,
+            sha256=sha256
+        )
+        self.jobs.append((data, log, buffered, future))
+    
+    def results(self):
+        """Yield (data, access_path) for each job in the order submitted
+        
+        access_path is None if the access file could not be made.
+        """
+        while self.jobs:
+            data,log,buffered,future = self.jobs.pop(0)
+            try:
+                access_path = future.result()
+            finally:
+                buffered.flush(log)
+            yield data,access_path
+    
+    def shutdown(self, cancel=False):
+        """Wait for running jobs; if cancel, drop jobs not yet started"""
+        if cancel:
+            for data,log,buffered,future in self.jobs:
+                future.cancel()
+            self.jobs = []
+        self.executor.shutdown(wait=True)
+
+def set_access_file(file_, entity, access_path, log):
+    """Point File at newly made access file
+    
+    @returns: str Absolute path to access file, or None
+    """
+    log.debug('Attaching access file')
+    if access_path and os.path.exists(access_path):
+        file_.set_access(access_path, entity)
+        log.debug('| file_.access_rel: %s' % file_.access_rel)
+        log.debug('| file_.access_abs: %s' % file_.access_abs)
+        return file_.access_abs
+    log.error('no access file')
+    return None
+
+def attach_access(file_, entity, access_path, git_name, git_mail, agent, log):
+    """Attach an access file made by AccessPool to a File added by add_file
+    
+    add_file does not save Files whose access file is made by an
+    AccessPool, so each File's JSON is written once, here, whether or
+    not the access file could be made.  The File and access file are
+    queued in the active batch session, or staged if there is none.
+    
+    @param file_: File
+    @param entity: Entity
+    @param access_path: str Absolute path to access file, or None
+    @param git_name: Username of git committer.
+    @param git_mail: Email of git committer.
+    @param agent: str (optional) Name of software making the change.
+    @param log: util.FileLogger
+    @returns: File
+    """
+    access_abs = set_access_file(file_, entity, access_path, log)
+    log.debug('Writing file and entity rowd')
+    exit,status,git_files = file_.save(
+        git_name, git_mail, agent, parent=entity, commit=False
+    )
+    git_files = [path.replace('%s/' % file_.collection_path, '') for path in git_files]
+    annex_files = []
+    if access_abs:
+        annex_files.append(access_abs.replace('%s/' % file_.collection_path, ''))
+    batch = session.active_session(entity.collection_path)
+    if batch:
+        batch.add_files(git_files=git_files, annex_files=annex_files)
+    else:
+        stage_files(entity, git_files, annex_files, log, show_staged=False)
+    return file_
+
 def write_object_metadata(obj, tmp_dir, log):
     """Write object JSON file to tmp_dir"""
     tmp_json = os.path.join(tmp_dir, os.path.basename(obj.json_path))
@@ -386,7 +856,9 @@ def copy_in_place(src_path, file_, log):
         os.path.basename(file_.identifier.path_abs()) + ext
     )
     log.debug('| cp %s %s' % (src_path, dest))
-    shutil.copy(src_path, dest)
+    method = util.copy_file(src_path, dest)
+    shutil.copymode(src_path, dest)
+    log.debug('| %s' % method)
 
 def predict_staged(already, planned):
     """Predict which files will be staged, accounting for modifications
@@ -411,7 +883,7 @@ def stage_files(entity, git_files, annex_files, log, show_staged=True):
     @param git_files: list
     @param annex_files: list
     @param log: AddFileLogger
-    @param show_staged: bool
+    @param show_staged: bool Log repo status before staging
     @returns: repo
     """
     repo = dvcs.repository(entity.collection_path)
@@ -423,8 +895,9 @@ def stage_files(entity, git_files, annex_files, log, show_staged=True):
         if path not in annex_files
     ]
     
-    log.debug('| BEFORE staging')
-    staged_before,modified_before,untracked_before = repo_status(repo, log)
+    if show_staged:
+        log.debug('| BEFORE staging')
+        staged_before,modified_before,untracked_before = repo_status(repo, log)
     
     stage_these = sorted(list(set(git_files + annex_files)))
     log.debug('| staging %s files:' % len(stage_these))
@@ -467,9 +940,10 @@ def repo_status(repo, log):
     @returns: staged,modified,untracked
     """
     log.debug('| %s' % repo)
-    staged = dvcs.list_staged(repo)
-    modified = dvcs.list_modified(repo)
-    untracked = dvcs.list_untracked(repo)
+    status = dvcs.status(repo)
+    staged = status.staged
+    modified = status.modified
+    untracked = status.untracked
     log.debug('|   %s staged, %s modified, %s untracked' % (
         len(staged), len(modified), len(untracked),
     ))
@@ -481,11 +955,18 @@ def repo_status(repo, log):
         log.debug('|   untracked: %s' % path)
     return staged, modified, untracked
 
-def file_info(src_path, log):
+def file_info(src_path, log, copy_to=None, planned=None):
     """Get file size, hashes, and XMP
     
+    If copy_to is specified the file is copied there while it is hashed
+    (see copy_checksums) so the source is only read once.
+    Size and hashes in planned (see DDR.batch.ImportPlan) are used
+    instead of being calculated; the plan checks the file is unchanged.
+    
     @param src_path: str
     @param log: DDR.util.FileLogger
+    @param copy_to: str (optional) Absolute path to copy file to.
+    @param planned: dict (optional) size, md5, sha1, sha256
     @returns: size,md5,sha1,sha256,xmp
     """
     log.debug('Examining source file')
@@ -493,8 +974,17 @@ def file_info(src_path, log):
     size = os.path.getsize(src_path)
     log.debug('| file size %s' % size)
     # TODO check free space on dest
-    log.debug('| hashing')
-    md5,sha1,sha256 = checksums(src_path, log)
+    if planned:
+        log.debug('| hashes from plan')
+        md5,sha1,sha256 = planned['md5'],planned['sha1'],planned['sha256']
+        if copy_to:
+            copy_checksums(src_path, copy_to, log, planned=planned)
+    elif copy_to:
+        log.debug('| hashing')
+        md5,sha1,sha256 = copy_checksums(src_path, copy_to, log)
+    else:
+        log.debug('| hashing')
+        md5,sha1,sha256 = checksums(src_path, log)
     log.debug('| md5 %s' % md5)
     log.debug('| sha1 %s' % sha1)
     log.debug('| sha256 %s' % sha256)
@@ -609,7 +1099,14 @@ def add_access( entity, ddrfile, src_path, git_name, git_mail, agent='', log_pat
     check_dir('| dest_dir', dest_dir, log, mkdir=True, perm=os.W_OK)
     
     log.debug('Making access file')
-    tmp_access_path = make_access_file(src_path, access_dest_path, log)
+    # cache is keyed on master file; ddrfile.sha256 only describes that
+    master_sha256 = None
+    if ddrfile.sha256 and ddrfile.path_abs \
+    and (os.path.realpath(src_path) == os.path.realpath(ddrfile.path_abs)):
+        master_sha256 = ddrfile.sha256
+    tmp_access_path = make_access_file(
+        src_path, access_dest_path, log, sha256=master_sha256
+    )
     
     log.debug('File object')
     file_ = ddrfile
@@ -660,13 +1157,19 @@ def add_access( entity, ddrfile, src_path, git_name, git_mail, agent='', log_pat
     else:
         log.debug('| all files moved')
     
-    log.debug('Staging files')
     git_files = [
         file_.json_path_rel
     ]
     annex_files = [
         file_.access_rel
     ]
+    batch = session.active_session(entity.collection_path)
+    if batch:
+        log.debug('Queueing files for batch session')
+        batch.add_files(git_files=git_files, annex_files=annex_files)
+        return file_,dvcs.repository(entity.collection_path),log,'continue'
+    
+    log.debug('Staging files')
     repo = stage_files(
         entity=entity,
         git_files=git_files, annex_files=annex_files,
@@ -701,8 +1204,9 @@ def add_file_commit(entity, file_, repo, log, git_name, git_mail, agent):
     """Confirm all files staged, format commit message, and commit
     """
     log.debug('add_file_commit(%s, %s, %s, %s, %s, %s)' % (file_, repo, log, git_name, git_mail, agent))
-    staged = dvcs.list_staged(repo)
-    modified = dvcs.list_modified(repo)
+    status = dvcs.status(repo, untracked=False)
+    staged = status.staged
+    modified = status.modified
     if staged and not modified:
         log.debug('All files staged.')
         log.debug('Updating changelog')
@@ -37,6 +37,7 @@ from DDR.models.organization import Organization
 from DDR.models.collection import Collection, COLLECTION_FILES_PREFIX
 from DDR.models.entity import Entity, ListEntity, ENTITY_FILES_PREFIX
 from DDR.models.files import File
+from DDR.models.session import BatchSession, batch_session
 
 # whitelist of params recognized in URL query
 # TODO move to ddr-defs/repo_models/elastic.py?
@@ -1,3 +1,4 @@
+import bisect
 from collections import OrderedDict
 from copy import deepcopy
 from datetime import datetime
@@ -24,6 +25,7 @@ from DDR import ingest
 from DDR import inheritance
 from DDR import locking
 from DDR.models import common
+from DDR.models import session
 from DDR.models.files import File
 from DDR import modules
 from DDR import util
@@ -42,6 +44,9 @@ class ListEntity( object ):
     def __repr__(self):
         return "<DDRListEntity %s>" % (self.id)
 
+# order of children in entity.json and Entity.children
+CHILDREN_MODELS = ['entity', 'segment', 'file']
+
 # attrs used in METS Entity file_groups
 ENTITY_ENTITY_KEYS = [
     'id',
@@ -223,6 +228,11 @@ class Entity(common.DDRObject):
         Files list is for use by e.g. batch operations that want to commit
         all modified files in one operation rather than piecemeal.
         
+        If commit is False and a models.batch_session is active for the
+        collection, the parent refresh is deferred until the session exits
+        and the changelog entry and staging are deferred by its
+        commands.transaction.
+        
         @param git_name: str
         @param git_mail: str
         @param agent: str
@@ -234,6 +244,9 @@ class Entity(common.DDRObject):
         if not collection:
             collection = self.identifier.collection().object()
         parent = self.identifier.parent().object()
+        batch = None
+        if not commit:
+            batch = session.active_session(collection.path_abs)
         
         self.children(force_read=True)
         self.write_json()
@@ -246,8 +259,11 @@ class Entity(common.DDRObject):
         
         if parent and isinstance(parent, Entity):
             # update parent.children
-            parent.children(force_read=True)
-            parent.write_json()
+            if batch:
+                batch.mark_parent(parent)
+            elif not parent.patch_child(self):
+                parent.children(force_read=True)
+                parent.write_json()
             updated_files.append(parent.json_path)
         
         # propagate inheritable changes to child objects
@@ -384,6 +400,59 @@ class Entity(common.DDRObject):
         self._children_objects.append(obj)
         self._children_objects = _sort_children(self._children_objects)
 
+    def patch_child(self, obj):
+        """Updates one child's entry in entity.json without reading all children
+        
+        Replaces the child's entry in the JSON file's "children" or
+        "file_groups" list, inserting it with bisect so list order matches
+        what dump_json would produce (see _patch_sorted).  Sibling JSON
+        files are not read, but entity.json itself is still read and
+        rewritten; models.batch_session defers this to one write per
+        entity when many children are saved.
+        Object metadata at the top of entity.json is left as-is.
+        If Entity.children has already been loaded it is updated too.
+        
+        @param obj: Entity or File
+        @returns: bool False if entity.json has no children/file_groups
+        (e.g. old format) and caller should rewrite the whole file.
+        """
+        if not os.path.exists(self.json_path):
+            return False
+        data = json.loads(fileio.read_text(self.json_path))
+        children = None
+        file_groups = None
+        for field in data:
+            if 'children' in field:
+                children = field['children']
+            elif 'file_groups' in field:
+                file_groups = field['file_groups']
+        if (children is None) or (file_groups is None):
+            return False
+        
+        try:
+            if obj.identifier.model == 'file':
+                _patch_filegroups(
+                    file_groups, obj.role, obj.dict(file_groups=1),
+                    self.identifier.basepath
+                )
+            else:
+                _patch_sorted(
+                    children, entity_to_childrenmeta(obj),
+                    self.identifier.basepath
+                )
+        except (KeyError, TypeError, ValueError):
+            # unsortable entry (e.g. blank sort); fall back to full rewrite
+            logger.debug('%s.patch_child(%s) failed' % (self, obj))
+            return False
+        fileio.write_text(format_json(data), self.json_path)
+        
+        if self.__dict__.get('_children_objects'):
+            self._children_objects = [
+                o for o in self._children_objects if o.id != obj.id
+            ]
+            self.add_child(obj)
+        return True
+
     def remove_children(self, object_id):
         """Remove child entity from this Entity's children list.
         
@@ -759,12 +828,65 @@ def _sort_children(objects):
             objects_by_model[model].append(o)
     # recombine
     combined = []
-    for model in ['entity', 'segment', 'file']:  # TODO replace hard-coded
+    for model in CHILDREN_MODELS:
         if model in objects_by_model.keys():
             combined += natsorted(objects_by_model[model])
     return combined
 
 
+def _childmeta_key(basepath):
+    """Sort key for children/file_groups dicts
+    
+    Same order as _sort_children: by model, then Entity/File._key.
+    """
+    def key(meta):
+        oi = Identifier(meta['id'], basepath)
+        return CHILDREN_MODELS.index(oi.model),int(meta['sort']),oi.id_sort
+    return key
+
+def _patch_sorted(metas, meta, basepath):
+    """Replace or insert meta dict in sorted list of children/file dicts
+    
+    An existing entry with the same sort is found with bisect.  If the
+    sort changed, or the child is new, the list is scanned for the old
+    entry before the new one is inserted.
+    
+    @param metas: list of dicts, sorted
+    @param meta: dict
+    @param basepath: str
+    """
+    key = _childmeta_key(basepath)
+    meta_key = key(meta)
+    n = bisect.bisect_left(metas, meta_key, key=key)
+    if (n < len(metas)) and (metas[n]['id'] == meta['id']):
+        metas[n] = meta
+        return
+    for n,m in enumerate(metas):
+        if m['id'] == meta['id']:
+            metas.pop(n)
+            break
+    metas.insert(bisect.bisect_left(metas, meta_key, key=key), meta)
+
+def _patch_filegroups(file_groups, role, meta, basepath):
+    """Replace or insert File dict in METS file_groups structure
+    
+    @param file_groups: list of dicts (see files_to_filegroups)
+    @param role: str File role
+    @param meta: dict File.dict(file_groups=1)
+    @param basepath: str
+    """
+    for group in file_groups:
+        if group['role'] == role:
+            _patch_sorted(group['files'], meta, basepath)
+            return
+    # new role group, in VALID_COMPONENTS['role'] order
+    roles = VALID_COMPONENTS['role']
+    n = 0
+    while (n < len(file_groups)) \
+    and (roles.index(file_groups[n]['role']) < roles.index(role)):
+        n += 1
+    file_groups.insert(n, {'role': role, 'files': [meta]})
+
 def files_to_filegroups(files):
     """Converts list of File objects to METS file_groups structure.
     
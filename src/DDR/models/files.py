@@ -4,8 +4,8 @@ import json
 import mimetypes
 mimetypes.init()
 import os
+import threading
 
-import envoy
 from jinja2 import Template
 
 from DDR import commands
@@ -16,6 +16,7 @@ from DDR import format_json
 from DDR.identifier import Identifier, ID_COMPONENTS
 from DDR import inheritance
 from DDR.models import common
+from DDR.models import session
 from DDR import modules
 from DDR import util
 
@@ -210,6 +211,11 @@ class File(common.DDRObject):
         to commit all modified files in one operation rather than piecemeal.
         IMPORTANT: This list only includes METADATA files, NOT binaries.
         
+        If commit is False and a models.batch_session is active for the
+        collection, the parent refresh is deferred until the session exits
+        and the changelog entry and staging are deferred by its
+        commands.transaction.
+        
         @param git_name: str
         @param git_mail: str
         @param agent: str
@@ -225,14 +231,28 @@ class File(common.DDRObject):
             parent = self.identifier.parent().object()
         
         self.write_json()
+        # keep reverse-links index current if one is loaded
+        index = _LINKS_INDEXES.get(os.path.normpath(self.entity_files_path))
+        if index:
+            index.update(self.json_path)
+        # and duplicate-binary index
+        index = _HASH_INDEXES.get(os.path.normpath(collection.path_abs))
+        if index:
+            index.update(self.json_path)
         # list of files to stage
         updated_files = [
             self.json_path,
         ]
+        batch = None
+        if not commit:
+            batch = session.active_session(collection.path_abs)
         if parent and (parent.identifier.model in ['entity','segment']):
             # update parent.children
-            parent.children(force_read=True)
-            parent.write_json()
+            if batch:
+                batch.mark_parent(parent)
+            elif not parent.patch_child(self):
+                parent.children(force_read=True)
+                parent.write_json()
             updated_files.append(parent.json_path)
             updated_files.append(parent.changelog_path)
         
@@ -460,16 +480,24 @@ class File(common.DDRObject):
             self.access_rel,
         ]
     
-    def present( self ):
+    def present( self, presence=None ):
         """Indicates whether or not the original file is currently present in the filesystem.
+        
+        @param presence: dict (optional) Results of files_presence
         """
+        if presence and (self.id in presence):
+            return presence[self.id]['file']
         if self.path_abs and os.path.exists(self.path_abs):
             return True
         return False
     
-    def access_present( self ):
+    def access_present( self, presence=None ):
         """Indicates whether or not the access file is currently present in the filesystem.
+        
+        @param presence: dict (optional) Results of files_presence
         """
+        if presence and (self.id in presence):
+            return presence[self.id]['access']
         if self.access_abs and os.path.exists(self.access_abs):
             return True
         return False
@@ -569,27 +597,11 @@ class File(common.DDRObject):
     
     def links_incoming( self ):
         """List of path_rels of files that link to this file.
+        
+        Uses the entity's LinksIndex (see links_index).  A link matches
+        if it contains this file's basename.
         """
-        incoming = []
-        cmd = 'find {} -name "*.json" -print'.format(self.entity_files_path)
-        r = envoy.run(cmd)
-        jsons = []
-        if r.std_out:
-            jsons = r.std_out.strip().split('\n')
-        for filename in jsons:
-            data = json.loads(fileio.read_text(filename))
-            path_rel = None
-            for field in data:
-                if field.get('path_rel',None):
-                    path_rel = field['path_rel']
-            for field in data:
-                linksraw = field.get('links', None)
-                if linksraw:
-                    for link in linksraw.strip().split(';'):
-                        link = link.strip()
-                        if self.basename in link:
-                            incoming.append(path_rel)
-        return incoming
+        return links_index(self.entity_files_path).incoming(self.basename)
     
     def links_outgoing( self ):
         """List of path_rels of files this file links to.
@@ -607,9 +619,13 @@ class File(common.DDRObject):
                 links.append(l)
         return links
 
-    def exists(self):
+    def exists(self, presence=None):
         """Indicates whether the exits or not; takes File.external into account.
         
+        When checking many Files, pass in the results of files_presence
+        to avoid separate stats per file.
+        
+        @param presence: dict (optional) Results of files_presence
         @returns: bool
         """
         FILE_EXISTS = {
@@ -625,8 +641,14 @@ class File(common.DDRObject):
            #'-EF'
             'JEF': True,
         }
+        if presence and (self.id in presence):
+            json_exists = presence[self.id]['json']
+            file_exists = presence[self.id]['file']
+        else:
+            json_exists = os.path.exists(self.identifier.path_abs('json'))
+            file_exists = self.path_abs and os.path.exists(self.path_abs)
         score = ''
-        if os.path.exists(self.identifier.path_abs('json')):
+        if json_exists:
             score += 'J'
         else:
             score += '-'
@@ -634,7 +656,7 @@ class File(common.DDRObject):
             score += 'E'
         else:
             score += '-'
-        if self.path_abs and os.path.exists(self.path_abs):
+        if file_exists:
             score += 'F'
         else:
             score += '-'
@@ -656,3 +678,462 @@ class File(common.DDRObject):
                 if part
             ])
         return self.mimetype
+
+
+def _scan_dir(path):
+    """os.scandir a directory once; returns DirEntry objects by name
+    """
+    try:
+        with os.scandir(path) as it:
+            return {entry.name: entry for entry in it}
+    except (FileNotFoundError, NotADirectoryError):
+        return {}
+
+def _entry_present(entries, path):
+    """True if path is present; annex symlinks count only if content is
+    
+    DirEntry.is_file follows symlinks but does not stat regular files.
+    """
+    if not path:
+        return False
+    entry = entries.get(os.path.basename(path))
+    return bool(entry) and entry.is_file()
+
+def files_presence(files):
+    """Checks JSON, binary, access file, and annex content for many Files
+    
+    Lists each directory once with os.scandir instead of running several
+    os.path.exists calls per File.  Results can be passed to
+    File.exists, File.present, and File.access_present.
+    
+    @param files: list of File objects
+    @returns: dict {file_id: {'json','file','access','annexed'}}
+    """
+    listings = {}
+    def entries(path):
+        d = os.path.dirname(path)
+        if d not in listings:
+            listings[d] = _scan_dir(d)
+        return listings[d]
+    presence = {}
+    for f in files:
+        json_path = f.identifier.path_abs('json')
+        file_entry = None
+        if f.path_abs:
+            file_entry = entries(f.path_abs).get(os.path.basename(f.path_abs))
+        presence[f.id] = {
+            'json': _entry_present(entries(json_path), json_path),
+            'file': bool(file_entry) and file_entry.is_file(),
+            'access': bool(f.access_abs) \
+                and _entry_present(entries(f.access_abs), f.access_abs),
+            # binary is a git-annex symlink (content may be absent)
+            'annexed': bool(file_entry) and file_entry.is_symlink(),
+        }
+    return presence
+
+
+# Reverse-link indexes by entity files path, least recently used first
+_LINKS_INDEXES = OrderedDict()
+# Max number of LinksIndexes kept in a process
+LINKS_INDEXES_MAX = 100
+
+def links_index(entity_files_path):
+    """Returns up-to-date LinksIndex for the entity files directory.
+    
+    @param entity_files_path: str Absolute path to entity's files dir.
+    @returns: LinksIndex
+    """
+    path = os.path.normpath(entity_files_path)
+    if path in _LINKS_INDEXES:
+        _LINKS_INDEXES.move_to_end(path)
+    else:
+        _LINKS_INDEXES[path] = LinksIndex(path)
+        while len(_LINKS_INDEXES) > LINKS_INDEXES_MAX:
+            _LINKS_INDEXES.popitem(last=False)
+    index = _LINKS_INDEXES[path]
+    index.refresh()
+    return index
+
+class LinksIndex():
+    """Reverse index of File.links for the files in one entity.
+    
+    Holds the links of every File in the entity in memory, so
+    File.links_incoming does not read every JSON file in the entity.
+    
+    refresh() only walks the directories if their mtimes show that files
+    were added or removed, and then only rereads new or changed files.
+    Changes to existing files are picked up by update(), which File.save
+    calls after writing the file's JSON.
+    """
+    path = None
+    
+    def __init__(self, entity_files_path):
+        """
+        @param entity_files_path: str Absolute path to entity's files dir.
+        """
+        self.path = entity_files_path
+        # dir: mtime_ns as of last walk
+        self.dirs = {}
+        # json_path: (stat, path_rel, links)
+        self.sources = {}
+    
+    def __repr__(self):
+        return "<%s.%s %s>" % (
+            self.__module__, self.__class__.__name__, self.path
+        )
+    
+    @staticmethod
+    def _stat(json_path):
+        st = os.stat(json_path)
+        return (st.st_mtime_ns, st.st_size)
+    
+    @staticmethod
+    def _read(json_path):
+        """Get path_rel and list of links from a File JSON
+        
+        @param json_path: str
+        @returns: (path_rel, links)
+        """
+        data = json.loads(fileio.read_text(json_path))
+        path_rel = None
+        links = []
+        for field in data:
+            if field.get('path_rel',None):
+                path_rel = field['path_rel']
+        for field in data:
+            linksraw = field.get('links', None)
+            if linksraw:
+                links = links + [
+                    link.strip() for link in linksraw.strip().split(';')
+                ]
+        return path_rel,links
+    
+    def _dirs_changed(self):
+        """True if files may have been added or removed since the last walk"""
+        if not self.dirs:
+            return True
+        for d,mtime in self.dirs.items():
+            try:
+                if os.stat(d).st_mtime_ns != mtime:
+                    return True
+            except FileNotFoundError:
+                return True
+        return False
+    
+    def _json_paths(self):
+        """Walk the entity files dir, noting directory mtimes
+        """
+        self.dirs = {}
+        paths = []
+        for root, dirs, files in os.walk(self.path):
+            self.dirs[root] = os.stat(root).st_mtime_ns
+            for f in files:
+                if f.endswith('.json'):
+                    paths.append(os.path.join(root, f))
+        return paths
+    
+    def refresh(self):
+        """Reread new or modified JSON files and drop deleted ones
+        
+        Does nothing unless files were added or removed (see _dirs_changed).
+        
+        @returns: bool True if index changed
+        """
+        if not self._dirs_changed():
+            return False
+        changed = False
+        present = set()
+        for json_path in self._json_paths():
+            try:
+                stat = self._stat(json_path)
+            except FileNotFoundError:
+                continue
+            present.add(json_path)
+            if (json_path not in self.sources) \
+            or (self.sources[json_path][0] != stat):
+                self._set(json_path, (stat,) + self._read(json_path))
+                changed = True
+        for json_path in list(self.sources.keys()):
+            if json_path not in present:
+                self._set(json_path, None)
+                changed = True
+        return changed
+    
+    def update(self, json_path):
+        """Reread one File's JSON after its links were written
+        
+        @param json_path: str Absolute path to File JSON
+        """
+        if os.path.exists(json_path):
+            self._set(json_path, (self._stat(json_path),) + self._read(json_path))
+        else:
+            self._set(json_path, None)
+    
+    def _set(self, json_path, source):
+        """Replace one file's entry
+        
+        @param json_path: str
+        @param source: (stat, path_rel, links) or None to remove
+        """
+        self.sources.pop(json_path, None)
+        if source:
+            self.sources[json_path] = source
+    
+    def incoming(self, basename):
+        """List of path_rels of files with a link containing basename
+        
+        Same matching as the old find-based File.links_incoming: a file
+        is listed once for each of its links that contains basename.
+        Links are scanned in memory; no files are read.
+        
+        @param basename: str File.basename
+        @returns: list
+        """
+        return [
+            path_rel
+            for stat,path_rel,links in self.sources.values()
+            for link in links
+            if basename in link
+        ]
+
+
+# saved in the collection's .git dir so it is never in the working tree
+HASH_INDEX_FILENAME = 'ddr-hashes.json'
+
+_HASH_INDEXES = {}
+_HASH_INDEXES_LOCK = threading.Lock()
+
+def hash_index(collection_path, refresh=True):
+    """Returns HashIndex for the collection
+    
+    The index is loaded from HASH_INDEX_FILENAME and refreshed from
+    disk the first time it is requested in a process.  After that it
+    is kept current by File.save; set refresh=True to also pick up
+    changes made by other processes.
+    
+    @param collection_path: str Absolute path to collection repo.
+    @param refresh: bool Check File JSONs for changes
+    @returns: HashIndex
+    """
+    path = os.path.normpath(collection_path)
+    # ingest worker threads may ask for the index at the same time
+    with _HASH_INDEXES_LOCK:
+        if path not in _HASH_INDEXES:
+            index = HashIndex(path)
+            index.load()
+            if index.refresh():
+                index.save()
+            _HASH_INDEXES[path] = index
+            return index
+    index = _HASH_INDEXES[path]
+    if refresh and index.refresh():
+        index.save()
+    return index
+
+def save_hash_indexes():
+    """Write the HashIndexes loaded in this process that have changed
+    """
+    for index in list(_HASH_INDEXES.values()):
+        index.save()
+
+
+class HashIndex():
+    """Maps sha1 and sha256 of File binaries to File IDs for one collection.
+    
+    Lets ingest and import checks find duplicate binaries with a dict
+    lookup instead of reading every File JSON in the collection.
+    
+    Saved as JSON in HASH_INDEX_FILENAME in the collection's .git dir.
+    Entries are validated against each File JSON's mtime and size; only
+    new or changed files are reread.
+    
+    Binaries that are being ingested but not yet saved are held with
+    reserve() so that a second copy in the same import is caught too.
+    Methods take a lock since ingest worker threads look hashes up while
+    the main thread saves Files.
+    """
+    path = None
+    
+    def __init__(self, collection_path):
+        """
+        @param collection_path: str Absolute path to collection repo.
+        """
+        self.path = collection_path
+        self.index_path = os.path.join(collection_path, '.git', HASH_INDEX_FILENAME)
+        # json_path_rel: [mtime_ns, size, file_id, sha1, sha256]
+        self.sources = {}
+        # hash: [file_id, ...]
+        self.hashes = {}
+        # hash: source path of binary being ingested
+        self.reserved = {}
+        self.dirty = False
+        self.lock = threading.RLock()
+    
+    def __repr__(self):
+        return "<%s.%s %s>" % (
+            self.__module__, self.__class__.__name__, self.path
+        )
+    
+    def load(self):
+        """Read saved index, if any"""
+        with self.lock:
+            self.sources = {}
+            if os.path.exists(self.index_path):
+                try:
+                    self.sources = json.loads(fileio.read_text(self.index_path))
+                except ValueError:
+                    self.dirty = True
+            self._build_hashes()
+    
+    def save(self):
+        """Write index if changed; write-and-rename so readers never see partial files
+        
+        Not written if the collection is not a Git repository.
+        """
+        with self.lock:
+            if not (self.dirty and os.path.isdir(os.path.dirname(self.index_path))):
+                return
+            tmp_path = '%s.%s.tmp' % (self.index_path, os.getpid())
+            fileio.write_text(json.dumps(self.sources, sort_keys=True), tmp_path)
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+    
+    @staticmethod
+    def _read(json_path):
+        """Get id, sha1, sha256 from a File JSON
+        
+        @param json_path: str
+        @returns: (file_id, sha1, sha256)
+        """
+        data = {}
+        for field in json.loads(fileio.read_text(json_path)):
+            for key in ['id', 'sha1', 'sha256']:
+                if key in field:
+                    data[key] = field[key]
+        return data.get('id'),data.get('sha1'),data.get('sha256')
+    
+    def _json_paths(self):
+        return util.find_meta_files(
+            self.path, recursive=True, model='file', force_read=True
+        )
+    
+    def _entry(self, json_path):
+        st = os.stat(json_path)
+        return [st.st_mtime_ns, st.st_size] + list(self._read(json_path))
+    
+    def refresh(self):
+        """Reread new or modified File JSONs and drop deleted ones
+        
+        @returns: bool True if index changed
+        """
+        changed = False
+        present = set()
+        json_paths = self._json_paths()
+        with self.lock:
+            for json_path in json_paths:
+                path_rel = os.path.relpath(json_path, self.path)
+                present.add(path_rel)
+                try:
+                    st = os.stat(json_path)
+                except FileNotFoundError:
+                    continue
+                entry = self.sources.get(path_rel)
+                if (not entry) or (entry[:2] != [st.st_mtime_ns, st.st_size]):
+                    self.sources[path_rel] = self._entry(json_path)
+                    changed = True
+            for path_rel in list(self.sources.keys()):
+                if path_rel not in present:
+                    self.sources.pop(path_rel)
+                    changed = True
+            if changed:
+                self.dirty = True
+                self._build_hashes()
+        return changed
+    
+    def update(self, json_path):
+        """Reread one File JSON after it was written
+        
+        The File's hashes are no longer reserved once it is indexed.
+        
+        @param json_path: str Absolute path to File JSON
+        """
+        path_rel = os.path.relpath(json_path, self.path)
+        with self.lock:
+            old = self.sources.pop(path_rel, None)
+            if old:
+                self._unindex(old)
+            if os.path.exists(json_path):
+                entry = self._entry(json_path)
+                self.sources[path_rel] = entry
+                self._index(entry)
+                self.release(entry[3], entry[4])
+            self.dirty = True
+    
+    def _index(self, entry):
+        mtime,size,file_id,sha1,sha256 = entry
+        for h in [sha1, sha256]:
+            if h:
+                if h not in self.hashes:
+                    self.hashes[h] = []
+                if file_id not in self.hashes[h]:
+                    self.hashes[h].append(file_id)
+    
+    def _unindex(self, entry):
+        mtime,size,file_id,sha1,sha256 = entry
+        for h in [sha1, sha256]:
+            if h and (file_id in self.hashes.get(h, [])):
+                self.hashes[h].remove(file_id)
+                if not self.hashes[h]:
+                    self.hashes.pop(h)
+    
+    def _build_hashes(self):
+        self.hashes = {}
+        for path_rel in sorted(self.sources.keys()):
+            self._index(self.sources[path_rel])
+    
+    def lookup(self, sha1=None, sha256=None):
+        """IDs of Files with the given sha1 or sha256
+        
+        @param sha1: str
+        @param sha256: str
+        @returns: list of file IDs
+        """
+        found = []
+        with self.lock:
+            for h in [sha1, sha256]:
+                for file_id in self.hashes.get(h, []) if h else []:
+                    if file_id not in found:
+                        found.append(file_id)
+        return found
+    
+    def reserve(self, sha1, sha256, src_path):
+        """Look up a binary that is about to be ingested and hold its hashes
+        
+        If there are no duplicates the hashes are reserved until the
+        File is saved (see update) or release() is called.
+        
+        @param sha1: str
+        @param sha256: str
+        @param src_path: str Source of binary being ingested
+        @returns: list of file IDs or source paths of duplicates
+        """
+        with self.lock:
+            found = self.lookup(sha1=sha1, sha256=sha256)
+            for h in [sha1, sha256]:
+                if h and (h in self.reserved) and (self.reserved[h] not in found):
+                    found.append(self.reserved[h])
+            if not found:
+                for h in [sha1, sha256]:
+                    if h:
+                        self.reserved[h] = src_path
+        return found
+    
+    def release(self, sha1, sha256):
+        """Drop reservation made by reserve()
+        
+        @param sha1: str
+        @param sha256: str
+        """
+        with self.lock:
+            for h in [sha1, sha256]:
+                self.reserved.pop(h, None)
@@ -0,0 +1,158 @@
+"""Batch sessions - defer parent entity rewrites during batch operations
+
+Saving a File normally reloads every sibling File in order to refresh the
+parent Entity's children/file_groups, rewrites the parent's JSON, and writes
+a changelog entry.  When importing or updating many files under one entity
+that adds up to O(N^2) reads and N parent rewrites.
+
+Inside a batch session File.save and Entity.save (with commit=False) only
+write their own JSON and mark their parents dirty.  Parent refreshes,
+changelog entries, and staging are deferred until the session exits, at
+which point each dirty parent is rewritten exactly once.  Changelogs and
+staging are handled by a commands.transaction opened with the session.
+
+>>> from DDR import models
+>>> collection = identifier.Identifier('ddr-test-123', '/var/www/media/ddr').object()
+>>> with models.batch_session(collection) as session:
+...     for file_ in files:
+...         file_.save(git_name, git_mail, agent, commit=False)
+
+Sessions are keyed to the collection path.  Opening a session for a
+collection that already has an active session reuses the existing one.
+"""
+
+from contextlib import contextmanager
+import logging
+logger = logging.getLogger(__name__)
+import os
+from typing import Any, Dict, List, Optional
+
+from DDR import commands
+
+# Active sessions by collection path
+_SESSIONS: Dict[str, 'BatchSession'] = {}
+
+
+def active_session(collection_path: str) -> Optional['BatchSession']:
+    """Returns the BatchSession for the collection if one is active.
+
+    @param collection_path: str Absolute path to collection repo.
+    @returns: BatchSession or None
+    """
+    if not collection_path:
+        return None
+    return _SESSIONS.get(os.path.normpath(collection_path))
+
+
+class BatchSession():
+    """Collects parent rewrites, changelog messages and files to stage.
+
+    Changelog messages and files are recorded in a commands.Transaction
+    so that commands.update/entity_update calls made during the session
+    are deferred as well.
+
+    Use via models.batch_session rather than instantiating directly.
+    """
+    collection = None
+    transaction = None
+
+    def __init__(self, collection, transaction):
+        """
+        @param collection: Collection
+        @param transaction: commands.Transaction
+        """
+        self.collection = collection
+        self.collection_path = os.path.normpath(collection.path_abs)
+        self.transaction = transaction
+        # parent objects by ID, in order first marked
+        self.parents: Dict[str, Any] = {}
+
+    def __repr__(self):
+        return "<%s.%s %s>" % (
+            self.__module__, self.__class__.__name__, self.collection_path
+        )
+
+    @property
+    def git_files(self) -> List[str]:
+        return self.transaction.git_files
+
+    @property
+    def annex_files(self) -> List[str]:
+        return self.transaction.annex_files
+
+    def mark_parent(self, parent):
+        """Mark parent Entity for refresh of children/file_groups at exit.
+
+        @param parent: Entity
+        """
+        if parent.id not in self.parents:
+            self.parents[parent.id] = parent
+
+    def changelog(self, path, messages, user, mail, agent=''):
+        """Queue changelog messages; one entry per changelog is written at exit.
+
+        @param path: str Absolute path to changelog
+        @param messages: list of str
+        @param user: str
+        @param mail: str
+        @param agent: str
+        """
+        self.transaction.changelog(path, messages, user, mail, agent)
+
+    def add_files(self, git_files=[], annex_files=[]):
+        """Queue files to be staged at exit.
+
+        @param git_files: list of paths (absolute or relative to collection)
+        @param annex_files: list of paths (absolute or relative to collection)
+        """
+        self.transaction.add_files(git_files=git_files, annex_files=annex_files)
+
+    def refresh_parents(self):
+        """Rewrite dirty parents once each
+
+        @returns: list of parent json paths (relative to collection)
+        """
+        updated = []
+        for pid,parent in self.parents.items():
+            logger.debug('refreshing %s' % parent)
+            parent.children(force_read=True)
+            parent.write_json()
+            updated.append(
+                os.path.relpath(parent.json_path, self.collection_path)
+            )
+        self.parents = {}
+        self.add_files(git_files=updated)
+        return updated
+
+
+@contextmanager
+def batch_session(collection, stage=True, git_name='', git_mail='', agent=''):
+    """Defer parent rewrites, changelogs, and staging until exit.
+
+    If a session is already active for the collection it is reused
+    and the outer session does the work at exit.
+
+    @param collection: Collection
+    @param stage: bool Stage updated files at exit.
+    @param git_name: str Default user for changelog entries
+    @param git_mail: str Default mail for changelog entries
+    @param agent: str
+    @returns: BatchSession
+    """
+    path = os.path.normpath(collection.path_abs)
+    if _SESSIONS.get(path):
+        yield _SESSIONS[path]
+        return
+    with commands.transaction(
+            collection, git_name, git_mail, agent, stage=stage) as tx:
+        session = BatchSession(collection, tx)
+        _SESSIONS[path] = session
+        try:
+            yield session
+        finally:
+            # unregister first so parents are saved normally
+            _SESSIONS.pop(path, None)
+        # not reached if the body raised, so parents of a failed run
+        # are not rewritten; transaction writes changelogs and stages
+        # when it exits
+        session.refresh_parents()
@@ -3,6 +3,7 @@ import hashlib
 import os
 from pathlib import Path
 import re
+import shutil
 from typing import Any, Dict, List, Match, Optional, Set, Tuple, Union
 
 from DDR import config
@@ -113,22 +114,171 @@ def natural_order_string(id: str) -> str:
         raise Exception('Valid DDR ID required.')
     return alnum.pop()
 
+# Read size for file_hashes; a multiple of the page size
+HASH_BLOCK_SIZE = 1024 * 1024
+
 def file_hash(path, algo='sha1'):
-    if algo == 'sha256':
-        h = hashlib.sha256()
-    elif algo == 'md5':
-        h = hashlib.md5()
-    else:
-        h = hashlib.sha1()
-    block_size=1024
-    f = open(path, 'rb')
-    while True:
-        data = f.read(block_size)
-        if not data:
-            break
-        h.update(data)
-    f.close()
-    return h.hexdigest()
+    """Hash of a file; see file_hashes
+    
+    @param path: str
+    @param algo: str 'md5', 'sha1', or 'sha256' (anything else is sha1)
+    @returns: str hexdigest
+    """
+    if algo not in ['sha256', 'md5']:
+        algo = 'sha1'
+    return file_hashes(path, [algo])[algo]
+
+def file_hashes(path, algos=('md5', 'sha1', 'sha256'),
+                block_size=HASH_BLOCK_SIZE) -> Dict[str, str]:
+    """Calculate several hashes of a file while reading it only once
+    
+    Reads the file in large chunks into a single reusable buffer and
+    feeds each chunk to all the digests.
+    
+    >>> file_hashes('/tmp/file.tif', ['md5', 'sha1'])
+    {'md5': '...', 'sha1': '...'}
+    
+    @param path: str
+    @param algos: list of hashlib algorithm names
+    @param block_size: int Bytes per read
+    @returns: dict of hexdigests by algo
+    """
+    hashes = {algo: hashlib.new(algo) for algo in algos}
+    buf = bytearray(block_size)
+    view = memoryview(buf)
+    with open(path, 'rb', buffering=0) as f:
+        if hasattr(os, 'posix_fadvise'):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        while True:
+            n = f.readinto(buf)
+            if not n:
+                break
+            for h in hashes.values():
+                h.update(view[:n])
+    return {algo: h.hexdigest() for algo,h in hashes.items()}
+
+# linux/fs.h FICLONE = _IOW(0x94, 9, int)
+FICLONE = 0x40049409
+
+def reflink(src_fd: int, dest_fd: int) -> bool:
+    """Make dest a copy-on-write clone of src (Btrfs, XFS, etc)
+    
+    @param src_fd: int File descriptor open for reading
+    @param dest_fd: int File descriptor open for writing
+    @returns: bool True if the clone was made
+    """
+    try:
+        import fcntl
+        fcntl.ioctl(dest_fd, FICLONE, src_fd)
+        return True
+    except (ImportError, OSError):
+        return False
+
+def same_device(src_path: str, dest_path: str) -> bool:
+    """True if dest_path (or its directory, if it does not exist yet)
+    is on the same filesystem as src_path
+    """
+    dest = dest_path if os.path.exists(dest_path) else os.path.dirname(dest_path)
+    try:
+        return os.stat(src_path).st_dev == os.stat(dest).st_dev
+    except OSError:
+        return False
+
+# st_dev: whether reflinks work on the filesystem (see clone_file)
+REFLINK_DEVICES: Dict[int, bool] = {}
+
+def clone_file(src_path: str, dest_path: str, hardlink: bool=False) -> Optional[str]:
+    """Make dest_path share src_path's data blocks instead of copying them
+    
+    If both are on the same filesystem, tries a reflink (copy-on-write
+    clone; safe, src and dest stay independent), then if hardlink is True
+    a hard link.  Note that a hard link is the same file as src: changing
+    permissions or contents of one changes the other.
+    
+    Whether a filesystem supports reflinks is only tried once; after
+    that no empty dest_path is made on filesystems that do not.
+    
+    @param src_path: str
+    @param dest_path: str (removed first if it exists)
+    @param hardlink: bool Allow hard links
+    @returns: str 'reflink' or 'hardlink', or None if dest_path was not made
+    """
+    # never write through an existing dest; it may be a link to src
+    if os.path.lexists(dest_path):
+        os.remove(dest_path)
+    if not same_device(src_path, dest_path):
+        return None
+    device = os.stat(src_path).st_dev
+    if REFLINK_DEVICES.get(device, True):
+        with open(src_path, 'rb', buffering=0) as src, \
+             open(dest_path, 'wb', buffering=0) as dest:
+            cloned = reflink(src.fileno(), dest.fileno())
+        REFLINK_DEVICES[device] = cloned
+        if cloned:
+            return 'reflink'
+        os.remove(dest_path)
+    if hardlink:
+        try:
+            os.link(src_path, dest_path)
+            return 'hardlink'
+        except OSError:
+            pass
+    return None
+
+def copy_file(src_path: str, dest_path: str, hardlink: bool=False) -> str:
+    """Copy file, cloning it if possible (see clone_file)
+    
+    @param src_path: str
+    @param dest_path: str
+    @param hardlink: bool Allow hard links
+    @returns: str 'reflink', 'hardlink', or 'copy'
+    """
+    method = clone_file(src_path, dest_path, hardlink)
+    if method:
+        return method
+    shutil.copyfile(src_path, dest_path)
+    return 'copy'
+
+def copy_file_hashes(src_path, dest_path, algos=('md5', 'sha1', 'sha256'),
+                     block_size=HASH_BLOCK_SIZE,
+                     hardlink=False) -> Tuple[str, Dict[str, str]]:
+    """Copy a file and calculate its hashes with a single read of the source
+    
+    If possible dest is made a clone of src (see clone_file) so no bytes
+    are written and hashing is the only read.  Otherwise each chunk
+    read is fed to the digests and written to dest.
+    
+    os.copy_file_range is not used: it copies in the kernel, so the data
+    would have to be read again to hash it.
+    
+    @param src_path: str
+    @param dest_path: str
+    @param algos: list of hashlib algorithm names
+    @param block_size: int Bytes per read
+    @param hardlink: bool Allow hard links
+    @returns: (method, hashes) str 'reflink', 'hardlink' or 'copy', dict of hexdigests
+    """
+    method = clone_file(src_path, dest_path, hardlink)
+    if method and not algos:
+        return method,{}
+    if method:
+        return method,file_hashes(src_path, algos, block_size)
+    with open(src_path, 'rb', buffering=0) as src, \
+         open(dest_path, 'wb', buffering=0) as dest:
+        hashes = {algo: hashlib.new(algo) for algo in algos}
+        buf = bytearray(block_size)
+        view = memoryview(buf)
+        while True:
+            n = src.readinto(buf)
+            if not n:
+                break
+            chunk = view[:n]
+            for h in hashes.values():
+                h.update(chunk)
+            written = 0
+            while written < n:
+                written += dest.write(chunk[written:])
+    return 'copy',{algo: h.hexdigest() for algo,h in hashes.items()}
 
 def normalize_text(text: str) -> str:
     """Strip text, convert line endings, etc.
@@ -253,3 +403,35 @@ class FileLogger():
         @returns: absolute path to logfile
         """
         return Path(config.LOG_DIR) / 'addfile' / identifier.collection_id() / f'{identifier.id}.log'
+
+
+class BufferedLogger(FileLogger):
+    """FileLogger that holds entries until they are flushed to another log
+    
+    Lets worker threads log work done ahead of time; the entries are
+    written to the real log when the work is used, so the log reads the
+    same as if the work had been done in order.
+    """
+    
+    def __init__(self):
+        self.path = None
+        self.entries = []
+    
+    def entry(self, status, msg, blank=False):
+        if blank:
+            self.entries.append('')
+            return
+        dt = datetime.now(config.TZ).strftime('%Y-%m-%d %H:%M:%S,%f')
+        self.entries.append(f'{dt} {status.upper():8} {msg}')
+    
+    def log(self):
+        return '\n'.join(self.entries)
+    
+    def flush(self, log):
+        """Write held entries to log
+        
+        @param log: FileLogger
+        """
+        for entry in self.entries:
+            fileio.append_text(entry, str(log.path))
+        self.entries = []
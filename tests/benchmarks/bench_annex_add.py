@@ -0,0 +1,57 @@
+"""Benchmark dvcs.annex_add_batch against one `git annex add` per file
+
+Not collected by pytest.  Run by hand; needs git-annex.  Creates a
+temporary annex repo with --files small files for each method.
+
+    $ python tests/benchmarks/bench_annex_add.py --files 2000
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import git
+
+from DDR import dvcs
+
+
+def make_repo(path, num_files):
+    repo = git.Repo.init(path)
+    repo.git.config('user.name', 'bench')
+    repo.git.config('user.email', 'bench@example.com')
+    repo.git.annex('init', 'bench')
+    paths = []
+    for n in range(num_files):
+        path_rel = f'file-{n:06}.jpg'
+        with open(os.path.join(path, path_rel), 'wb') as f:
+            f.write(os.urandom(1024))
+        paths.append(path_rel)
+    return repo,paths
+
+def per_file(repo, paths):
+    """One git-annex process per file (like calling annex_stage per file)"""
+    for path in paths:
+        repo.git.annex('add', path)
+
+def timed(label, num_files, fn):
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:40} {elapsed:8.2f}s {num_files / elapsed:10.1f} files/s')
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--files', type=int, default=500,
+                        help='Number of files to annex (default 500).')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        repo,paths = make_repo(os.path.join(tmpdir, 'per-file'), args.files)
+        timed('git annex add (per file)', args.files,
+              lambda: per_file(repo, paths))
+        repo,paths = make_repo(os.path.join(tmpdir, 'batch'), args.files)
+        timed('git annex add --batch --json', args.files,
+              lambda: dvcs.annex_add_batch(repo, paths))
+        assert len(dvcs.list_staged(repo)) == args.files
+
+if __name__ == '__main__':
+    main()
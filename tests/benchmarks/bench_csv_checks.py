@@ -0,0 +1,121 @@
+"""Benchmark CSV ID checks used by `ddrimport check`
+
+Not collected by pytest.  Run by hand; needs ddr-defs (repo_models).
+Generates a CSV of --rows entity rows (with --dupes duplicated IDs) and
+a synthetic collection with --existing entities, then times the
+previous list-based checks against csvfile.find_duplicate_ids,
+csvfile.find_multiple_cids, and batch.Checker._ids_in_local_repo.
+
+    $ python tests/benchmarks/bench_csv_checks.py --rows 100000 --existing 20000
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+
+from DDR import batch
+from DDR import csvfile
+from DDR import fileio
+from DDR import identifier
+from DDR import util
+
+COLLECTION_ID = 'ddr-testing-123'
+
+
+def old_find_duplicate_ids(rowds):
+    errs = []
+    ids = []
+    for n,rowd in enumerate(rowds):
+        if rowd['id'] in ids:
+            errs.append('row %s: %s' % (n, rowd['id']))
+        else:
+            ids.append(rowd['id'])
+    return errs
+
+def old_find_multiple_cids(rowds):
+    cids = []
+    for n,rowd in enumerate(rowds):
+        try:
+            oid = identifier.Identifier(rowd['id'])
+        except identifier.InvalidInputException:
+            continue
+        except identifier.InvalidIdentifierException:
+            continue
+        cid = oid.collection().id
+        if cid not in cids:
+            cids.append(cid)
+    if len(cids) > 1:
+        return cids
+    return []
+
+def old_ids_in_local_repo(rowds, model, collection_path):
+    metadata_paths = util.find_meta_files(
+        collection_path, model=model, recursive=True, force_read=True
+    )
+    existing_ids = [
+        identifier.Identifier(path=path).id
+        for path in metadata_paths
+    ]
+    new_ids = [rowd['id'] for rowd in rowds]
+    return [i for i in new_ids if i in existing_ids]
+
+def make_csv(path, num_rows, num_dupes):
+    """Write CSV of entity rows; last num_dupes rows repeat earlier IDs"""
+    rows = [['id', 'title']]
+    for n in range(num_rows - num_dupes):
+        rows.append([f'{COLLECTION_ID}-{n + 1}', f'Entity {n + 1}'])
+    for n in range(num_dupes):
+        rows.append([f'{COLLECTION_ID}-{n + 1}', f'Duplicate {n + 1}'])
+    fileio.write_csv(path, rows[0], rows[1:])
+
+def make_repo(path, num_existing):
+    """Collection with entity.json files for the first num_existing entities"""
+    for n in range(num_existing):
+        eid = f'{COLLECTION_ID}-{n + 1}'
+        entity_path = os.path.join(path, 'files', eid)
+        os.makedirs(entity_path)
+        with open(os.path.join(entity_path, 'entity.json'), 'w') as f:
+            f.write(json.dumps([{}, {'id': eid}]))
+
+def timed(label, fn):
+    start = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - start
+    print(f'{label:50} {elapsed:10.3f}s')
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=20000,
+                        help='Number of CSV rows (default 20000).')
+    parser.add_argument('--dupes', type=int, default=100,
+                        help='Number of duplicated IDs in CSV (default 100).')
+    parser.add_argument('--existing', type=int, default=5000,
+                        help='Number of entities already in repo (default 5000).')
+    parser.add_argument('--skip-old', action='store_true',
+                        help='Only time the current implementations.')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmpdir:
+        csv_path = os.path.join(tmpdir, 'entities.csv')
+        collection_path = os.path.join(tmpdir, COLLECTION_ID)
+        make_csv(csv_path, args.rows, args.dupes)
+        make_repo(collection_path, args.existing)
+        headers,rowds,csv_errs = csvfile.make_rowds(fileio.read_csv(csv_path))
+        print(f'{len(rowds)} rows, {args.existing} existing entities')
+        checks = [
+            ('find_duplicate_ids',
+             old_find_duplicate_ids, csvfile.find_duplicate_ids, (rowds,)),
+            ('find_multiple_cids',
+             old_find_multiple_cids, csvfile.find_multiple_cids, (rowds,)),
+            ('_ids_in_local_repo',
+             old_ids_in_local_repo, batch.Checker._ids_in_local_repo,
+             (rowds, 'entity', collection_path)),
+        ]
+        for name,old,new,fargs in checks:
+            out = timed(name, lambda: new(*fargs))
+            if not args.skip_old:
+                assert timed(f'{name} (old)', lambda: old(*fargs)) == out
+
+if __name__ == '__main__':
+    main()
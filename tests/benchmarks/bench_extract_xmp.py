@@ -0,0 +1,126 @@
+"""Benchmark imaging.extract_xmp normalization and the no-XMP fast path
+
+Not collected by pytest.  Run by hand, optionally pointing at real
+photo/TIFF/PDF master files; otherwise fixtures with large (--packet-kb)
+XMP packets are generated.
+
+    $ python tests/benchmarks/bench_extract_xmp.py --packet-kb 2048
+    $ python tests/benchmarks/bench_extract_xmp.py photo.jpg scan.tif doc.pdf
+
+Normalization is timed against the previous while/replace loop and
+checked for identical output.  libxmp (Exempi) is only needed to time
+extract_xmp itself; the normalization benchmark runs without it.
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from DDR import imaging
+
+RDF_NS = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+
+
+def old_normalize_xmp(xml):
+    """Previous extract_xmp normalization"""
+    while xml.find('\n ') > -1:
+        xml = xml.replace('\n ', '\n')
+    return xml.replace('\n','')
+
+def make_packet(size_kb):
+    """Indented XMP packet roughly size_kb long, as Exempi serializes it"""
+    lines = [
+        '<?xpacket begin="\ufeff" id="W5M0MpCehiHzreSzNTczkc9d"?>',
+        '<x:xmpmeta xmlns:x="adobe:ns:meta/">',
+        f' <rdf:RDF xmlns:rdf="{RDF_NS}">',
+        '  <rdf:Description rdf:about="" xmlns:dc="http://purl.org/dc/elements/1.1/">',
+        '   <dc:subject>',
+        '    <rdf:Bag>',
+    ]
+    n = 0
+    while sum(len(line) + 1 for line in lines) < size_kb * 1024:
+        lines.append(f'     <rdf:li>keyword {n}</rdf:li>')
+        n += 1
+    lines += [
+        '    </rdf:Bag>',
+        '   </dc:subject>',
+        '  </rdf:Description>',
+        ' </rdf:RDF>',
+        '</x:xmpmeta>',
+        ' ' * 2048,  # padding, as written by XMP toolkits
+        '<?xpacket end="w"?>',
+    ]
+    return '\n'.join(lines)
+
+def _jpeg_segment(code, data):
+    return bytes([0xFF, code]) + (len(data) + 2).to_bytes(2, 'big') + data
+
+def make_fixtures(tmpdir, packet):
+    """Write photo, TIFF, and PDF fixtures with and without XMP"""
+    xmp = packet.encode('utf-8')
+    body = os.urandom(1024 * 1024)
+    fixtures = {}
+    # JPEG: XMP APP1 segments are limited to 64KB
+    jpeg_xmp = imaging.JPEG_XMP_NS + xmp[:65000]
+    fixtures['photo-xmp.jpg'] = b'\xff\xd8' \
+        + _jpeg_segment(0xE1, jpeg_xmp) + _jpeg_segment(0xDA, b'\x00' * 10) \
+        + body + b'\xff\xd9'
+    fixtures['photo-noxmp.jpg'] = b'\xff\xd8' \
+        + _jpeg_segment(0xE0, b'JFIF\x00' + b'\x00' * 9) \
+        + _jpeg_segment(0xDA, b'\x00' * 10) + body + b'\xff\xd9'
+    # TIFF: one IFD with XMP tag pointing at packet after image data
+    offset = 8 + 2 + 12 + 4
+    entry = (imaging.TIFF_XMP_TAG).to_bytes(2, 'little') \
+        + (7).to_bytes(2, 'little') + len(xmp).to_bytes(4, 'little') \
+        + offset.to_bytes(4, 'little')
+    fixtures['scan-xmp.tif'] = b'II*\x00' + (8).to_bytes(4, 'little') \
+        + (1).to_bytes(2, 'little') + entry + b'\x00' * 4 + xmp + body
+    # PDF: metadata stream
+    fixtures['doc-xmp.pdf'] = b'%PDF-1.4\n1 0 obj\n<< /Type /Metadata ' \
+        + b'/Subtype /XML /Length ' + str(len(xmp)).encode() + b' >>\nstream\n' \
+        + xmp + b'\nendstream\nendobj\n' + body + b'\n%%EOF\n'
+    paths = []
+    for filename,data in fixtures.items():
+        path = os.path.join(tmpdir, filename)
+        with open(path, 'wb') as f:
+            f.write(data)
+        paths.append(path)
+    return paths
+
+def timed(label, fn, repeat=1):
+    start = time.perf_counter()
+    for n in range(repeat):
+        out = fn()
+    elapsed = (time.perf_counter() - start) / repeat
+    print(f'{label:50} {elapsed * 1000:10.2f} ms')
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('paths', nargs='*', help='Existing files to test.')
+    parser.add_argument('--packet-kb', type=int, default=512,
+                        help='Size of generated XMP packet (default 512).')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    packet = make_packet(args.packet_kb)
+    print(f'normalizing {len(packet) // 1024} KB packet')
+    old = timed('old while/replace loop', lambda: old_normalize_xmp(packet))
+    new = timed('imaging.normalize_xmp', lambda: imaging.normalize_xmp(packet),
+                args.repeat)
+    assert new == old
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = args.paths or make_fixtures(tmpdir, packet)
+        for path in paths:
+            name = os.path.basename(path)
+            timed(f'has_xmp {name} -> {imaging.has_xmp(path)}',
+                  lambda: imaging.has_xmp(path), args.repeat)
+            try:
+                timed(f'extract_xmp {name}',
+                      lambda: imaging.extract_xmp(path), args.repeat)
+            except Exception as err:
+                print(f'extract_xmp {name} failed: {err}')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+"""Benchmark util.file_hashes against one util.file_hash pass per algorithm
+
+Not collected by pytest.  Run by hand, optionally pointing at a real
+master file; otherwise a random test file of --size-mb is created.
+
+    $ python tests/benchmarks/bench_file_hashes.py --size-mb 4096
+    $ python tests/benchmarks/bench_file_hashes.py /var/www/media/ddr/.../master.tif
+"""
+import argparse
+import hashlib
+import os
+import tempfile
+import time
+
+from DDR import util
+
+ALGOS = ['md5', 'sha1', 'sha256']
+
+
+def old_file_hash(path, algo):
+    """Previous util.file_hash: one pass per algorithm, 1024-byte reads"""
+    h = hashlib.new(algo)
+    with open(path, 'rb') as f:
+        while True:
+            data = f.read(1024)
+            if not data:
+                break
+            h.update(data)
+    return h.hexdigest()
+
+def make_file(path, size_mb):
+    chunk = os.urandom(1024 * 1024)
+    with open(path, 'wb') as f:
+        for n in range(size_mb):
+            f.write(chunk)
+
+def timed(label, size, fn):
+    start = time.perf_counter()
+    out = fn()
+    elapsed = time.perf_counter() - start
+    mbs = (size / 1024 / 1024) / elapsed
+    print(f'{label:40} {elapsed:8.2f}s {mbs:10.1f} MB/s')
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('path', nargs='?', help='Existing file to hash.')
+    parser.add_argument('--size-mb', type=int, default=1024,
+                        help='Size of generated test file (default 1024).')
+    args = parser.parse_args()
+    tmp = None
+    path = args.path
+    if not path:
+        tmp = tempfile.NamedTemporaryFile(delete=False)
+        tmp.close()
+        path = tmp.name
+        print(f'writing {args.size_mb} MB to {path}')
+        make_file(path, args.size_mb)
+    size = os.path.getsize(path)
+    try:
+        old = timed(
+            'file_hash x3 (1KB blocks)', size,
+            lambda: {algo: old_file_hash(path, algo) for algo in ALGOS}
+        )
+        for block_size in [64 * 1024, util.HASH_BLOCK_SIZE, 8 * 1024 * 1024]:
+            new = timed(
+                f'file_hashes ({block_size // 1024}KB blocks)', size,
+                lambda: util.file_hashes(path, ALGOS, block_size=block_size)
+            )
+            assert new == old
+    finally:
+        if tmp:
+            os.remove(path)
+
+if __name__ == '__main__':
+    main()
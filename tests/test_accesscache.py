@@ -0,0 +1,65 @@
+import os
+
+from DDR import accesscache
+from DDR import config
+from DDR import imaging
+
+SHA256 = 'b27c8443d393392a743c57ee348a29139c61f0f5d5363d6cfb474f35fcba2174'
+
+
+def test_key():
+    key = accesscache.AccessCache.key(SHA256, '1024x1024>', '')
+    assert key.startswith(SHA256 + '-')
+    assert key == accesscache.AccessCache.key(SHA256, '1024x1024>', None)
+    # any change to settings changes key
+    assert key != accesscache.AccessCache.key(SHA256, '512x512>', '')
+    assert key != accesscache.AccessCache.key(SHA256, '1024x1024>', '-strip')
+    assert key != accesscache.AccessCache.key(
+        SHA256, '1024x1024>', '', imaging.CONVERT_VERSION + 1
+    )
+
+def test_fetch_store(tmpdir):
+    cache = accesscache.AccessCache(str(tmpdir / 'cache'), max_bytes=250)
+    keys = [
+        accesscache.AccessCache.key(str(n) * 64, '1024x1024>') for n in range(4)
+    ]
+    dest = str(tmpdir / 'dest.jpg')
+    # miss
+    assert cache.fetch(keys[0], dest) == False
+    assert not os.path.exists(dest)
+    # store and hit
+    src = tmpdir / 'src.jpg'
+    src.write_binary(b'0' * 100)
+    cache.store(keys[0], str(src))
+    assert cache.fetch(keys[0], dest) == True
+    assert open(dest, 'rb').read() == b'0' * 100
+    assert cache.stats == {
+        'hits': 1, 'misses': 1, 'stored': 1, 'evicted': 0, 'size': 100
+    }
+    # make keys[0] least recently used, then go over max_bytes
+    os.utime(cache.entry_path(keys[0]), (1, 1))
+    for n,key in enumerate(keys[1:], 2):
+        cache.store(key, str(src))
+        os.utime(cache.entry_path(key), (n, n))
+    assert not os.path.exists(cache.entry_path(keys[0]))
+    assert not os.path.exists(cache.entry_path(keys[1]))
+    assert os.path.exists(cache.entry_path(keys[2]))
+    assert os.path.exists(cache.entry_path(keys[3]))
+    stats = cache.stats
+    assert stats['evicted'] == 2
+    assert stats['size'] == 200
+
+def test_store_overwrite(tmpdir):
+    cache = accesscache.AccessCache(str(tmpdir / 'cache'), max_bytes=250)
+    key = accesscache.AccessCache.key(SHA256, '1024x1024>')
+    src = tmpdir / 'src.jpg'
+    src.write_binary(b'0' * 100)
+    cache.store(key, str(src))
+    # storing the same key again replaces the entry, not adds to it
+    src.write_binary(b'1' * 80)
+    cache.store(key, str(src))
+    cache.store(key, str(src))
+    stats = cache.stats
+    assert stats['size'] == 80
+    assert stats['evicted'] == 0
+    assert os.path.getsize(cache.entry_path(key)) == 80
@@ -2,6 +2,7 @@
 
 import os
 from pathlib import Path
+import time
 import urllib
 
 import git
@@ -67,11 +68,26 @@ def file_identifier(tmpdir_factory):
     return identifier.Identifier(FILE_ID, str(tmp))
 
 
+def _slow_export_rows(model, headers, json_paths):
+    # earlier chunks finish last
+    time.sleep(0.05 * (10 - int(json_paths[0].split('-')[-1]) // 3))
+    return [(path, [model, path]) for path in json_paths]
+
 class TestExporter():
     pass
     # TODO def test_make_tmpdir(self):
     # TODO def test_export(self):
 
+    def test_exported_rows(self):
+        paths = [f'{COLLECTION_ID}-{n}' for n in range(10)]
+        expected = [(path, ['entity', path]) for path in paths]
+        for workers in [1, 3]:
+            out = list(batch.Exporter._exported_rows(
+                'entity', ['id'], paths, workers=workers, chunk_size=3,
+                convert=_slow_export_rows
+            ))
+            assert out == expected
+
     def test_export_field_csv(self):
         pass
 
@@ -110,6 +126,25 @@ class TestChecker():
         assert staged == ['file0']
         assert modified == ['file0']
 
+    def test_allowed_path(self):
+        oids = {'ddr-test-123-1', 'ddr-test-123-2-master-a1b2c3d4e5'}
+        parents = {'ddr-test-123-2'}
+        for path in [
+            'files/ddr-test-123-1/entity.json',
+            'files/ddr-test-123-1/files/ddr-test-123-1-master-abcde12345.json',
+            'files/ddr-test-123-2/files/ddr-test-123-2-master-a1b2c3d4e5.json',
+            'files/ddr-test-123-2/files/ddr-test-123-2-master-a1b2c3d4e5-a.jpg',
+            'files/ddr-test-123-2/entity.json',
+        ]:
+            assert batch.Checker._allowed_path(path, oids, parents)
+        for path in [
+            'collection.json',
+            'files/ddr-test-123-10/entity.json',
+            'files/ddr-test-123-2/changelog',
+            'files/ddr-test-123-2/files/ddr-test-123-2-master-ffffffffff.json',
+        ]:
+            assert not batch.Checker._allowed_path(path, oids, parents)
+
     # TODO def test_check_eids(self):
 
     # TODO def test_get_module(self):
@@ -220,6 +255,34 @@ class TestChecker():
         # not os.R_OK
         # TODO how to make a file unreadable to test this?
 
+    def test_check_duplicate_files(self, tmpdir, monkeypatch):
+        index = batch.models.files.HashIndex(str(tmpdir))
+        index.hashes = {'a1'*20: ['ddr-testing-123-1-master-a1a1a1a1a1']}
+        monkeypatch.setattr(
+            batch.models.files, 'hash_index', lambda path, refresh=True: index
+        )
+        cidentifier = identifier.Identifier('ddr-testing-123', str(tmpdir))
+        rowds = [
+            {'basename_orig': 'a.tif', 'sha1': 'a1'*20},
+            {'basename_orig': 'b.tif', 'sha256': 'b2'*32},
+            {'basename_orig': 'c.tif'},
+            {'basename_orig': 'd.tif', 'sha256': 'b2'*32},
+            {'basename_orig': 'e.tif'},
+        ]
+        out = batch.Checker.check_duplicate_files(rowds, cidentifier)
+        assert out == [
+            'row 0: Duplicate of ddr-testing-123-1-master-a1a1a1a1a1: a.tif',
+            'row 3: Same file as row 1: d.tif',
+            '2 files have no sha1/sha256 in the CSV and were not checked '
+            '(use --plan to hash and check them)',
+        ]
+        out = batch.Checker.check_duplicate_files(
+            rowds[:2], cidentifier, numbers=[10, 11]
+        )
+        assert out == [
+            'row 10: Duplicate of ddr-testing-123-1-master-a1a1a1a1a1: a.tif',
+        ]
+
 
 class TestImporter():
     
@@ -342,22 +405,206 @@ class TestImporter():
         ]
         assert out == expected
     
+    def test_checkpoints(self):
+        rows = list(range(7))
+        out = list(batch.Importer._checkpoints(rows, 3))
+        assert out == [[0, 1, 2], [3, 4, 5], [6]]
+        assert list(batch.Importer._checkpoints([], 3)) == []
+    
     # TODO def test_import_files(self):
     # TODO def test_update_existing_files(self):
     # TODO def test_add_new_files(self):
     # TODO def test_register_entity_ids(self):
 
 
+def test_import_journal(tmpdir):
+    csv_path = str(tmpdir / 'import.csv')
+    rowds = [
+        {'id': f'ddr-testing-123-{n}', 'title': f'title {n}'} for n in range(6)
+    ]
+    journal = batch.ImportJournal(csv_path)
+    assert journal.pending(rowds) == rowds
+    # first checkpoint completes, second is interrupted
+    checkpoints = list(batch.Importer._checkpoints(journal.rows, 2))
+    journal.begin(checkpoints[0])
+    journal.complete(checkpoints[0])
+    journal.begin(checkpoints[1])
+    with open(journal.path, 'a') as f:
+        f.write('{"row": 2, "id": "ddr-test')  # cut off mid-write
+    # resume: completed rows skipped, interrupted rows redone
+    rowds[4]['title'] = 'changed'
+    journal = batch.ImportJournal(csv_path).load()
+    assert journal.pending(rowds) == rowds[2:]
+    assert [(n, redo) for n,rowd,rowhash,redo in journal.rows] == [
+        (2, True), (3, True), (4, False), (5, False),
+    ]
+    # rows changed since they were imported are done again
+    rowds[0]['title'] = 'changed'
+    assert journal.pending(rowds)[0] == rowds[0]
+    # hash only covers CSV data
+    rowd = dict(rowds[1], identifier=object(), path_abs=Path('/tmp'))
+    assert batch.ImportJournal.row_hash(rowd) == batch.ImportJournal.row_hash(rowds[1])
+    # row numbers are offset when importing a range of rows
+    journal = batch.ImportJournal(csv_path).load()
+    journal.pending(rowds[3:], row_start=3)
+    assert [n for n,rowd,rowhash,redo in journal.rows] == [3, 4, 5]
+    # entries after a cut-off line are still read
+    journal.complete(journal.rows[:1])
+    assert batch.ImportJournal(csv_path).load().done[3] == journal.rows[0][2]
+    # journaled rows are allowed to be staged/modified when resuming
+    journal = batch.ImportJournal(csv_path).load()
+    assert journal.ids(rowds) == {f'ddr-testing-123-{n}' for n in range(4)}
+    assert journal.ids(rowds[3:], row_start=3) == {'ddr-testing-123-3'}
+    # journal of other rows is not discarded by a new import...
+    assert journal.other_rows(range(3)) == [3]
+    with pytest.raises(Exception):
+        batch.Importer._journal(csv_path, False, False, range(3))
+    assert os.path.exists(journal.path)
+    batch.Importer._journal(csv_path, False, True, range(3))  # dryrun
+    assert os.path.exists(journal.path)
+    # ...unless it covers the same rows or is explicitly reset
+    batch.Importer._journal(csv_path, False, False, range(6))
+    assert not os.path.exists(journal.path)
+    journal.complete(journal.rows[:1])
+    batch.Importer._journal(csv_path, False, False, range(3), reset_journal=True)
+    assert not os.path.exists(journal.path)
+
+
+def test_import_plan(tmpdir):
+    csv_path = str(tmpdir / 'files.csv')
+    json_path = str(tmpdir / 'entity.json')
+    new_json_path = str(tmpdir / 'new.json')
+    binary_path = str(tmpdir / 'master.jpg')
+    with open(json_path, 'w') as f:
+        f.write('{}')
+    with open(binary_path, 'wb') as f:
+        f.write(b'0' * 100)
+    plan = batch.ImportPlan(
+        csv_path + batch.PLAN_SUFFIX, 'entity', csv_path, COLLECTION_ID
+    )
+    plan.add(
+        3, {'id': ENTITY_ID, 'title': 'New'}, ENTITY_ID, 'update', json_path,
+        {'title': ['Old', 'New']}
+    )
+    plan.add(5, {'id': 'ddr-testing-123-5'}, 'ddr-testing-123-5', 'create', new_json_path)
+    plan.add(
+        6, {'id': ENTITY_ID, 'basename_orig': 'master.jpg'}, ENTITY_ID, 'add',
+        binary=batch.ImportPlan.binary_info(binary_path)
+    )
+    plan.save()
+    plan2 = batch.ImportPlan.load(plan.path)
+    assert plan2.collection_id == COLLECTION_ID
+    assert plan2.rows[0]['changes'] == {'title': ['Old', 'New']}
+    assert plan2.rows[2]['binary']['size'] == 100
+    assert plan2.summary() == {'update': 1, 'create': 1, 'add': 1}
+    assert plan2.numbers() == [3, 5, 6]
+    assert plan2.rowds()[0] == {'id': ENTITY_ID, 'title': 'New'}
+    assert plan2.stale() == []
+    # objects and binaries changed since plan
+    with open(json_path, 'w') as f:
+        f.write('{"title": "Newer"}')
+    with open(new_json_path, 'w') as f:
+        f.write('{}')
+    with open(binary_path, 'ab') as f:
+        f.write(b'0')
+    assert len(plan2.stale()) == 3
+    # planned rows are journaled with their CSV row numbers
+    journal = batch.ImportJournal(csv_path)
+    journal.pending(plan2.rowds(), numbers=plan2.numbers())
+    assert [n for n,rowd,rowhash,redo in journal.rows] == [3, 5, 6]
+    # not a plan
+    with open(csv_path, 'w') as f:
+        f.write('id,title\n')
+    with pytest.raises(Exception):
+        batch.ImportPlan.load(csv_path)
+
 class TestUpdaterMetrics():
     pass
     # TODO def test_headers(self):
     # TODO def test_row(self):
 
 
+def make_bare_repo(remote_dir, cid):
+    """Bare repo standing in for a collection on the Gitolite server"""
+    work_path = os.path.join(remote_dir, 'work', cid)
+    repo = git.Repo.init(work_path)
+    repo.git.config('user.name', 'gjost')
+    repo.git.config('user.email', 'gjost@densho.org')
+    with open(os.path.join(work_path, 'collection.json'), 'w') as f:
+        f.write('{}')
+    repo.git.add(['collection.json'])
+    repo.git.commit('-m', 'initial')
+    repo.git.clone('--bare', work_path, os.path.join(remote_dir, f'{cid}.git'))
+
+def _fake_update_collection(cidentifier, user, mail, commit=False):
+    collection_path = cidentifier.path_abs()
+    if cidentifier.id.endswith('-2'):
+        raise Exception('bad metadata')
+    if cidentifier.id.endswith('-5'):
+        # nothing to update
+        metrics = batch.UpdaterMetrics()
+        metrics.cid = cidentifier.id
+        metrics.verdict = 'FAIL'
+        metrics.load_errs = {}; metrics.save_errs = {}; metrics.bad_exits = {}
+        return metrics
+    with open(os.path.join(collection_path, 'collection.json'), 'w') as f:
+        f.write('{"updated": true}')
+    metrics = batch.UpdaterMetrics()
+    metrics.cid = cidentifier.id
+    metrics.verdict = 'ok'
+    metrics.objects = metrics.objects_saved = metrics.files_updated = 1
+    metrics.updated = {cidentifier.id: ['collection.json']}
+    metrics.load_errs = {}; metrics.save_errs = {}; metrics.bad_exits = {}
+    return metrics
+
 class TestUpdater():
     pass
     # TODO def test_update_collection(self):
-    # TODO def test_update_multi(self):
+
+    def test_update_multi(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(
+            batch.Updater, 'update_collection', _fake_update_collection
+        )
+        basedir = str(tmpdir / 'basedir')
+        remote = str(tmpdir / 'remote')
+        os.makedirs(basedir)
+        cids = [
+            'ddr-testing-1', 'ddr-testing-2', 'ddr-testing-3', 'ddr-testing-4',
+            'ddr-testing-5',
+        ]
+        # no bare repo for ddr-testing-3
+        for cid in ['ddr-testing-1', 'ddr-testing-2', 'ddr-testing-4', 'ddr-testing-5']:
+            make_bare_repo(remote, cid)
+        source = str(tmpdir / 'cids')
+        with open(source, 'w') as f:
+            f.write('\n'.join(cids))
+        summary = batch.Updater.update_multi(
+            basedir, source, 'gjost', 'gjost@densho.org',
+            commit=True, keep=True, workers=2, remote=remote,
+        )
+        assert summary['collections'] == 5
+        assert summary['successful'] == 2
+        assert summary['failed'] == {
+            'ddr-testing-2': 'update failed',
+            'ddr-testing-3': 'clone failed',
+            'ddr-testing-5': 'FAIL',
+        }
+        # successful collections committed in their own clones
+        for cid in ['ddr-testing-1', 'ddr-testing-4']:
+            repo = git.Repo(os.path.join(basedir, cid))
+            assert repo.head.commit.message.startswith('Batch updated')
+            assert not repo.remotes
+        headers,rows = batch.Updater._read_done(basedir)
+        assert sorted(row[0] for row in rows) == cids
+        committed = {row[0]: str(row[headers.index('committed')]) for row in rows}
+        assert committed['ddr-testing-2'] == 'False'
+        # unchanged collection is not an error
+        assert committed['ddr-testing-5'] == 'nochanges'
+        # locks released, nothing left to do
+        assert not [name for name in os.listdir(basedir) if name.endswith('.lock')]
+        assert batch.Updater._read_todo(os.path.join(basedir, batch.Updater.TODO)) == []
+        assert batch.Updater._read_this(basedir) == ''
+
     # TODO def test_consolidate_paths(self):
     # TODO def test_update_collection_objects(self):
     # TODO def test_prep_todo(self):
@@ -369,5 +616,46 @@ class TestUpdater():
     # TODO def test_csv_writer(self):
     # TODO def test_read_csv(self):
     # TODO def test_write_csv(self):
-    # TODO def test_read_done(self):
-    # TODO def test_write_done(self):
+
+    def test_write_done(self, tmpdir):
+        basedir = str(tmpdir)
+        done_path = os.path.join(basedir, batch.Updater.DONE)
+        journal_path = os.path.join(basedir, batch.Updater.DONE_JOURNAL)
+        for cid in ['ddr-testing-1', 'ddr-testing-2']:
+            metrics = batch.UpdaterMetrics()
+            metrics.cid = cid
+            metrics.verdict = 'ok'
+            batch.Updater._write_done(basedir, metrics)
+        # appended to journal, not DONE
+        assert not os.path.exists(done_path)
+        assert batch.Updater._done_ids(basedir) == {'ddr-testing-1', 'ddr-testing-2'}
+        # a record cut off by a crash is ignored
+        with open(journal_path, 'a') as f:
+            f.write('["ddr-testing-3", "o')
+        metrics.cid = 'ddr-testing-4'
+        batch.Updater._write_done(basedir, metrics)
+        assert batch.Updater._done_ids(basedir) == {
+            'ddr-testing-1', 'ddr-testing-2', 'ddr-testing-4'
+        }
+        journaled = batch.Updater._read_done(basedir)
+        # compacted to CSV
+        batch.Updater._compact_done(basedir)
+        assert not os.path.exists(journal_path)
+        assert batch.Updater._read_done(basedir) == journaled
+        headers,rows = journaled
+        assert headers == batch.UpdaterMetrics().headers()
+        assert [row[:2] for row in rows] == [
+            ['ddr-testing-1', 'ok'], ['ddr-testing-2', 'ok'], ['ddr-testing-4', 'ok'],
+        ]
+        # journal left by crash during compaction does not repeat rows
+        metrics.cid = 'ddr-testing-5'
+        batch.Updater._write_done(basedir, metrics)
+        with open(journal_path, 'r') as f:
+            journal = f.read()
+        batch.Updater._compact_done(basedir)
+        with open(journal_path, 'w') as f:
+            f.write(journal)
+        batch.Updater._compact_done(basedir)
+        assert [row[0] for row in batch.Updater._read_done(basedir)[1]] == [
+            'ddr-testing-1', 'ddr-testing-2', 'ddr-testing-4', 'ddr-testing-5',
+        ]
@@ -211,6 +211,53 @@ def test_03_update(tmpdir, test_paths):
     assert exit == 0
     assert status == 'ok'
 
+def test_031_transaction(tmpdir, test_paths):
+    """Updates inside a transaction write one changelog entry and stage once
+    """
+    collection = identifier.Identifier(test_paths['TEST_COLLECTION']).object()
+    with open(collection.changelog_path, 'r') as f:
+        entries_before = f.read().count('* Updated collection file(s)')
+    with commands.transaction(collection, GIT_USER, GIT_MAIL, AGENT) as tx:
+        assert commands.active_transaction(collection.path_abs) == tx
+        for n in range(3):
+            collection.notes = 'testing transaction {}'.format(n)
+            collection.write_json()
+            exit,status = commands.update(
+                GIT_USER, GIT_MAIL,
+                collection,
+                [collection.identifier.path_abs('json')],
+                agent='pytest', commit=False
+            )
+            assert exit == 0
+            assert status == 'ok'
+        assert tx.git_files == ['collection.json']
+    assert commands.active_transaction(collection.path_abs) == None
+    with open(collection.changelog_path, 'r') as f:
+        text = f.read()
+    assert text.count('* Updated collection file(s)') == entries_before + 1
+    staged = dvcs.list_staged(dvcs.repository(collection.path_abs))
+    assert 'collection.json' in staged
+    assert 'changelog' in staged
+
+def test_032_transaction_failed(tmpdir, test_paths):
+    """Transactions that raise write no changelog entries
+    """
+    collection = identifier.Identifier(test_paths['TEST_COLLECTION']).object()
+    with open(collection.changelog_path, 'r') as f:
+        before = f.read()
+    with pytest.raises(Exception):
+        with commands.transaction(collection, GIT_USER, GIT_MAIL, AGENT) as tx:
+            exit,status = commands.update(
+                GIT_USER, GIT_MAIL,
+                collection,
+                [collection.identifier.path_abs('json')],
+                agent='pytest', commit=False
+            )
+            raise Exception('batch failed')
+    assert commands.active_transaction(collection.path_abs) == None
+    with open(collection.changelog_path, 'r') as f:
+        assert f.read() == before
+
 #TODO REQUIRES NETWORK ACCESS AND GITOLITE CREDENTIALS
 #def test_04_sync(tmpdir, test_paths):
 #    """git pull/push to workbench server, git-annex sync
@@ -68,6 +68,14 @@ def test_make_rowds():
     out1 = csvfile.make_rowds(rows1)
     print(out1)
     assert out1 == expected
+    # iterator, e.g. fileio.iter_csv
+    rows2 = [
+        ['id', 'created', 'lastmod', 'title', 'description'],
+        ['id0', 'then', 'now', 'title0', 'descr0'],
+        ['id1', 'later', 'later', 'title1', 'descr1'],
+    ]
+    out2 = csvfile.make_rowds(iter(rows2), row_start=1)
+    assert out2 == (expected[0], expected[1][1:], [])
 
 def test_validate_headers():
     headers0 = ['id', 'title']
@@ -236,6 +244,21 @@ def test_find_multiple_cids():
     ]
     out1 = csvfile.find_multiple_cids(rowds1)
     assert out1 == expected1
+    # collection and file rows, bad IDs, and IDs sharing a prefix
+    rowds2 = [
+        {'id':'ddr-test-123',},
+        {'id':'ddr-test-123-456-master-a1b2c3d4e5',},
+        {'id':'ddr-test-123-456',},
+        {'id':'not an id',},
+        {'id':'ddr-test-1234-1',},
+        {'id':'ddr-test-123-457',},
+    ]
+    expected2 = [
+        'ddr-test-123',
+        'ddr-test-1234',
+    ]
+    out2 = csvfile.find_multiple_cids(rowds2)
+    assert out2 == expected2
 
 def test_find_missing_required():
     # OK
@@ -283,3 +306,30 @@ def test_find_invalid_values():
     ]
     out1 = csvfile.find_invalid_values(module, headers, valid_values, rowds1)
     assert out1 == expected1
+
+def test_find_invalid_values_parallel(monkeypatch):
+    """Process pool results match serial results, in row order"""
+    monkeypatch.setattr(csvfile, 'VALIDATE_CHUNK_MIN', 10)
+    module = modules.Module(TestSchema())
+    headers = ['id', 'status']
+    valid_values = {
+        'status': ['inprocess', 'complete',]
+    }
+    rowds = []
+    for n in range(95):
+        rowd = {'id': f'ddr-test-{n + 1}', 'status': 'complete'}
+        if n % 7 == 0:
+            rowd['status'] = 'inprogress'
+        if n % 11 == 0:
+            rowd['id'] = f'bad id {n}'
+        if n % 13 == 0:
+            rowd.pop('status')
+        rowds.append(rowd)
+    serial = csvfile.find_invalid_values(module, headers, valid_values, rowds)
+    assert 'row 7: status' in serial
+    assert 'row 11: id' in serial
+    assert "row 13: status: 'status'" in serial
+    parallel = csvfile.find_invalid_values(
+        module, headers, valid_values, rowds, workers=3
+    )
+    assert parallel == serial
@@ -485,6 +485,58 @@ def test_update_files(tmpdir, collection, test_csv_dir, test_files_dir):
     assert not find_binaries_in_git_objects(repo)
     assert not find_missing_annex_binaries(repo)
 
+def test_plan_apply_files(tmpdir, collection, test_csv_dir, test_files_dir):
+    """plan_files, save, load, and apply_plan with updated and new files
+    """
+    file_csv_path = os.path.join(test_csv_dir, 'ddrimport-file-plan.csv')
+    binary_path = os.path.join(test_files_dir, 'ddrimport-plan.txt')
+    with open(binary_path, 'w') as f:
+        f.write('test_plan_apply_files\n')
+    headers,rowds,csv_errs = csvfile.make_rowds(fileio.read_csv(
+        os.path.join(test_csv_dir, 'ddrimport-file-update.csv')
+    ))
+    for rowd in rowds:
+        rowd['label'] = '%s (planned)' % rowd['label']
+    new_rowd = {key: '' for key in headers}
+    new_rowd.update({
+        'id': 'ddr-testing-123-1', 'external': '0', 'role': 'mezzanine',
+        'basename_orig': binary_path, 'mimetype': 'text/plain',
+        'public': '1', 'rights': 'cc', 'sort': '9', 'label': 'Planned',
+    })
+    rowds.append(new_rowd)
+    headers,rows = csvfile.make_rows(rowds)
+    fileio.write_csv(file_csv_path, headers, rows)
+    headers,rowds,csv_errs = csvfile.make_rowds(fileio.read_csv(file_csv_path))
+    # ddrimport run_checks adds Identifiers to rowds
+    assert not batch.Checker.validate_csv_identifiers(rowds)
+
+    plan = batch.Importer.plan_files(file_csv_path, rowds, collection.identifier)
+    plan.save()
+    plan = batch.ImportPlan.load(plan.path)
+    assert plan.summary() == {'update': len(rowds) - 1, 'add': 1}
+    for rowd in plan.rowds():
+        assert 'identifier' not in rowd
+        assert 'path_abs' not in rowd
+    # plan rows match the CSV rows they came from
+    journal = batch.ImportJournal(file_csv_path)
+    journal.pending(rowds)
+    csv_hashes = [rowhash for n,rowd,rowhash,redo in journal.rows]
+    journal.pending(plan.rowds(), numbers=plan.numbers())
+    assert [rowhash for n,rowd,rowhash,redo in journal.rows] == csv_hashes
+
+    batch.Importer.apply_plan(
+        plan, collection.identifier, VOCABS_URL, GIT_USER, GIT_MAIL, AGENT,
+        tmp_dir=test_files_dir,
+    )
+    for path in util.find_meta_files(
+            collection.path_abs, recursive=True, model='file', force_read=True):
+        f = identifier.Identifier(path).object()
+        if f.label == 'Planned':
+            assert f.sha1 == util.file_hashes(binary_path)['sha1']
+    repo = dvcs.repository(collection.path_abs)
+    commit = repo.index.commit('test_plan_apply_files')
+    check_file_hashes(collection.path_abs)
+
 # helpers
 
 def rewrite_file_paths(path, test_files_dir):
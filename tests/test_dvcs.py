@@ -259,6 +259,42 @@ def test_annex_status(tmpdir):
                     found = True
     assert found
 
+def test_parse_annex_add_json():
+    line = '{"command":"add","success":true,"file":"files/a.jpg",' \
+        '"key":"SHA256E-s5--abc.jpg","note":"(recording state in git...)"}\n'
+    out = dvcs._parse_annex_add_json('files/a.jpg', line)
+    assert out['success'] == True
+    assert out['key'] == 'SHA256E-s5--abc.jpg'
+    # blank line: file not added (e.g. ignored or unchanged)
+    assert dvcs._parse_annex_add_json('files/b.jpg', '\n') == {
+        'file': 'files/b.jpg', 'success': True, 'skipped': True,
+    }
+    line = '{"command":"add","success":false,"file":"c.jpg",' \
+        '"error-messages":["c.jpg not found"]}\n'
+    out = dvcs._parse_annex_add_json('c.jpg', line)
+    assert out['success'] == False
+
+def test_annex_stage(tmpdir):
+    path = str(tmpdir / 'test-repo')
+    repo = make_repo(path, ['testing'])
+    annex_init(repo)
+    annex_files = ['test1.jpg', 'test 2.jpg']
+    for fn in annex_files:
+        with open(os.path.join(path, fn), 'w') as f:
+            f.write(fn)
+    results = dvcs.annex_stage(repo, annex_files)
+    staged = dvcs.list_staged(repo)
+    assert [r['file'] for r in results] == annex_files
+    assert all([r['success'] for r in results])
+    for fn in annex_files:
+        assert fn in staged
+        assert os.path.islink(os.path.join(path, fn))
+    # missing files are errors, not skipped
+    assert_raises(
+        dvcs.GitCommandError, dvcs.annex_stage, repo, ['missing.jpg']
+    )
+    cleanup_repo(path)
+
 # TODO annex_whereis_file
 
 GITOLITE_INFO_OK = """hello ddr, this is git@mits running gitolite3 v3.2-19-gb9bbb78 on git 1.7.2.5
@@ -366,6 +402,61 @@ def test_parse_list_conflicted():
 
 # TODO list_conflicted
 
+SAMPLE_STATUS_V2 = '\0'.join([
+    '# branch.oid 0e87c2ac623a8872e0751ac61de5ce85f68a35bf',
+    '# branch.head master',
+    '# branch.upstream origin/master',
+    '# branch.ab +2 -1',
+    '1 M. N... 100644 100644 100644 78981922 d1f8a8d4 collection.json',
+    '1 .M N... 100644 100644 100644 d1f8a8d4 d1f8a8d4 changelog',
+    '1 MM N... 100644 100644 100644 78981922 d1f8a8d4 files/ddr-test-123-1/entity.json',
+    '2 R. N... 100644 100644 100644 d1f8a8d4 d1f8a8d4 R100 new name.jpg',
+    'old name.jpg',
+    'u UU N... 100644 100644 100644 100644 a1 b2 c3 files/ddr-test-123-2/entity.json',
+    '? untracked file.txt',
+    '? tmp/',
+    '',
+])
+
+def test_parse_status_v2():
+    st = dvcs._parse_status_v2(SAMPLE_STATUS_V2)
+    assert st.branch == 'master'
+    assert st.oid == '0e87c2ac623a8872e0751ac61de5ce85f68a35bf'
+    assert st.upstream == 'origin/master'
+    assert (st.ahead, st.behind) == (2, 1)
+    assert st.staged == [
+        'collection.json', 'files/ddr-test-123-1/entity.json', 'new name.jpg',
+    ]
+    assert st.modified == [
+        'changelog', 'files/ddr-test-123-1/entity.json',
+        'files/ddr-test-123-2/entity.json',
+    ]
+    assert st.untracked == ['untracked file.txt', 'tmp/']
+    assert st.conflicted == ['files/ddr-test-123-2/entity.json']
+    # new repo, no upstream
+    st = dvcs._parse_status_v2(
+        '# branch.oid (initial)\0# branch.head master\0'
+    )
+    assert (st.oid, st.branch, st.upstream, st.ahead) == (None, 'master', None, None)
+
+def test_status(tmpdir):
+    path = str(tmpdir / 'test-repo')
+    repo = make_repo(path, ['staged', 'modified'])
+    for fn in ['staged', 'modified', 'untracked']:
+        with open(os.path.join(path, fn), 'w') as f:
+            f.write(fn)
+    repo.git.add('staged')
+    st = dvcs.status(repo)
+    assert st.staged == dvcs.list_staged(repo) == ['staged']
+    assert st.modified == dvcs.list_modified(repo) == ['modified']
+    assert st.untracked == dvcs.list_untracked(repo) == ['untracked']
+    assert dvcs.status(repo, untracked=False).untracked == []
+    assert dvcs.git_status(repo) == {
+        'staged': ['staged'], 'modified': ['modified'],
+        'untracked': ['untracked'], 'conflicted': [],
+    }
+    cleanup_repo(path)
+
 CONFLICTED_JSON_TEXT = """{
     {
         "record_created": "2013-09-30T12:43:11"
@@ -589,6 +680,15 @@ def test_remotes(tmpdir):
 
 # TODO repos_remotes
 
+def test_annex_key_parts():
+    out = dvcs._annex_key_parts('SHA256E-s12345--abcdef0123.jpg')
+    assert out == {
+        'key': 'SHA256E-s12345--abcdef0123.jpg',
+        'backend': 'SHA256E',
+        'bytesize': '12345',
+        'keyname': 'abcdef0123.jpg',
+    }
+
 # TODO Fix this test - gives wildly inconsistent results
 #def test_annex_file_targets(tmpdir):
 #    path = str(tmpdir / 'test-repo')
@@ -0,0 +1,156 @@
+from datetime import datetime
+import json
+import os
+import types
+
+import pytest
+
+from DDR import fieldexport
+from DDR import identifier
+from DDR import models
+from DDR import modules
+
+COLLECTION_ID = 'ddr-testing-123'
+
+CREATORS = [
+    {'namepart': 'Jane Doe', 'role': 'author'},
+    {'namepart': 'John Doe', 'role': 'photographer'},
+]
+
+
+def make_entity(basedir, eid, **fields):
+    entity_path = os.path.join(basedir, COLLECTION_ID, 'files', eid)
+    os.makedirs(entity_path)
+    json_path = os.path.join(entity_path, 'entity.json')
+    document = [{'application': 'https://github.com/denshoproject/ddr-cmdln.git'}]
+    document += [{'id': eid}]
+    document += [{key: value} for key,value in fields.items()]
+    with open(json_path, 'w') as f:
+        f.write(json.dumps(document, indent=1))
+    return json_path
+
+def test_load_fields(tmpdir):
+    path = make_entity(
+        str(tmpdir), f'{COLLECTION_ID}-1',
+        title='Title', creators=CREATORS, topics=[]
+    )
+    assert fieldexport.load_fields(path, ['creators']) == {'creators': CREATORS}
+    assert fieldexport.load_fields(path, ['title', 'topics', 'missing']) == {
+        'title': 'Title', 'topics': []
+    }
+    # document is not parsed past the last wanted field
+    with open(path, 'r') as f:
+        text = f.read()
+    with open(path, 'w') as f:
+        f.write(text.replace('"topics": []', '"topics": [BROKEN'))
+    assert fieldexport.load_fields(path, ['title']) == {'title': 'Title'}
+    with pytest.raises(json.JSONDecodeError):
+        fieldexport.load_fields(path, ['topics'])
+
+def test_field_values(tmpdir):
+    paths = [
+        make_entity(str(tmpdir), f'{COLLECTION_ID}-1', title='One', persons=['A']),
+        make_entity(str(tmpdir), f'{COLLECTION_ID}-2', title='Two'),
+    ]
+    out = list(fieldexport.field_values(paths, ['title', 'persons']))
+    assert out == [
+        (f'{COLLECTION_ID}-1', 'title', 'One'),
+        (f'{COLLECTION_ID}-1', 'persons', ['A']),
+        (f'{COLLECTION_ID}-2', 'title', 'Two'),
+        (f'{COLLECTION_ID}-2', 'persons', None),
+    ]
+
+def _fake_module():
+    module = types.ModuleType('entity')
+    module.__file__ = 'entity.py'
+    module.MODEL = 'entity'
+    module.FIELDS = [
+        {'name': 'title', 'model_type': str},
+        {'name': 'status', 'model_type': str, 'default': 'inprocess'},
+        {'name': 'record_created', 'model_type': datetime},
+        {'name': 'persons', 'model_type': list, 'default': []},
+    ]
+    module.jsonload_record_created = lambda text: datetime.strptime(
+        text, '%Y-%m-%dT%H:%M:%S'
+    )
+    module.csvdump_record_created = lambda dt: dt.strftime('%Y-%m-%dT%H:%M:%S%z') if dt else ''
+    module.csvdump_persons = lambda data: '; '.join(data or [])
+    return module
+
+class FakeEntity():
+    def __init__(self, json_path):
+        self.identifier = identifier.Identifier(json_path)
+
+def test_field_values_prep_csv(tmpdir):
+    """Converted values match models.common.prep_csv of the loaded object
+    """
+    paths = [
+        make_entity(
+            str(tmpdir), f'{COLLECTION_ID}-1', title='  Title  ',
+            record_created='2020-01-02T03:04:05', persons=['A', 'B']
+        ),
+        make_entity(str(tmpdir), f'{COLLECTION_ID}-2', persons=None),
+    ]
+    module = _fake_module()
+    fieldnames = [field['name'] for field in module.FIELDS]
+    out = list(fieldexport.field_values(paths, fieldnames, modules.Module(module)))
+    for path in paths:
+        obj = FakeEntity(path)
+        with open(path, 'r') as f:
+            models.common.load_json(obj, module, f.read())
+        expected = models.common.prep_csv(obj, modules.Module(module), fieldnames)
+        assert [
+            value for oid,fieldname,value in out if oid == obj.identifier.id
+        ] == expected
+    assert out[0][2] == 'Title'
+    assert out[1][2] == 'inprocess'
+
+def test_stdout_line_endings(capsys):
+    with fieldexport.open_writer('csv', None, ['id', 'value']) as writer:
+        writer.write(['ddr-testing-123-1', 'Jane Doe'])
+    assert capsys.readouterr().out == '"id","value"\n"ddr-testing-123-1","Jane Doe"\n'
+
+ROWS = [
+    ['ddr-testing-123-1', 'creators', 'Jane Doe'],
+    ['ddr-testing-123-2', 'creators', 'John "Jack" Doe'],
+]
+
+def test_writers(tmpdir):
+    headers = ['id', 'fieldname', 'value']
+    csv_path = str(tmpdir / 'out.csv')
+    with fieldexport.open_writer('csv', csv_path, headers) as writer:
+        for row in ROWS:
+            writer.write(row)
+    with open(csv_path, 'r', newline='') as f:
+        assert f.read() == (
+            '"id","fieldname","value"\r\n'
+            '"ddr-testing-123-1","creators","Jane Doe"\r\n'
+            '"ddr-testing-123-2","creators","John ""Jack"" Doe"\r\n'
+        )
+    jsonl_path = str(tmpdir / 'out.jsonl')
+    with fieldexport.open_writer('jsonl', jsonl_path, headers) as writer:
+        for row in ROWS:
+            writer.write(row)
+    with open(jsonl_path, 'r') as f:
+        lines = [json.loads(line) for line in f]
+    assert lines == [dict(zip(headers, row)) for row in ROWS]
+    assert isinstance(writer, fieldexport.Writer)
+    assert not isinstance(writer, fieldexport.CSVWriter)
+    with pytest.raises(Exception):
+        fieldexport.open_writer('xlsx', str(tmpdir / 'out.xlsx'), headers)
+    with pytest.raises(Exception):
+        fieldexport.open_writer('parquet', None, headers)
+
+def test_parquet_writer(tmpdir):
+    pq = pytest.importorskip('pyarrow.parquet')
+    headers = ['id', 'fieldname', 'value']
+    path = str(tmpdir / 'out.parquet')
+    writer = fieldexport.ParquetWriter(path, headers, batch_rows=1)
+    for row in ROWS + [['ddr-testing-123-3', 'persons', ['A', 'B']]]:
+        writer.write(row)
+    writer.close()
+    table = pq.read_table(path)
+    assert table.column_names == headers
+    assert table.column('value').to_pylist() == [
+        'Jane Doe', 'John "Jack" Doe', '["A", "B"]'
+    ]
@@ -96,6 +96,70 @@ def test_read_csv(tmpdir):
     if os.path.exists(CSV_PATH):
         os.remove(CSV_PATH)
 
+MULTILINE_HEADERS = ['id', 'title', 'description']
+MULTILINE_ROWS = [
+    ['ddr-test-123', 'thing 1', 'line 1\nline 2'],
+    ['ddr-test-124', 'thing "2"', 'trailing newline\n'],
+    ['ddr-test-125', 'thing 3', '"quoted"\n\n"lines"'],
+    ['ddr-test-126', 'thing 4', ''],
+    ['ddr-test-127', 'thing 5', 'last'],
+]
+
+def test_iter_csv(tmpdir):
+    csv_path = str(tmpdir / 'multiline.csv')
+    fileio.write_csv(csv_path, MULTILINE_HEADERS, MULTILINE_ROWS)
+    rows = fileio.read_csv(csv_path)
+    assert rows == [MULTILINE_HEADERS] + MULTILINE_ROWS
+    # multiline quoted fields are not split into records
+    assert len(list(fileio.csv_record_offsets(csv_path))) == len(rows)
+    assert list(fileio.iter_csv(csv_path)) == rows
+    for index in [False, True]:
+        for start,end in [(0,2), (1,4), (2,None), (4,5), (5,None), (9,None)]:
+            out = list(fileio.iter_csv(csv_path, start, end, index=index))
+            assert out == [rows[0]] + rows[1:][start:end]
+    # sidecar index is rewritten when CSV changes
+    index_path = csv_path + fileio.CSV_INDEX_SUFFIX
+    assert os.path.exists(index_path)
+    fileio.write_csv(csv_path, MULTILINE_HEADERS, MULTILINE_ROWS[2:])
+    os.utime(csv_path, ns=(0, 0))
+    out = list(fileio.iter_csv(csv_path, 1, index=True))
+    assert out == [MULTILINE_HEADERS] + MULTILINE_ROWS[3:]
+
+def test_csv_record_offsets_dialect(tmpdir):
+    # quote chars in unquoted fields, bare \r line endings, non-ASCII text
+    csv_path = str(tmpdir / 'dialect.csv')
+    data = (
+        'id,title\r'
+        'ddr-test-123,6" reel\r'
+        'ddr-test-124,"multi\rline"\r\n'
+        'ddr-test-125,caf\u00e9 "x" y\n'
+        'ddr-test-126,last'
+    )
+    with open(csv_path, 'w', newline='', encoding='utf-8') as f:
+        f.write(data)
+    with open(csv_path, 'r', newline='', encoding='utf-8') as f:
+        rows = list(fileio.csv_reader(f))
+    assert len(rows) == 5
+    offsets = list(fileio.csv_record_offsets(csv_path))
+    raw = data.encode('utf-8')
+    assert [raw[offset:].split(b',')[0].decode() for offset in offsets] == [
+        row[0] for row in rows
+    ]
+    for index in [False, True]:
+        for start in range(len(rows)):
+            out = list(fileio.iter_csv(csv_path, start, index=index))
+            assert out == [rows[0]] + rows[1:][start:]
+
+def test_append_jsonl(tmpdir):
+    path = str(tmpdir / 'test.jsonl')
+    assert list(fileio.read_jsonl(path)) == []
+    fileio.append_jsonl(path, [{'a': 1}, ['b', 2]])
+    # line cut off by a crash
+    with open(path, 'a') as f:
+        f.write('{"c": ')
+    fileio.append_jsonl(path, [{'d': 4}])
+    assert list(fileio.read_jsonl(path)) == [{'a': 1}, ['b', 2], {'d': 4}]
+
 def test_write_csv_str(capsys):
     for row in CSV_ROWS:
         print(fileio.write_csv_str(row))
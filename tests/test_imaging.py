@@ -138,6 +138,33 @@ def test_geometry_is_ok():
     for s in GEOMETRY['bad']:
         assert imaging.geometry_is_ok(s) == False
 
+def test_convert_cmd(tmpdir):
+    src = tmpdir / 'src.jpg'
+    src.write_binary(b'x' * 100)
+    dest = str(tmpdir / 'dest.jpg')
+    cmd = imaging._convert_cmd(str(src), dest, '100x100')
+    assert cmd == f"convert  \"{src}\"[0] -resize '100x100' {dest}"
+    cmd = imaging._convert_cmd(str(src), dest, '100x100', '-strip', '512MiB')
+    assert cmd == "convert -limit memory 512MiB -limit map 512MiB -strip " \
+        f"\"{src}\"[0] -resize '100x100' {dest}"
+    # memory limit overrides large file limits
+    src.write_binary(b'x' * imaging.CONVERT_LARGEFILE_THRESHOLD)
+    cmd = imaging._convert_cmd(str(src), dest, '100x100')
+    assert imaging.CONVERT_LARGEFILE_OPTIONS in cmd
+    cmd = imaging._convert_cmd(str(src), dest, '100x100', memory_limit='1GiB')
+    assert imaging.CONVERT_LARGEFILE_OPTIONS not in cmd
+    assert '-limit memory 1GiB -limit map 1GiB' in cmd
+    # sniffed/identified format and frame count are used
+    analysis = {'image': True, 'format': 'JPEG', 'frames': 1}
+    cmd = imaging._convert_cmd(str(src), dest, '100x100', analysis=analysis)
+    assert f"\"JPEG:{src}\" -resize" in cmd
+    analysis = {'image': True, 'format': 'PDF', 'frames': None}
+    cmd = imaging._convert_cmd(str(src), dest, '100x100', analysis=analysis)
+    assert f"\"PDF:{src}\"[0] -resize" in cmd
+    analysis = {'image': False, 'format': None, 'frames': 1}
+    cmd = imaging._convert_cmd(str(src), dest, '100x100', analysis=analysis)
+    assert f" \"{src}\"[0] -resize" in cmd
+
 @pytest.mark.skipif(no_files(), reason=NO_FILES_ERR)
 def test_thumbnail(test_files):
     src = str(test_files['jpg']['path'])
@@ -167,3 +194,142 @@ def test_extract_xmp(test_files):
     ).strip()
     out0 = out0.replace(u'\ufeff', '')
     assert out0 == expected0
+
+def old_normalize_xmp(xml):
+    while xml.find('\n ') > -1:
+        xml = xml.replace('\n ', '\n')
+    return xml.replace('\n','')
+
+def test_normalize_xmp():
+    for xml in [
+        '',
+        '<a/>',
+        '<x>\n <y>\n   <z/>\n </y>\n</x>\n',
+        '\n\n  \n   a \n\tb\r\n c  d\n',
+        '<x>' + ('\n' + ' ' * 50 + '<y>text text</y>') * 1000 + '\n</x>',
+    ]:
+        assert imaging.normalize_xmp(xml) == old_normalize_xmp(xml)
+
+def _jpeg_segment(code, data):
+    return bytes([0xFF, code]) + (len(data) + 2).to_bytes(2, 'big') + data
+
+def _png_chunk(ctype, data):
+    return len(data).to_bytes(4, 'big') + ctype + data + b'\x00' * 4
+
+def _tiff(tags, byteorder='little'):
+    magic = {'little': b'II*\x00', 'big': b'MM\x00*'}[byteorder]
+    ifd = len(tags).to_bytes(2, byteorder)
+    for tag in tags:
+        ifd += tag.to_bytes(2, byteorder) + b'\x00' * 10
+    return magic + (8).to_bytes(4, byteorder) + ifd + b'\x00' * 4
+
+HAS_XMP_FILES = [
+    # filename, data, expected
+    ('noxmp.jpg',
+     b'\xff\xd8' + _jpeg_segment(0xE0, b'JFIF\x00' + b'\x00' * 9)
+     + _jpeg_segment(0xDB, b'\x00' * 65) + _jpeg_segment(0xDA, b'\x00' * 10),
+     False),
+    ('xmp.jpg',
+     b'\xff\xd8' + _jpeg_segment(0xE0, b'JFIF\x00' + b'\x00' * 9)
+     + _jpeg_segment(0xE1, imaging.JPEG_XMP_NS + b'<x:xmpmeta/>')
+     + _jpeg_segment(0xDA, b'\x00' * 10),
+     True),
+    ('exif.jpg',
+     b'\xff\xd8' + _jpeg_segment(0xE1, b'Exif\x00\x00' + b'\x00' * 40)
+     + _jpeg_segment(0xDA, b'\x00' * 10),
+     None),
+    ('truncated.jpg', b'\xff\xd8' + _jpeg_segment(0xE0, b'JFIF')[:3], None),
+    ('noxmp.png',
+     b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', b'\x00' * 13)
+     + _png_chunk(b'IDAT', b'\x00' * 100) + _png_chunk(b'IEND', b''),
+     False),
+    ('xmp.png',
+     b'\x89PNG\r\n\x1a\n' + _png_chunk(b'IHDR', b'\x00' * 13)
+     + _png_chunk(b'iTXt', imaging.PNG_XMP_KEYWORD + b'\x00\x00\x00\x00<x/>')
+     + _png_chunk(b'IEND', b''),
+     True),
+    ('xmp-le.tif', _tiff([256, 257, imaging.TIFF_XMP_TAG]), True),
+    ('xmp-be.tif', _tiff([256, imaging.TIFF_XMP_TAG], 'big'), True),
+    ('noxmp.tif', _tiff([256, 257]), None),
+    ('doc.pdf', b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n', None),
+    ('empty.txt', b'', None),
+]
+
+def test_has_xmp(tmpdir):
+    for filename,data,expected in HAS_XMP_FILES:
+        path = tmpdir / filename
+        path.write_binary(data)
+        assert imaging.has_xmp(str(path)) == expected, filename
+    assert imaging.has_xmp(str(tmpdir / 'missing.jpg')) == None
+    assert imaging.extract_xmp(str(tmpdir / 'noxmp.jpg')) == None
+
+def _tiff_ifd(tags, next_offset, byteorder):
+    # tags: list of (tag, type, value)
+    ifd = len(tags).to_bytes(2, byteorder)
+    for tag,typ,value in tags:
+        size = 2 if typ == 3 else 4
+        ifd += tag.to_bytes(2, byteorder) + typ.to_bytes(2, byteorder) \
+            + (1).to_bytes(4, byteorder) \
+            + value.to_bytes(size, byteorder).ljust(4, b'\x00')
+    return ifd + next_offset.to_bytes(4, byteorder)
+
+def _tiff_pages(sizes, byteorder='little'):
+    magic = {'little': b'II*\x00', 'big': b'MM\x00*'}[byteorder]
+    data = magic + (8).to_bytes(4, byteorder)
+    for n,(width,height) in enumerate(sizes):
+        next_offset = 0
+        if n < len(sizes) - 1:
+            next_offset = len(data) + 2 + 2 * 12 + 4
+        data += _tiff_ifd(
+            [(256, 3, width), (257, 4, height)], next_offset, byteorder
+        )
+    return data
+
+SNIFF_FILES = [
+    # filename, data, (format, width, height, frames, multiframe)
+    ('photo.jpg',
+     b'\xff\xd8' + _jpeg_segment(0xE0, b'JFIF\x00' + b'\x00' * 9)
+     + _jpeg_segment(0xC4, b'\x00' * 20)  # DHT is not SOF
+     + _jpeg_segment(0xC2, b'\x08' + (588).to_bytes(2, 'big')
+                     + (1024).to_bytes(2, 'big') + b'\x01\x01\x11\x00')
+     + _jpeg_segment(0xDA, b'\x00' * 10),
+     ('JPEG', 1024, 588, 1, False)),
+    ('image.png',
+     b'\x89PNG\r\n\x1a\n'
+     + _png_chunk(b'IHDR', (640).to_bytes(4, 'big') + (480).to_bytes(4, 'big')
+                  + b'\x08\x02\x00\x00\x00')
+     + _png_chunk(b'IEND', b''),
+     ('PNG', 640, 480, 1, False)),
+    ('single.tif', _tiff_pages([(5632, 8615)]), ('TIFF', 5632, 8615, 1, False)),
+    ('multi.tif', _tiff_pages([(5632, 8615), (625, 957)], 'big'),
+     ('TIFF', 5632, 8615, 2, True)),
+    ('doc.pdf',
+     b'%PDF-1.4\n1 0 obj\n<< /Type /Catalog /Pages 2 0 R >>\nendobj\n'
+     b'2 0 obj\n<< /Kids [3 0 R 4 0 R 5 0 R] /Count 3 /Type /Pages >>\nendobj\n'
+     b'3 0 obj\n<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] >>\nendobj\n'
+     b'6 0 obj\n<< /Type /Outlines /Count 12 >>\nendobj\n',
+     ('PDF', 612, 792, 3, True)),
+    ('objstm.pdf', b'%PDF-1.5\n%\xe2\xe3\xcf\xd3\n',
+     ('PDF', None, None, None, None)),
+]
+
+def test_sniff(tmpdir):
+    for filename,data,expected in SNIFF_FILES:
+        path = str(tmpdir / filename)
+        with open(path, 'wb') as f:
+            f.write(data)
+        out = imaging.sniff(path)
+        assert out['path'] == path
+        assert out['image'] == True
+        assert (
+            out['format'], out['width'], out['height'],
+            out['frames'], out['multiframe']
+        ) == expected, filename
+    # not recognized: fall back to identify
+    path = tmpdir / 'doc.docx'
+    path.write_binary(b'PK\x03\x04' + b'\x00' * 100)
+    assert imaging.sniff(str(path)) == None
+    path = tmpdir / 'truncated.tif'
+    path.write_binary(b'II*\x00' + (8).to_bytes(4, 'little') + b'\x05\x00')
+    assert imaging.sniff(str(path)) == None
+    assert imaging.sniff(str(tmpdir / 'missing.jpg')) == None
@@ -1,6 +1,7 @@
 import os
 from pathlib import Path
 import shutil
+import time
 import urllib
 
 import git
@@ -122,6 +123,15 @@ def test_checksums(tmpdir, test_base_dir, entity_identifier, test_image):
     assert sha1   == IMG_SHA1
     assert sha256 == IMG_SHA256
 
+def test_copy_checksums(tmpdir, test_base_dir, entity_identifier, test_image):
+    log = util.FileLogger(identifier=entity_identifier, base_dir=test_base_dir)
+    dest_path = str(tmpdir / 'copy_checksums' / 'copy.jpg')
+    md5,sha1,sha256 = ingest.copy_checksums(test_image, dest_path, log)
+    assert md5    == IMG_MD5
+    assert sha1   == IMG_SHA1
+    assert sha256 == IMG_SHA256
+    assert util.file_hash(dest_path, 'sha256') == IMG_SHA256
+
 def test_destination_path(test_base_dir, file_identifier):
     src_path = os.path.join(test_base_dir, 'testfile.tif')
     dest_filename = '%s%s' % (
@@ -216,6 +226,153 @@ def test_make_access_file(test_base_dir, entity_identifier, test_image):
     # get test jpg
     assert ingest.make_access_file(src_path, access_path, log) == access_path
 
+def test_access_pool(tmpdir, monkeypatch):
+    """AccessPool runs jobs concurrently and returns results in order"""
+    running = []
+    most = []
+    def make_access_file(src_path, access_dest_path, log, memory_limit=None,
+                         sha256=None):
+        running.append(src_path)
+        most.append(len(running))
+        log.debug(f'start {os.path.basename(src_path)}')
+        # later jobs finish first
+        time.sleep(0.05 * (5 - int(os.path.basename(src_path))))
+        running.remove(src_path)
+        log.debug(f'end {os.path.basename(src_path)}')
+        assert memory_limit == '256MiB'
+        if src_path.endswith('3'):
+            return None
+        return access_dest_path
+    monkeypatch.setattr(ingest, 'make_access_file', make_access_file)
+    log = util.FileLogger(log_path=str(tmpdir / 'access.log'))
+    with ingest.AccessPool(workers=3, memory_limit='256MiB') as pool:
+        for n in range(5):
+            src = str(tmpdir / str(n))
+            pool.submit(src, src + '-a.jpg', log=log, data=n)
+        results = list(pool.results())
+    assert [data for data,path in results] == [0, 1, 2, 3, 4]
+    assert [path for data,path in results] == [
+        str(tmpdir / '0-a.jpg'), str(tmpdir / '1-a.jpg'), str(tmpdir / '2-a.jpg'),
+        None, str(tmpdir / '4-a.jpg'),
+    ]
+    assert 1 < max(most) <= 3
+    # worker log entries are not interleaved
+    with open(str(tmpdir / 'access.log'), 'r') as f:
+        lines = [line.split()[-2:] for line in f.read().splitlines()]
+    assert lines == [[step, str(n)] for n in range(5) for step in ['start', 'end']]
+
+def test_attach_access_saves_once(tmpdir, monkeypatch):
+    """Files with pooled access files are saved once, when attached"""
+    class FakeFile():
+        collection_path = str(tmpdir)
+        access_abs = None
+        access_rel = None
+        def __init__(self):
+            self.saves = 0
+        def set_access(self, access_path, entity):
+            self.access_abs = access_path
+            self.access_rel = os.path.basename(access_path)
+        def save(self, git_name, git_mail, agent, parent=None, commit=False):
+            self.saves += 1
+            return 0,'ok',[str(tmpdir / 'file.json')]
+    class FakeEntity():
+        collection_path = str(tmpdir)
+    staged = []
+    monkeypatch.setattr(ingest.session, 'active_session', lambda path: None)
+    monkeypatch.setattr(
+        ingest, 'stage_files',
+        lambda entity, git_files, annex_files, log, show_staged: staged.append(
+            (git_files, annex_files)
+        )
+    )
+    log = util.FileLogger(log_path=str(tmpdir / 'access.log'))
+    access_path = tmpdir / 'file-a.jpg'
+    access_path.write('jpg')
+    file_ = FakeFile()
+    ingest.attach_access(file_, FakeEntity(), str(access_path), 'u', 'm', 'a', log)
+    # no access file: File is still saved
+    file2 = FakeFile()
+    ingest.attach_access(file2, FakeEntity(), None, 'u', 'm', 'a', log)
+    assert (file_.saves, file2.saves) == (1, 1)
+    assert staged == [(['file.json'], ['file-a.jpg']), (['file.json'], [])]
+
+def test_ingest_pipeline(tmpdir, monkeypatch):
+    """IngestPipeline prepares rows ahead and returns them in order"""
+    running = []
+    most = []
+    def prepare_file(src_path, rowd, entity, log, tmp_tag=''):
+        running.append(rowd['n'])
+        most.append(len(running))
+        log.debug(f"prepared {rowd['n']}")
+        # later rows finish first
+        time.sleep(0.02 * (6 - rowd['n']))
+        running.remove(rowd['n'])
+        if rowd['n'] == 3:
+            raise Exception('bad file')
+        prepared = ingest.PreparedFile()
+        prepared.log = log
+        prepared.sha1 = str(rowd['n'])
+        prepared.tmp_path = str(tmpdir / f'{rowd["n"]}{tmp_tag}.ingest')
+        Path(prepared.tmp_path).touch()
+        return prepared
+    monkeypatch.setattr(ingest, 'prepare_file', prepare_file)
+    rows = [({'n': n, 'path_abs': str(tmpdir / str(n))}, None) for n in range(6)]
+    log = util.FileLogger(log_path=str(tmpdir / 'addfile.log'))
+    with ingest.IngestPipeline(workers=2, ahead=3) as pipeline:
+        pipeline.feed(rows)
+        for n in range(3):
+            prepared = pipeline.next()
+            assert prepared.sha1 == str(n)
+            assert not prepared.error
+            prepared.log.flush(log)
+            os.remove(prepared.tmp_path)
+        prepared = pipeline.next()
+        assert str(prepared.error) == 'bad file'
+    # log entries are written in row order
+    assert [
+        line.split()[-1] for line in log.log().splitlines()
+    ] == ['0', '1', '2']
+    # unused temp copies were removed
+    assert not list(Path(tmpdir).glob('*.ingest'))
+    assert 1 < max(most) <= 2
+
+class FakeIngestEntity():
+    def __init__(self, path):
+        self.collection_path = path
+        self.files_path = path
+
+def test_prepare_file_duplicate(tmpdir, monkeypatch):
+    """Duplicates are stopped before they are copied, even within one import"""
+    index = ingest.files.HashIndex(str(tmpdir))
+    monkeypatch.setattr(
+        ingest.files, 'hash_index', lambda path, refresh=True: index
+    )
+    monkeypatch.setattr(ingest.imaging, 'extract_xmp', lambda path: None)
+    entity = FakeIngestEntity(str(tmpdir))
+    log = util.BufferedLogger()
+    srcs = []
+    for name in ['one.tif', 'two.tif']:
+        src = tmpdir / name
+        src.write_binary(b'same binary')
+        srcs.append(Path(str(src)))
+    prepared = ingest.prepare_file(srcs[0], {'external': 0}, entity, log)
+    assert os.path.exists(prepared.tmp_path)
+    # same binary later in the import
+    with pytest.raises(ingest.DuplicateFileException):
+        ingest.prepare_file(srcs[1], {'external': 0}, entity, log, '.1')
+    assert not os.path.exists(ingest.ingest_tmp_path(srcs[1], entity, '.1'))
+    # discarded files no longer hold their hashes
+    prepared.discard()
+    assert not os.path.exists(prepared.tmp_path)
+    prepared = ingest.prepare_file(srcs[1], {'external': 0}, entity, log, '.1')
+    assert prepared.sha1 == util.file_hashes(str(srcs[1]))['sha1']
+    prepared.discard()
+    # already in the collection
+    index.hashes[prepared.sha1] = [FILE_ID]
+    with pytest.raises(ingest.DuplicateFileException):
+        ingest.prepare_file(srcs[0], {'external': 0}, entity, log)
+    assert not os.path.exists(ingest.ingest_tmp_path(srcs[0], entity))
+
 def test_write_object_metadata(test_base_dir, entity_identifier):
     obj = identifier.Identifier('ddr-test-123-456-master-abc123', test_base_dir).object()
     tmp_dir = test_base_dir
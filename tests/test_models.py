@@ -645,6 +645,73 @@ def test_entity_to_childrenmeta():
     out = models.entity.entity_to_childrenmeta(CHILDREN_ENTITY)
     assert out == expected
 
+def test_patch_filegroups():
+    # patching files in one at a time in any order matches full regeneration
+    basepath = '/var/www/media/ddr'
+    shuffled = deepcopy(CHILDREN_FILES)
+    random.shuffle(shuffled)
+    file_groups = []
+    for f in shuffled:
+        models.entity._patch_filegroups(
+            file_groups, f.role, f.dict(file_groups=1), basepath
+        )
+    assert file_groups == CHILDREN_FILEGROUPS
+    # patching an existing file replaces its entry and keeps sort order
+    f = deepcopy(CHILDREN_FILES[0])
+    f.label = 'new label'
+    f.sort = 2
+    models.entity._patch_filegroups(
+        file_groups, f.role, f.dict(file_groups=1), basepath
+    )
+    assert [x['id'] for x in file_groups[0]['files']] == [
+        'ddr-testing-123-456-mezzanine-abc123',
+        'ddr-testing-123-456-mezzanine-a1b2c3',
+    ]
+    assert file_groups[0]['files'][1]['label'] == 'new label'
+
+def test_patch_sorted_mixed_children():
+    # patching mixed entity/segment children matches full rewrite
+    basepath = '/var/www/media/ddr'
+    objects = []
+    for oid,sort in [
+            ('ddr-testing-123-456-2', 1), ('ddr-testing-123-456-1', 2),
+            ('ddr-testing-123-789', 4), ('ddr-testing-123-790', 3),
+    ]:
+        o = models.entity.Entity(
+            identifier.Identifier(oid, basepath).path_abs()
+        )
+        o.title = oid
+        o.public = 1
+        o.signature_id = ''
+        o.sort = sort
+        objects.append(o)
+    def full_rewrite():
+        return [
+            models.entity.entity_to_childrenmeta(o)
+            for o in models.entity._sort_children(objects)
+        ]
+    children = []
+    shuffled = list(objects)
+    random.shuffle(shuffled)
+    for o in shuffled:
+        models.entity._patch_sorted(
+            children, models.entity.entity_to_childrenmeta(o), basepath
+        )
+    assert children == full_rewrite()
+    assert [c['id'] for c in children] == [
+        'ddr-testing-123-790', 'ddr-testing-123-789',
+        'ddr-testing-123-456-2', 'ddr-testing-123-456-1',
+    ]
+    # changed sort moves the child; same sort replaces it in place
+    objects[0].sort = 5
+    objects[1].title = 'new title'
+    for o in objects[:2]:
+        models.entity._patch_sorted(
+            children, models.entity.entity_to_childrenmeta(o), basepath
+        )
+    assert children == full_rewrite()
+    assert children[2]['title'] == 'new title'
+
 # TODO File.__init__
 # TODO File.__repr__
 # TODO File.from_identifer
@@ -666,5 +733,273 @@ def test_entity_to_childrenmeta():
 # TODO File.file
 # TODO File.access_filename
 # TODO File.links_incoming
+
+def test_files_presence(tmpdir):
+    base = str(tmpdir)
+    fids = [
+        'ddr-testing-123-456-master-a1b2c3',  # json, binary, access
+        'ddr-testing-123-456-master-abc123',  # json, annex content missing
+        'ddr-testing-123-456-mezzanine-abc123',  # nothing
+    ]
+    files = [
+        models.files.File(identifier.Identifier(fid, base)) for fid in fids
+    ]
+    files_path = os.path.dirname(files[0].path_abs)
+    os.makedirs(files_path)
+    for f in files[:2]:
+        with open(f.identifier.path_abs('json'), 'w') as fp:
+            fp.write('[]')
+    with open(files[0].path_abs, 'w') as fp:
+        fp.write('binary')
+    with open(files[0].access_abs, 'w') as fp:
+        fp.write('access')
+    os.symlink('../../../.git/annex/objects/xx/yy/KEY/KEY', files[1].path_abs)
+    presence = models.files.files_presence(files)
+    for f in files:
+        assert presence[f.id]['json'] == os.path.exists(f.identifier.path_abs('json'))
+        assert presence[f.id]['file'] == f.present()
+        assert presence[f.id]['access'] == f.access_present()
+        assert f.exists(presence) == f.exists()
+    assert presence[files[1].id]['annexed'] == True
+    assert presence[files[0].id]['annexed'] == False
+    # Files not in presence are checked on disk
+    presence = models.files.files_presence(files[1:])
+    assert files[0].present(presence) == True
+    assert files[0].access_present(presence) == True
+    assert files[0].exists(presence) == True
+
 # TODO File.links_outgoing
 # TODO File.links_all
+
+
+# batch_session
+
+class FakeCollection():
+    def __init__(self, path_abs):
+        self.path_abs = path_abs
+
+class FakeParent():
+    def __init__(self, oid, path_abs):
+        self.id = oid
+        self.json_path = os.path.join(path_abs, 'entity.json')
+        self.refreshed = 0
+        self.written = 0
+    def children(self, force_read=False):
+        self.refreshed += 1
+    def write_json(self):
+        self.written += 1
+
+def test_batch_session(tmpdir):
+    cpath = str(tmpdir / 'ddr-testing-123')
+    collection = FakeCollection(cpath)
+    parent = FakeParent('ddr-testing-123-1', os.path.join(cpath, 'files', 'ddr-testing-123-1'))
+    changelog_path = os.path.join(parent.json_path.replace('entity.json', 'changelog'))
+    os.makedirs(os.path.dirname(changelog_path))
+    assert models.session.active_session(cpath) == None
+    with models.batch_session(collection, stage=False) as session:
+        assert models.session.active_session(cpath) == session
+        # nested sessions reuse the outer session
+        with models.batch_session(collection, stage=False) as inner:
+            assert inner == session
+        for n in range(5):
+            session.mark_parent(parent)
+            session.changelog(
+                changelog_path, ['Updated entity file x'], 'user', 'user@x.org', 'agent'
+            )
+        session.add_files(git_files=[os.path.join(cpath, 'collection.json')])
+        assert parent.written == 0
+    assert models.session.active_session(cpath) == None
+    # parent rewritten once, one changelog entry
+    assert parent.refreshed == 1
+    assert parent.written == 1
+    with open(changelog_path, 'r') as f:
+        text = f.read()
+    assert text.count('Updated entity file x') == 1
+    assert text.count('@agent: agent') == 1
+    assert 'collection.json' in session.git_files
+    assert 'files/ddr-testing-123-1/entity.json' in session.git_files
+    # parents are not rewritten if the body fails
+    parent = FakeParent('ddr-testing-123-2', os.path.join(cpath, 'files', 'ddr-testing-123-2'))
+    with pytest.raises(ValueError):
+        with models.batch_session(collection, stage=False) as session:
+            session.mark_parent(parent)
+            raise ValueError('failed import')
+    assert models.session.active_session(cpath) == None
+    assert parent.written == 0
+    assert session.git_files == []
+
+
+# LinksIndex
+
+LINKS_FIXTURE_FILES = {
+    'ddr-test-123-1-master-a1a1a1a1a1': 'ddr-test-123-1-master-b2b2b2b2b2.jpg',
+    'ddr-test-123-1-master-b2b2b2b2b2': 'ddr-test-123-1-master-a1a1a1a1a1.tif; ddr-test-123-1-mezzanine-c3c3c3c3c3.tif',
+    'ddr-test-123-1-mezzanine-c3c3c3c3c3': '',
+    'ddr-test-123-1-mezzanine-d4d4d4d4d4': 'ddr-test-123-1-master-b2b2b2b2b2.jpg;ddr-test-123-1-mezzanine-c3c3c3c3c3.tif',
+    # links that contain a basename without being that file
+    'ddr-test-123-1-mezzanine-e5e5e5e5e5': 'ddr-test-123-1-master-a1a1a1a1a1-a.jpg; files/ddr-test-123-1-mezzanine-c3c3c3c3c3.tif; ddr-test-123-1-mezzanine-c3c3c3c3c3.tif.bak',
+}
+LINKS_FIXTURE_EXTS = {
+    'ddr-test-123-1-master-a1a1a1a1a1': '.tif',
+    'ddr-test-123-1-master-b2b2b2b2b2': '.jpg',
+    'ddr-test-123-1-mezzanine-c3c3c3c3c3': '.tif',
+    'ddr-test-123-1-mezzanine-d4d4d4d4d4': '.pdf',
+    'ddr-test-123-1-mezzanine-e5e5e5e5e5': '.tif',
+}
+
+def _write_links_fixture(files_path, fid, links):
+    data = [
+        {'application': 'https://github.com/densho/ddr-local.git'},
+        {'path_rel': fid + LINKS_FIXTURE_EXTS[fid]},
+        {'sha1': ''},
+        {'links': links},
+    ]
+    with open(os.path.join(files_path, fid + '.json'), 'w') as f:
+        f.write(json.dumps(data))
+
+def _links_incoming_find(entity_files_path, basename):
+    """Previous File.links_incoming implementation, for comparison
+    """
+    incoming = []
+    jsons = []
+    for root, dirs, files in os.walk(entity_files_path):
+        jsons = jsons + [os.path.join(root, f) for f in files if f.endswith('.json')]
+    for filename in jsons:
+        with open(filename, 'r') as f:
+            data = json.loads(f.read())
+        path_rel = None
+        for field in data:
+            if field.get('path_rel',None):
+                path_rel = field['path_rel']
+        for field in data:
+            linksraw = field.get('links', None)
+            if linksraw:
+                for link in linksraw.strip().split(';'):
+                    link = link.strip()
+                    if basename in link:
+                        incoming.append(path_rel)
+    return incoming
+
+def test_links_index(tmpdir, monkeypatch):
+    files_path = str(tmpdir / 'ddr-test-123-1' / 'files')
+    os.makedirs(files_path)
+    for fid,links in LINKS_FIXTURE_FILES.items():
+        _write_links_fixture(files_path, fid, links)
+    index = models.files.links_index(files_path)
+    for fid in LINKS_FIXTURE_FILES.keys():
+        # File.basename has no extension until File.load_json
+        for basename in [fid, fid + LINKS_FIXTURE_EXTS[fid]]:
+            expected = sorted(_links_incoming_find(files_path, basename))
+            assert sorted(index.incoming(basename)) == expected
+    assert sorted(index.incoming('ddr-test-123-1-mezzanine-c3c3c3c3c3.tif')) == [
+        'ddr-test-123-1-master-b2b2b2b2b2.jpg',
+        'ddr-test-123-1-mezzanine-d4d4d4d4d4.pdf',
+        'ddr-test-123-1-mezzanine-e5e5e5e5e5.tif',
+        'ddr-test-123-1-mezzanine-e5e5e5e5e5.tif',
+    ]
+    assert 'ddr-test-123-1-mezzanine-e5e5e5e5e5.tif' in index.incoming(
+        'ddr-test-123-1-master-a1a1a1a1a1'
+    )
+    # change links; index picks up modified file
+    fid = 'ddr-test-123-1-mezzanine-d4d4d4d4d4'
+    _write_links_fixture(files_path, fid, '')
+    index.update(os.path.join(files_path, fid + '.json'))
+    assert sorted(index.incoming('ddr-test-123-1-mezzanine-c3c3c3c3c3.tif')) == [
+        'ddr-test-123-1-master-b2b2b2b2b2.jpg',
+        'ddr-test-123-1-mezzanine-e5e5e5e5e5.tif',
+        'ddr-test-123-1-mezzanine-e5e5e5e5e5.tif',
+    ]
+    # dirs are not walked and files not statted unless files are added or removed
+    walked = []
+    os_walk = os.walk
+    def walk(path):
+        walked.append(path)
+        return os_walk(path)
+    monkeypatch.setattr(models.files.os, 'walk', walk)
+    statted = []
+    link_stat = models.files.LinksIndex._stat
+    def _stat(json_path):
+        statted.append(json_path)
+        return link_stat(json_path)
+    monkeypatch.setattr(models.files.LinksIndex, '_stat', staticmethod(_stat))
+    assert models.files.links_index(files_path) is index
+    assert not index.refresh()
+    assert walked == []
+    assert statted == []
+    os.remove(os.path.join(files_path, 'ddr-test-123-1-master-b2b2b2b2b2.json'))
+    os.utime(files_path, ns=(0, 0))
+    assert index.refresh()
+    assert walked == [files_path]
+    # removed files are dropped
+    index = models.files.links_index(files_path)
+    for fid in LINKS_FIXTURE_FILES.keys():
+        basename = fid + LINKS_FIXTURE_EXTS[fid]
+        expected = sorted(_links_incoming_find(files_path, basename))
+        assert sorted(index.incoming(basename)) == expected
+
+def test_links_indexes_max(tmpdir, monkeypatch):
+    monkeypatch.setattr(models.files, 'LINKS_INDEXES_MAX', 2)
+    monkeypatch.setattr(models.files, '_LINKS_INDEXES', OrderedDict())
+    paths = [str(tmpdir / str(n)) for n in range(3)]
+    for path in paths:
+        os.makedirs(path)
+        models.files.links_index(path)
+    assert list(models.files._LINKS_INDEXES.keys()) == paths[1:]
+
+def _write_hash_fixture(collection_path, fid, sha1, sha256):
+    eid = '-'.join(fid.split('-')[:4])
+    files_path = os.path.join(collection_path, 'files', eid, 'files')
+    os.makedirs(files_path, exist_ok=True)
+    data = [
+        {'application': 'https://github.com/densho/ddr-cmdln.git'},
+        {'id': fid},
+        {'sha1': sha1},
+        {'sha256': sha256},
+    ]
+    json_path = os.path.join(files_path, fid + '.json')
+    with open(json_path, 'w') as f:
+        f.write(json.dumps(data))
+    return json_path
+
+def test_hash_index(tmpdir):
+    collection_path = str(tmpdir / 'ddr-test-123')
+    fid1 = 'ddr-test-123-1-master-a1a1a1a1a1'
+    fid2 = 'ddr-test-123-2-master-b2b2b2b2b2'
+    _write_hash_fixture(collection_path, fid1, 'a1'*20, 'a1'*32)
+    path2 = _write_hash_fixture(collection_path, fid2, 'b2'*20, 'b2'*32)
+    os.makedirs(os.path.join(collection_path, '.git'))
+    index = models.files.hash_index(collection_path)
+    assert index.lookup(sha1='a1'*20) == [fid1]
+    assert index.lookup(sha256='b2'*32) == [fid2]
+    assert index.lookup(sha1='c3'*20, sha256='c3'*32) == []
+    # saved outside the working tree
+    assert os.path.exists(
+        os.path.join(collection_path, '.git', models.files.HASH_INDEX_FILENAME)
+    )
+    assert not os.path.exists(
+        os.path.join(collection_path, models.files.HASH_INDEX_FILENAME)
+    )
+    # same binary under another entity
+    fid3 = 'ddr-test-123-3-master-a1a1a1a1a1'
+    path3 = _write_hash_fixture(collection_path, fid3, 'a1'*20, 'a1'*32)
+    index.update(path3)
+    assert index.lookup(sha1='a1'*20) == [fid1, fid3]
+    # saved index is reused; removed files are dropped
+    models.files.save_hash_indexes()
+    os.remove(path2)
+    index = models.files.HashIndex(collection_path)
+    index.load()
+    assert index.lookup(sha1='b2'*20) == [fid2]
+    assert index.refresh()
+    assert index.lookup(sha1='b2'*20) == []
+    assert index.lookup(sha256='a1'*32) == [fid1, fid3]
+    # binaries being ingested are reserved until saved or released
+    assert index.reserve('c3'*20, 'c3'*32, '/tmp/c3.tif') == []
+    assert index.reserve(None, 'c3'*32, '/tmp/c3-copy.tif') == ['/tmp/c3.tif']
+    assert index.reserve('a1'*20, None, '/tmp/a1.tif') == [fid1, fid3]
+    index.release('c3'*20, 'c3'*32)
+    assert index.reserve('c3'*20, 'c3'*32, '/tmp/c3-copy.tif') == []
+    fid4 = 'ddr-test-123-4-master-c3c3c3c3c3'
+    index.update(_write_hash_fixture(collection_path, fid4, 'c3'*20, 'c3'*32))
+    assert index.reserved == {}
+    assert index.reserve('c3'*20, 'c3'*32, '/tmp/c3.tif') == [fid4]
@@ -1,4 +1,5 @@
 from datetime import datetime
+import hashlib
 import os
 import shutil
 
@@ -110,6 +111,92 @@ def test_file_hash(tmpdir):
     assert util.file_hash(path, 'md5') == md5
     os.remove(path)
 
+def test_file_hashes(tmpdir):
+    path = str(tmpdir / 'test-hashes')
+    text = 'hash'
+    with open(path, 'w') as f:
+        f.write(text)
+    assert util.file_hashes(path) == {
+        'md5': '0800fc577294c34e0b28ad2839435945',
+        'sha1': '2346ad27d7568ba9896f1b7da6b5991251debdf2',
+        'sha256': 'd04b98f48e8f8bcc15c6ae5ac050801cd6dcfd428fb5f9e65c4e16e7807340fa',
+    }
+    # file spanning several blocks, last block partial
+    data = os.urandom(10000)
+    with open(path, 'wb') as f:
+        f.write(data)
+    out = util.file_hashes(path, ['sha1', 'sha256'], block_size=4096)
+    assert out['sha1'] == hashlib.sha1(data).hexdigest()
+    assert out['sha256'] == hashlib.sha256(data).hexdigest()
+
+def test_copy_file_hashes(tmpdir):
+    src_path = str(tmpdir / 'test-copy-src')
+    dest_path = str(tmpdir / 'test-copy-dest')
+    data = os.urandom(10000)
+    with open(src_path, 'wb') as f:
+        f.write(data)
+    method,hashes = util.copy_file_hashes(
+        src_path, dest_path, ['md5', 'sha256'], block_size=4096
+    )
+    assert method in ['copy', 'reflink']
+    assert hashes == {
+        'md5': hashlib.md5(data).hexdigest(),
+        'sha256': hashlib.sha256(data).hexdigest(),
+    }
+    with open(dest_path, 'rb') as f:
+        assert f.read() == data
+    # same filesystem: hard link if allowed
+    method,hashes = util.copy_file_hashes(
+        src_path, dest_path, ['md5'], hardlink=True
+    )
+    assert method in ['hardlink', 'reflink']
+    assert hashes == {'md5': hashlib.md5(data).hexdigest()}
+    if method == 'hardlink':
+        assert os.path.samefile(src_path, dest_path)
+    # copying over a hard link must not truncate the source
+    method,hashes = util.copy_file_hashes(src_path, dest_path, ['md5'])
+    assert not os.path.samefile(src_path, dest_path)
+    with open(src_path, 'rb') as f:
+        assert f.read() == data
+    with open(dest_path, 'rb') as f:
+        assert f.read() == data
+
+def test_copy_file(tmpdir):
+    src_path = str(tmpdir / 'test-copy-src')
+    dest_path = str(tmpdir / 'test-copy-dest')
+    with open(src_path, 'wb') as f:
+        f.write(b'test_copy_file')
+    assert util.same_device(src_path, dest_path)
+    assert util.copy_file(src_path, dest_path) in ['copy', 'reflink']
+    assert not os.path.samefile(src_path, dest_path)
+    assert util.copy_file(src_path, dest_path, hardlink=True) \
+        in ['hardlink', 'reflink']
+    with open(dest_path, 'rb') as f:
+        assert f.read() == b'test_copy_file'
+
+def test_clone_file_reflink_support(tmpdir, monkeypatch):
+    src_path = str(tmpdir / 'test-clone-src')
+    with open(src_path, 'wb') as f:
+        f.write(b'test_clone_file')
+    tried = []
+    def reflink(src_fd, dest_fd):
+        tried.append(dest_fd)
+        return False
+    monkeypatch.setattr(util, 'reflink', reflink)
+    monkeypatch.setattr(util, 'REFLINK_DEVICES', {})
+    # unsupported filesystem is only tried once
+    for n in range(3):
+        dest_path = str(tmpdir / f'test-clone-dest{n}')
+        assert util.clone_file(src_path, dest_path) == None
+        assert not os.path.exists(dest_path)
+    assert len(tried) == 1
+    assert util.REFLINK_DEVICES == {os.stat(src_path).st_dev: False}
+    assert util.clone_file(src_path, dest_path, hardlink=True) == 'hardlink'
+    # other filesystems are not tried at all
+    monkeypatch.setattr(util, 'same_device', lambda src, dest: False)
+    assert util.clone_file(src_path, str(tmpdir / 'other'), hardlink=True) == None
+    assert len(tried) == 1
+
 def test_normalize_text():
     assert util.normalize_text('  this is a test') == 'this is a test'
     assert util.normalize_text('this is a test  ') == 'this is a test'